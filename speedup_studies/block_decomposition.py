@@ -0,0 +1,164 @@
+import numpy as np
+import os
+from time import perf_counter
+import json
+
+# Compares the input of the global merge for slabs and blocks with the same
+# number of pseudo parallel tasks, e.g. python block_decomposition.py --run 1
+
+
+def parse_args():
+    import argparse
+
+    def cast_to_bool(me):
+        return False if me in ["False", "0", 0] else True
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--engine",
+        type=str,
+        help="choose the engine for merging",
+        default="numba",
+        choices=["python", "numba"],
+    )
+    parser.add_argument(
+        "--ntasks",
+        type=int,
+        nargs="+",
+        help="numbers of pseudo parallel tasks",
+        default=[1, 2, 4, 8, 16, 32],
+    )
+    parser.add_argument(
+        "--res", type=int, help="resolution of the noisy 3D test data", default=48
+    )
+    parser.add_argument(
+        "--noise", type=float, help="amplitude of the noise", default=0.05
+    )
+    parser.add_argument("--plot", type=cast_to_bool, help="plot results", default=False)
+    parser.add_argument(
+        "--run", type=cast_to_bool, help="run experiment", default=False
+    )
+
+    return vars(parser.parse_args())
+
+
+def get_data(res, noise, n_peaks=8, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, res)
+    X = np.stack(np.meshgrid(x, x, x, indexing="ij"), axis=-1)
+
+    data = np.zeros((res,) * 3)
+    for peak, height in zip(rng.random((n_peaks, 3)), 0.5 + 0.5 * rng.random(n_peaks)):
+        data += height * np.exp(-np.sum((X - peak) ** 2, axis=-1) / 0.02)
+    return data + noise * rng.random(data.shape)
+
+
+def get_filename(args):
+    base_path = __file__[: __file__.index(os.path.basename(__file__))]
+    return f"{base_path}/timing_data/block_decomposition.json"
+
+
+def get_timing_data(args):
+    filename = get_filename(args)
+    try:
+        with open(filename, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_timing_data(args, data):
+    filename = get_filename(args)
+    with open(filename, "w") as file:
+        json.dump(data, file, indent=4)
+
+
+def run_experiment():
+    from dendro.distributed_dendrogram_v3 import DistributedDendrogramV3
+    from dendro.decomposition import BlockDecomposition
+
+    args = parse_args()
+    data = get_data(args["res"], args["noise"])
+
+    timing_data = get_timing_data(args)
+
+    # compile the kernels before timing
+    DistributedDendrogramV3.compute_pseudo_parallel(
+        get_data(8, args["noise"]), 2, engine=args["engine"]
+    )
+
+    for layout in ["slab", "block"]:
+        timing_data[layout] = {}
+        for ntasks in args["ntasks"]:
+            if layout == "slab":
+                grid = None
+                blocks = BlockDecomposition.slab(data.shape, ntasks, axis=0)
+            else:
+                grid = (0,) * data.ndim
+                blocks = BlockDecomposition(data.shape, ntasks, grid)
+
+            t0 = perf_counter()
+            dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(
+                data,
+                ntasks,
+                engine=args["engine"],
+                communication="boundary",
+                grid=grid,
+                instrument=True,
+            )
+            t1 = perf_counter()
+
+            stats = dendrogram.statistics
+            sent = stats.get("sent_boundary_pixels", 0) + stats.get(
+                "sent_rim_pixels", 0
+            )
+            timing_data[layout][str(ntasks)] = {
+                "grid": list(blocks.dims),
+                "time": t1 - t0,
+                "time_merge": stats["time_merge"],
+                "face_pixels": blocks.count_face_pixels(),
+                "merged_pixels": int(sent),
+                "iterations": stats["iterations"],
+            }
+            print(
+                f"{layout} {blocks.dims}: merged {sent} / {data.size} pixels in {stats['time_merge']:.2e}s with {stats['iterations']} iterations"
+            )
+
+    write_timing_data(args, timing_data)
+
+
+def plot():
+    import matplotlib.pyplot as plt
+
+    args = parse_args()
+    timing_data = get_timing_data(args)
+
+    fig, axs = plt.subplots(1, 3, figsize=(12, 4))
+
+    for layout, timings in timing_data.items():
+        ntasks = np.array([int(me) for me in timings.keys()])
+        for ax, key in zip(axs, ["face_pixels", "merged_pixels", "time_merge"]):
+            ax.plot(
+                ntasks, [me[key] for me in timings.values()], marker="x", label=layout
+            )
+
+    axs[0].set_ylabel("pixels on faces")
+    axs[1].set_ylabel("merged pixels")
+    axs[2].set_ylabel(r"$t_\text{merge} / s$")
+    for ax in axs:
+        ax.set_xlabel("tasks")
+        ax.set_xscale("log", base=2)
+        ax.legend(frameon=False)
+    fig.tight_layout()
+
+    fig.savefig(f"{get_filename(args)[:-5]}.png", bbox_inches="tight", dpi=300)
+    plt.show()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args["run"]:
+        run_experiment()
+
+    if args["plot"]:
+        plot()
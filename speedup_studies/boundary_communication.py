@@ -0,0 +1,146 @@
+import numpy as np
+import os
+from time import perf_counter
+import json
+
+
+def parse_args():
+    import argparse
+
+    def cast_to_bool(me):
+        return False if me in ["False", "0", 0] else True
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--engine",
+        type=str,
+        help="choose the engine for merging",
+        default="python",
+        choices=["python", "numba"],
+    )
+    parser.add_argument(
+        "--ntasks",
+        type=int,
+        nargs="+",
+        help="numbers of pseudo parallel tasks",
+        default=[1, 2, 4, 8],
+    )
+    parser.add_argument(
+        "--res", type=int, help="resolution of the noisy 2D test data", default=128
+    )
+    parser.add_argument(
+        "--noise", type=float, help="amplitude of the noise", default=0.05
+    )
+    parser.add_argument("--plot", type=cast_to_bool, help="plot results", default=False)
+    parser.add_argument(
+        "--run", type=cast_to_bool, help="run experiment", default=False
+    )
+
+    return vars(parser.parse_args())
+
+
+def get_data(res, noise, seed=0):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(res)
+    rng = np.random.default_rng(seed)
+    return data.numpy() + noise * rng.random(data.shape)
+
+
+def get_filename(args):
+    base_path = __file__[: __file__.index(os.path.basename(__file__))]
+    return f"{base_path}/timing_data/boundary_communication.json"
+
+
+def get_timing_data(args):
+    filename = get_filename(args)
+    try:
+        with open(filename, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_timing_data(args, data):
+    filename = get_filename(args)
+    with open(filename, "w") as file:
+        json.dump(data, file, indent=4)
+
+
+def run_experiment():
+    from dendro.distributed_dendrogram_v3 import DistributedDendrogramV3
+
+    args = parse_args()
+    data = get_data(args["res"], args["noise"])
+
+    timing_data = get_timing_data(args)
+
+    # compile the kernels before timing
+    DistributedDendrogramV3.compute_pseudo_parallel(
+        get_data(16, args["noise"]), 2, engine=args["engine"]
+    )
+
+    for communication in ["all", "boundary"]:
+        timing_data[communication] = {}
+        for ntasks in args["ntasks"]:
+            t0 = perf_counter()
+            dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(
+                data,
+                ntasks,
+                engine=args["engine"],
+                communication=communication,
+                instrument=True,
+            )
+            t1 = perf_counter()
+
+            stats = dendrogram.statistics
+            sent = stats.get("sent_boundary_pixels", data.size) + stats.get(
+                "sent_rim_pixels", 0
+            )
+            timing_data[communication][str(ntasks)] = {
+                "time": t1 - t0,
+                "time_merge": stats["time_merge"],
+                "sent_pixels": int(sent),
+                "iterations": stats["iterations"],
+            }
+            print(
+                f"{communication}: {ntasks} tasks sent {sent} / {data.size} pixels and merged in {stats['time_merge']:.2e}s with {stats['iterations']} iterations"
+            )
+
+    write_timing_data(args, timing_data)
+
+
+def plot():
+    import matplotlib.pyplot as plt
+
+    args = parse_args()
+    timing_data = get_timing_data(args)
+
+    fig, axs = plt.subplots(1, 2, figsize=(9, 4))
+
+    for communication, timings in timing_data.items():
+        ntasks = np.array([int(me) for me in timings.keys()])
+        sent = np.array([me["sent_pixels"] for me in timings.values()])
+        times = np.array([me["time_merge"] for me in timings.values()])
+        axs[0].plot(ntasks, sent, marker="x", label=communication)
+        axs[1].plot(ntasks, times, marker="x", label=communication)
+
+    axs[0].set_ylabel("communicated pixels")
+    axs[1].set_ylabel(r"$t_\text{merge} / s$")
+    for ax in axs:
+        ax.set_xlabel("tasks")
+        ax.set_xscale("log", base=2)
+        ax.legend(frameon=False)
+    fig.tight_layout()
+
+    fig.savefig(f"{get_filename(args)[:-5]}.png", bbox_inches="tight", dpi=300)
+    plt.show()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args["run"]:
+        run_experiment()
+
+    if args["plot"]:
+        plot()
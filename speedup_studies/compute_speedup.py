@@ -38,6 +38,26 @@ def parse_args():
     parser.add_argument(
         "--logging", type=cast_to_bool, help="print dendrogram logs", default=False
     )
+    parser.add_argument(
+        "--communication",
+        type=str,
+        help="communication of the local structures (v3 only)",
+        default="all",
+        choices=["all", "boundary", "summary", "tree"],
+    )
+    parser.add_argument(
+        "--local_engine",
+        type=str,
+        help="engine for the local dendrograms (v3 only)",
+        default="astrodendro",
+        choices=["astrodendro", "numba"],
+    )
+    parser.add_argument(
+        "--balance",
+        type=cast_to_bool,
+        help="repartition by the number of valid voxels (v3 only)",
+        default=False,
+    )
 
     return vars(parser.parse_args())
 
@@ -114,6 +134,11 @@ def compute_dendrogram(args, dendrogram_args):
             from dendro.distributed_dendrogram_v3 import (
                 DistributedDendrogramV3 as Dendrogram,
             )
+
+            dendrogram_args["balance"] = args["balance"]
+            dendrogram_args["local_engine"] = args["local_engine"]
+            dendrogram_args["communication"] = args["communication"]
+            dendrogram_args["instrument"] = True
         else:
             raise NotImplementedError
 
@@ -123,6 +148,17 @@ def compute_dendrogram(args, dendrogram_args):
     return Dendrogram.compute(**dendrogram_args)
 
 
+def get_label(args):
+    label = args["version"]
+    if args["balance"]:
+        label = f"{label}-balanced"
+    if args["version"] == "v3" and args["local_engine"] != "astrodendro":
+        label = f"{label}-{args['local_engine']}"
+    if args["version"] == "v3" and args["communication"] != "all":
+        label = f"{label}-{args['communication']}"
+    return label
+
+
 def get_filename(args):
     base_path = __file__[: __file__.index(os.path.basename(__file__))]
     return f"{base_path}/timing_data/{args['example']}.json"
@@ -143,6 +179,45 @@ def write_data(args, data):
         json.dump(data, file, indent=4)
 
 
+def get_communication_volume(d):
+    """
+    Pixels sent by all ranks, pixels pulled by every rank for splits,
+    pixels held by the merge on every rank and the peak memory of the ranks.
+    """
+    import resource
+
+    stats = getattr(d, "statistics", {})
+    sent = sum(
+        stats.get(me, 0)
+        for me in ["sent_pixels", "sent_boundary_pixels", "sent_rim_pixels"]
+    )
+    sent = ht.comm.allreduce(sent)
+    merge_pixels = stats.get("merge_pixels", sent)
+    bytes_per_pixel = 8 * (d.data.ndim + 1)
+    return {
+        "sent_pixels": sent,
+        "fetched_pixels": stats.get("fetched_pixels", 0),
+        "merge_pixels": merge_pixels,
+        "merge_bytes": merge_pixels * bytes_per_pixel,
+        # maximum resident set size in KiB on Linux
+        "max_rss": ht.comm.allreduce(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, op=ht.MPI.MAX
+        ),
+    }
+
+
+def write_communication_volume(args, volume):
+    filename = f"{get_filename(args)[:-5]}-communication.json"
+    try:
+        with open(filename, "r") as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        data = {}
+    data.setdefault(get_label(args), {})[str(ht.comm.size)] = volume
+    with open(filename, "w") as file:
+        json.dump(data, file, indent=4)
+
+
 def run_experiment():
     args = parse_args()
     if args["logging"]:
@@ -160,15 +235,28 @@ def run_experiment():
     _print(
         f"Finished {args['version']} {args['example']} on {ht.comm.size} tasks in {elapsed_time:.2e}s"
     )
+    if getattr(d, "load_balance", None) is not None:
+        _print(
+            f"Load imbalance {d.load_balance['imbalance_before']:.2f} before and {d.load_balance['imbalance_after']:.2f} after repartitioning"
+        )
+
+    if args["version"] == "v3":
+        volume = get_communication_volume(d)
+        _print(
+            f"Sent {volume['sent_pixels']} pixels, pulled {volume['fetched_pixels']} pixels for splits and merged {volume['merge_bytes'] / 2**20:.1f} MiB of pixels on every rank with a peak memory of {volume['max_rss'] / 2**10:.1f} MiB"
+        )
+        if ht.comm.rank == 0:
+            write_communication_volume(args, volume)
 
+    label = get_label(args)
     timing_data = get_data(args)
-    if args["version"] not in timing_data.keys():
-        timing_data[args["version"]] = {}
-    timing_data[args["version"]][str(ht.comm.size)] = elapsed_time
+    if label not in timing_data.keys():
+        timing_data[label] = {}
+    timing_data[label][str(ht.comm.size)] = elapsed_time
     write_data(args, timing_data)
 
     if ht.comm.rank == 0:
-        dendrogram_path = f"{get_filename(args)[:-5]}-dendrogram-{args['version']}-{ht.comm.size}tasks.fits"
+        dendrogram_path = f"{get_filename(args)[:-5]}-dendrogram-{get_label(args)}-{ht.comm.size}tasks.fits"
         d.save_to(dendrogram_path, format="fits")
         print(f"Saved dendrogram to {dendrogram_path!r}.")
 
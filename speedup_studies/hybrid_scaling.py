@@ -0,0 +1,156 @@
+import numpy as np
+import os
+import heat as ht
+from time import perf_counter
+import json
+
+# Times ranks x threads combinations of the local phase, e.g.
+#   for n in 1 2 4 8; do mpirun -n $n python hybrid_scaling.py --run 1 --threads 1 2 4 8; done
+#   python hybrid_scaling.py --plot 1
+# Threads use the numba local engine, which releases the GIL.
+
+
+def _print(*args):
+    if ht.comm.rank == 0:
+        print(*args, flush=True)
+
+
+def parse_args():
+    import argparse
+
+    def cast_to_bool(me):
+        return False if me in ["False", "0", 0] else True
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--threads",
+        type=int,
+        nargs="+",
+        help="numbers of threads per rank for the local dendrograms",
+        default=[1, 2, 4, 8],
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        help="choose the engine for merging",
+        default="numba",
+        choices=["python", "numba"],
+    )
+    parser.add_argument(
+        "--res", type=int, help="resolution of the noisy 2D test data", default=1024
+    )
+    parser.add_argument(
+        "--noise", type=float, help="amplitude of the noise", default=0.05
+    )
+    parser.add_argument("--plot", type=cast_to_bool, help="plot results", default=False)
+    parser.add_argument(
+        "--run", type=cast_to_bool, help="run experiment", default=False
+    )
+
+    return vars(parser.parse_args())
+
+
+def get_data(res, noise, seed=0):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(res)
+    rng = np.random.default_rng(seed)
+    return ht.array(data.numpy() + noise * rng.random(data.shape), split=0)
+
+
+def get_filename(args):
+    base_path = __file__[: __file__.index(os.path.basename(__file__))]
+    return f"{base_path}/timing_data/hybrid_scaling.json"
+
+
+def get_timing_data(args):
+    filename = get_filename(args)
+    try:
+        with open(filename, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_timing_data(args, data):
+    filename = get_filename(args)
+    with open(filename, "w") as file:
+        json.dump(data, file, indent=4)
+
+
+def compute_dendrogram(args, data, threads):
+    from dendro.distributed_dendrogram_v3 import DistributedDendrogramV3
+
+    return DistributedDendrogramV3.compute(
+        data,
+        engine=args["engine"],
+        local_engine="numba",
+        threads=threads,
+    )
+
+
+def run_experiment():
+    args = parse_args()
+
+    # compile the kernels before timing
+    compute_dendrogram(args, get_data(16, args["noise"]), 2)
+
+    data = get_data(args["res"], args["noise"])
+
+    timing_data = get_timing_data(args)
+    for threads in args["threads"]:
+        ht.comm.Barrier()
+        t0 = perf_counter()
+        dendrogram = compute_dendrogram(args, data, threads)
+        t1 = perf_counter()
+
+        # the slowest rank determines the time to solution
+        elapsed_time = ht.comm.allreduce(t1 - t0, op=ht.MPI.MAX)
+        local_time = ht.comm.allreduce(dendrogram.time_local_dendrogram, op=ht.MPI.MAX)
+        _print(
+            f"{ht.comm.size} tasks x {threads} threads in {elapsed_time:.2e}s, of which {local_time:.2e}s for the local dendrograms"
+        )
+
+        if ht.comm.rank == 0:
+            timing_data.setdefault(str(ht.comm.size), {})[str(threads)] = {
+                "time": elapsed_time,
+                "time_local_dendrogram": local_time,
+            }
+
+    if ht.comm.rank == 0:
+        write_timing_data(args, timing_data)
+
+
+def plot():
+    import matplotlib.pyplot as plt
+
+    args = parse_args()
+    timing_data = get_timing_data(args)
+
+    fig, axs = plt.subplots(1, 2, figsize=(10, 4), sharey=True)
+    for ntasks, timings in sorted(timing_data.items(), key=lambda me: int(me[0])):
+        threads = np.array([int(me) for me in timings.keys()])
+        idx = np.argsort(threads)
+        cores = int(ntasks) * threads[idx]
+        for ax, key in zip(axs, ["time", "time_local_dendrogram"]):
+            times = np.array([me[key] for me in timings.values()])[idx]
+            ax.loglog(cores, times, marker="x", label=f"{ntasks} tasks")
+
+    for ax, title in zip(axs, ["total", "local dendrograms"]):
+        ax.set_xscale("log", base=2)
+        ax.set_xlabel(r"$N_\text{procs} \times N_\text{threads}$")
+        ax.set_title(title)
+    axs[0].set_ylabel(r"$t / s$")
+    axs[0].legend(frameon=False)
+
+    fig.savefig(f"{get_filename(args)[:-5]}.png", bbox_inches="tight", dpi=300)
+    plt.show()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args["run"]:
+        run_experiment()
+
+    if args["plot"]:
+        plot()
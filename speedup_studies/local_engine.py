@@ -0,0 +1,155 @@
+import numpy as np
+import os
+from time import perf_counter
+import json
+
+# Compares astrodendro to the numba engine for a single local dendrogram, e.g.
+#   python local_engine.py --run 1 --res 32 64 128
+#   python local_engine.py --run 1 --example OGHRES
+#   python local_engine.py --run 1 --example PerA
+# The OGHRES cube is expected in ../data and the PerA image in the docs of an
+# astrodendro source checkout.
+
+
+def parse_args():
+    import argparse
+
+    def cast_to_bool(me):
+        return False if me in ["False", "0", 0] else True
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--example",
+        type=str,
+        help="noisy cubes, the OGHRES cube or the PerA image",
+        default="noise",
+        choices=["noise", "OGHRES", "PerA"],
+    )
+    parser.add_argument(
+        "--res",
+        type=int,
+        nargs="+",
+        help="resolutions of the noisy cubes",
+        default=[32, 64, 128],
+    )
+    parser.add_argument(
+        "--fraction",
+        type=float,
+        help="fraction of masked voxels in the noisy cubes",
+        default=0.5,
+    )
+    parser.add_argument("--plot", type=cast_to_bool, help="plot results", default=False)
+    parser.add_argument(
+        "--run", type=cast_to_bool, help="run experiment", default=False
+    )
+
+    return vars(parser.parse_args())
+
+
+def get_noisy_cube(res, fraction, seed=0):
+    # smoothed noise with a threshold, which looks a bit like a masked PPV cube
+    from scipy.ndimage import gaussian_filter
+
+    rng = np.random.default_rng(seed)
+    data = gaussian_filter(rng.normal(size=(res,) * 3), 2)
+    data[data < np.quantile(data, fraction)] = np.nan
+    return {"data": data, "min_value": 0, "min_delta": 0.01, "min_npix": 10}
+
+
+def get_PerA_image():
+    # same image and parameters as examples/speedup.py
+    import astrodendro
+    from astropy.io.fits import getdata
+
+    data = getdata(f"{astrodendro.__file__[:-24]}/docs/PerA_Extn2MASS_F_Gal.fits")
+    return {"data": np.array(data, dtype=float), "min_value": 2.0, "min_delta": 1.0}
+
+
+def get_examples(args):
+    if args["example"] == "PerA":
+        return {"PerA": get_PerA_image()}
+    if args["example"] == "OGHRES":
+        from compute_speedup import get_dendrogram_args
+
+        return {"OGHRES": get_dendrogram_args(args)}
+    return {str(res): get_noisy_cube(res, args["fraction"]) for res in args["res"]}
+
+
+def get_filename(args):
+    base_path = __file__[: __file__.index(os.path.basename(__file__))]
+    return f"{base_path}/timing_data/local_engine-{args['example']}.json"
+
+
+def get_timing_data(args):
+    filename = get_filename(args)
+    try:
+        with open(filename, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_timing_data(args, data):
+    filename = get_filename(args)
+    with open(filename, "w") as file:
+        json.dump(data, file, indent=4)
+
+
+def run_experiment():
+    from astrodendro import Dendrogram
+    from dendro.local_dendrogram import compute_local_dendrogram
+
+    args = parse_args()
+
+    # compile the kernel outside of the measurement
+    compute_local_dendrogram(np.random.default_rng(0).random((4, 4, 4)))
+
+    timing_data = {"astrodendro": {}, "numba": {}}
+    for label, dendrogram_args in get_examples(args).items():
+        pixels = int(np.sum(np.isfinite(dendrogram_args["data"])))
+        for engine, compute in zip(
+            timing_data.keys(), [Dendrogram.compute, compute_local_dendrogram]
+        ):
+            t0 = perf_counter()
+            dendrogram = compute(**dendrogram_args)
+            t1 = perf_counter()
+
+            timing_data[engine][label] = {
+                "time": t1 - t0,
+                "pixels": pixels,
+                "structures": len(dendrogram),
+            }
+            print(
+                f"{engine}: {len(dendrogram)} structures from {pixels} pixels in {t1 - t0:.2e}s"
+            )
+
+    write_timing_data(args, timing_data)
+
+
+def plot():
+    import matplotlib.pyplot as plt
+
+    args = parse_args()
+    timing_data = get_timing_data(args)
+
+    fig, ax = plt.subplots()
+    for engine, timings in timing_data.items():
+        pixels = np.array([me["pixels"] for me in timings.values()])
+        times = np.array([me["time"] for me in timings.values()])
+        ax.loglog(pixels, times, marker="x", label=engine)
+
+    ax.set_xlabel("pixels")
+    ax.set_ylabel(r"$t / s$")
+    ax.legend(frameon=False)
+
+    fig.savefig(f"{get_filename(args)[:-5]}.png", bbox_inches="tight", dpi=300)
+    plt.show()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args["run"]:
+        run_experiment()
+
+    if args["plot"]:
+        plot()
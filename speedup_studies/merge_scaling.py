@@ -0,0 +1,220 @@
+import numpy as np
+import os
+from time import perf_counter
+import json
+import tracemalloc
+
+
+def parse_args():
+    import argparse
+
+    def cast_to_bool(me):
+        return False if me in ["False", "0", 0] else True
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--version",
+        type=str,
+        help="choose a dendrogram version",
+        default="v3",
+        choices=["v2", "v3", "v4"],
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        help="choose the engine for merging with v3",
+        default="python",
+        choices=["python", "numba"],
+    )
+    parser.add_argument(
+        "--ntasks", type=int, help="number of pseudo parallel tasks", default=4
+    )
+    parser.add_argument(
+        "--resolutions",
+        type=int,
+        nargs="+",
+        help="resolutions of the noisy 2D test data",
+        default=[32, 64, 128, 256],
+    )
+    parser.add_argument(
+        "--noise", type=float, help="amplitude of the noise", default=0.05
+    )
+    parser.add_argument(
+        "--memory",
+        type=cast_to_bool,
+        help="record peak memory during the merge",
+        default=False,
+    )
+    parser.add_argument("--plot", type=cast_to_bool, help="plot results", default=False)
+    parser.add_argument(
+        "--run", type=cast_to_bool, help="run experiment", default=False
+    )
+
+    return vars(parser.parse_args())
+
+
+def get_dendrogram_class(args):
+    if args["version"] == "v2":
+        from dendro.distributed_dendrogram_v2 import (
+            DistributedDendrogramV2 as Dendrogram,
+        )
+    elif args["version"] == "v3":
+        from dendro.distributed_dendrogram_v3 import (
+            DistributedDendrogramV3 as Dendrogram,
+        )
+    elif args["version"] == "v4":
+        from dendro.distributed_dendrogram_v4 import (
+            DistributedDendrogramV4 as Dendrogram,
+        )
+    else:
+        raise NotImplementedError
+    return Dendrogram
+
+
+def get_data(res, noise, seed=0):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(res)
+    rng = np.random.default_rng(seed)
+    return data.numpy() + noise * rng.random(data.shape)
+
+
+def get_filename(args):
+    base_path = __file__[: __file__.index(os.path.basename(__file__))]
+    return f"{base_path}/timing_data/merge_scaling.json"
+
+
+def get_timing_data(args):
+    filename = get_filename(args)
+    try:
+        with open(filename, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_timing_data(args, data):
+    filename = get_filename(args)
+    with open(filename, "w") as file:
+        json.dump(data, file, indent=4)
+
+
+def get_structures(Dendrogram, data, ntasks):
+    local_dendrograms = Dendrogram.compute_local_dendrogram_pseudo_parallel(
+        data, ntasks
+    )
+    structures = []
+    for d in local_dendrograms:
+        offset = len(structures)
+        for structure in d.all_structures:
+            structure.idx += offset
+            structures.append(structure)
+    return structures
+
+
+def get_label(args):
+    if args["engine"] == "python":
+        return args["version"]
+    return f"{args['version']}-{args['engine']}"
+
+
+def get_dendrogram(Dendrogram, data, args):
+    self = Dendrogram()
+    self.data = data
+    self.engine = args["engine"]
+    return self
+
+
+def run_experiment():
+    args = parse_args()
+    Dendrogram = get_dendrogram_class(args)
+    label = get_label(args)
+
+    timing_data = get_timing_data(args)
+    timing_data[label] = {}
+
+    # compile the kernels before timing
+    data = get_data(16, args["noise"])
+    get_dendrogram(Dendrogram, data, args).compute_from_structures(
+        get_structures(Dendrogram, data, args["ntasks"])
+    )
+
+    for res in args["resolutions"]:
+        data = get_data(res, args["noise"])
+
+        # compute the local dendrograms as input to the merge
+        structures = get_structures(Dendrogram, data, args["ntasks"])
+        M = len(structures)
+
+        self = get_dendrogram(Dendrogram, data, args)
+
+        t0 = perf_counter()
+        self.compute_from_structures(structures)
+        t1 = perf_counter()
+
+        timing_data[label][str(M)] = {"time": t1 - t0}
+        print(
+            f"Merged {M} structures from {res}x{res} data with {label} in {t1 - t0:.2e}s with {self._iterations} iterations"
+        )
+
+        if args["memory"]:
+            # numpy registers its allocations with tracemalloc, so the peak
+            # includes all copies of pixel arrays made during the merge. Tracing
+            # slows down the merge a lot, so we do it in a separate run.
+            structures = get_structures(Dendrogram, data, args["ntasks"])
+            self = get_dendrogram(Dendrogram, data, args)
+
+            tracemalloc.start()
+            self.compute_from_structures(structures)
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            timing_data[label][str(M)]["peak_memory"] = peak_memory
+            print(f"Peak memory during the merge: {peak_memory / 1e6:.2f} MB")
+
+    write_timing_data(args, timing_data)
+
+
+def plot():
+    import matplotlib.pyplot as plt
+
+    args = parse_args()
+    timing_data = get_timing_data(args)
+
+    fig, axs = plt.subplots(1, 2, figsize=(9, 4))
+
+    for version, timings in timing_data.items():
+        M = np.array([int(me) for me in timings.keys()])
+        times = np.array([me["time"] for me in timings.values()])
+        memory = np.array([me.get("peak_memory", np.nan) for me in timings.values()])
+        idx = np.argsort(M)
+        axs[0].loglog(M[idx], times[idx], marker="x", label=version)
+        axs[1].loglog(M[idx], memory[idx] / 1e6, marker="x", label=version)
+
+    M = np.array(axs[0].get_xlim())
+    t0 = min(
+        min(me["time"] for me in timings.values()) for timings in timing_data.values()
+    )
+    axs[0].loglog(M, t0 * M / M[0], color="grey", ls="--", label=r"$\mathcal{O}(M)$")
+    axs[0].loglog(
+        M, t0 * (M / M[0]) ** 2, color="grey", ls=":", label=r"$\mathcal{O}(M^2)$"
+    )
+
+    axs[0].set_ylabel(r"$t_\text{merge} / s$")
+    axs[1].set_ylabel("peak memory during merge / MB")
+    for ax in axs:
+        ax.set_xlabel(r"$M$ (structures in local dendrograms)")
+        ax.legend(frameon=False)
+    fig.tight_layout()
+
+    fig.savefig(f"{get_filename(args)[:-5]}.png", bbox_inches="tight", dpi=300)
+    plt.show()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args["run"]:
+        run_experiment()
+
+    if args["plot"]:
+        plot()
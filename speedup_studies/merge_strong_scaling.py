@@ -0,0 +1,203 @@
+import numpy as np
+import os
+import heat as ht
+from time import perf_counter
+import json
+import resource
+
+# Run with increasing numbers of tasks, e.g.
+#   for n in 1 2 4 8 16 32 64; do mpirun -n $n python merge_strong_scaling.py --run 1 --communication tree; done
+# Use --version vertical to compare with value bands on the same input and
+# --version kruskal for the merge through the saddle graph of the boundaries.
+
+
+def _print(*args):
+    if ht.comm.rank == 0:
+        print(*args, flush=True)
+
+
+def parse_args():
+    import argparse
+
+    def cast_to_bool(me):
+        return False if me in ["False", "0", 0] else True
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--version",
+        type=str,
+        help="choose a dendrogram version",
+        default="v3",
+        choices=["v3", "vertical", "kruskal"],
+    )
+    parser.add_argument(
+        "--communication",
+        type=str,
+        help="choose how local dendrograms are merged",
+        default="all",
+        choices=["all", "boundary", "tree", "root"],
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="keep the output replicated or distributed",
+        default="replicated",
+        choices=["replicated", "distributed"],
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        help="choose the engine for merging",
+        default="python",
+        choices=["python", "numba"],
+    )
+    parser.add_argument(
+        "--res", type=int, help="resolution of the noisy 2D test data", default=512
+    )
+    parser.add_argument(
+        "--noise", type=float, help="amplitude of the noise", default=0.05
+    )
+    parser.add_argument("--plot", type=cast_to_bool, help="plot results", default=False)
+    parser.add_argument(
+        "--run", type=cast_to_bool, help="run experiment", default=False
+    )
+
+    return vars(parser.parse_args())
+
+
+def get_data(res, noise, seed=0):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(res)
+    rng = np.random.default_rng(seed)
+    return ht.array(data.numpy() + noise * rng.random(data.shape), split=0)
+
+
+def get_filename(args):
+    base_path = __file__[: __file__.index(os.path.basename(__file__))]
+    return f"{base_path}/timing_data/merge_strong_scaling.json"
+
+
+def get_timing_data(args):
+    filename = get_filename(args)
+    try:
+        with open(filename, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_timing_data(args, data):
+    filename = get_filename(args)
+    with open(filename, "w") as file:
+        json.dump(data, file, indent=4)
+
+
+def get_label(args):
+    if args["version"] in ["vertical", "kruskal"]:
+        version = args["version"]
+        return version if args["output"] == "replicated" else f"{version}-distributed"
+    label = args["communication"]
+    if args["engine"] != "python":
+        label = f"{label}-{args['engine']}"
+    if args["output"] != "replicated":
+        label = f"{label}-{args['output']}"
+    return label
+
+
+def compute_dendrogram(args, data, output="replicated"):
+    if args["version"] == "vertical":
+        from dendro.distributed_dendrogram_vertical import (
+            DistributedDendrogramVertical,
+        )
+
+        return DistributedDendrogramVertical.compute(data, output=output)
+    elif args["version"] == "kruskal":
+        from dendro.distributed_dendrogram_kruskal import DistributedDendrogramKruskal
+
+        return DistributedDendrogramKruskal.compute(data, output=output)
+
+    from dendro.distributed_dendrogram_v3 import DistributedDendrogramV3
+
+    return DistributedDendrogramV3.compute(
+        data,
+        engine=args["engine"],
+        communication=args["communication"],
+        output=output,
+    )
+
+
+def run_experiment():
+    args = parse_args()
+    label = get_label(args)
+
+    # compile the kernels before timing
+    compute_dendrogram(args, get_data(16, args["noise"]))
+
+    data = get_data(args["res"], args["noise"])
+
+    ht.comm.Barrier()
+    t0 = perf_counter()
+    dendrogram = compute_dendrogram(args, data, args["output"])
+    t1 = perf_counter()
+
+    # peak resident memory of the ranks that do not merge with the root
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1e3
+    peak_memory = ht.comm.allreduce(
+        peak_memory if ht.comm.rank > 0 else 0, op=ht.MPI.MAX
+    )
+
+    # the slowest rank determines the time to solution
+    elapsed_time = ht.comm.allreduce(t1 - t0, op=ht.MPI.MAX)
+    local_time = ht.comm.allreduce(dendrogram.time_local_dendrogram, op=ht.MPI.MAX)
+    _print(
+        f"Finished {label} on {ht.comm.size} tasks in {elapsed_time:.2e}s, of which {local_time:.2e}s for the local dendrograms"
+    )
+
+    if ht.comm.rank == 0:
+        timing_data = get_timing_data(args)
+        if label not in timing_data.keys():
+            timing_data[label] = {}
+        timing_data[label][str(ht.comm.size)] = {
+            "time": elapsed_time,
+            "time_local_dendrogram": local_time,
+            "peak_memory_non_root": peak_memory,
+        }
+        write_timing_data(args, timing_data)
+
+
+def plot():
+    import matplotlib.pyplot as plt
+
+    args = parse_args()
+    timing_data = get_timing_data(args)
+
+    fig, ax = plt.subplots()
+
+    for label, timings in timing_data.items():
+        procs = np.array([int(me) for me in timings.keys()])
+        times = np.array([me["time"] for me in timings.values()])
+        idx = np.argsort(procs)
+        ax.loglog(procs[idx], times[idx], marker="x", label=label)
+
+    if "all" in timing_data.keys() and "1" in timing_data["all"].keys():
+        t1 = timing_data["all"]["1"]["time"]
+        procs = np.array(ax.get_xlim())
+        ax.loglog(procs, t1 / procs, color="grey", ls="--", label="ideal scaling")
+
+    ax.set_xscale("log", base=2)
+    ax.set_xlabel(r"$N_\text{procs}$")
+    ax.set_ylabel(r"$t / s$")
+    ax.legend(frameon=False)
+
+    fig.savefig(f"{get_filename(args)[:-5]}.png", bbox_inches="tight", dpi=300)
+    plt.show()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args["run"]:
+        run_experiment()
+
+    if args["plot"]:
+        plot()
@@ -0,0 +1,127 @@
+import numpy as np
+import os
+from time import perf_counter
+import json
+
+# Measures the time for the local dendrograms of a pseudo parallel run in a
+# pool of worker processes, e.g. python process_pool.py --run 1 --ntasks 8
+
+
+def parse_args():
+    import argparse
+
+    def cast_to_bool(me):
+        return False if me in ["False", "0", 0] else True
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--ntasks", type=int, help="number of pseudo parallel tasks", default=8
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        help="numbers of worker processes, where 0 means no pool",
+        default=[0, 1, 2, 4, 8],
+    )
+    parser.add_argument(
+        "--res", type=int, help="resolution of the noisy 2D test data", default=512
+    )
+    parser.add_argument(
+        "--noise", type=float, help="amplitude of the noise", default=0.05
+    )
+    parser.add_argument("--plot", type=cast_to_bool, help="plot results", default=False)
+    parser.add_argument(
+        "--run", type=cast_to_bool, help="run experiment", default=False
+    )
+
+    return vars(parser.parse_args())
+
+
+def get_data(res, noise, seed=0):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(res)
+    rng = np.random.default_rng(seed)
+    return data.numpy() + noise * rng.random(data.shape)
+
+
+def get_filename(args):
+    base_path = __file__[: __file__.index(os.path.basename(__file__))]
+    return f"{base_path}/timing_data/process_pool.json"
+
+
+def get_timing_data(args):
+    filename = get_filename(args)
+    try:
+        with open(filename, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_timing_data(args, data):
+    filename = get_filename(args)
+    with open(filename, "w") as file:
+        json.dump(data, file, indent=4)
+
+
+def run_experiment():
+    from dendro.distributed_dendrogram_v3 import DistributedDendrogramV3
+    from dendro.process_pool import compute_local_dendrograms
+
+    args = parse_args()
+    data = get_data(args["res"], args["noise"])
+    ntasks = args["ntasks"]
+
+    # start the server that the workers are forked from before timing
+    compute_local_dendrograms(data[:2], [slice(0, 1)], 1)
+
+    timing_data = get_timing_data(args)
+    timing_data[str(ntasks)] = {}
+    for workers in args["workers"]:
+        t0 = perf_counter()
+        DistributedDendrogramV3.compute_local_dendrogram_pseudo_parallel(
+            data, ntasks, workers=workers if workers > 0 else None
+        )
+        t1 = perf_counter()
+
+        timing_data[str(ntasks)][str(workers)] = t1 - t0
+        print(
+            f"{workers} workers computed {ntasks} local dendrograms in {t1 - t0:.2e}s"
+        )
+
+    write_timing_data(args, timing_data)
+
+
+def plot():
+    import matplotlib.pyplot as plt
+
+    args = parse_args()
+    timing_data = get_timing_data(args)
+
+    fig, ax = plt.subplots()
+    for ntasks, timings in timing_data.items():
+        workers = np.array([int(me) for me in timings.keys()])
+        times = np.array(list(timings.values()))
+        pool = workers > 0
+        ax.loglog(workers[pool], times[pool], marker="x", label=f"{ntasks} tasks")
+        if not np.all(pool):
+            ax.axhline(times[~pool][0], color="grey", ls="--", label="sequential")
+
+    ax.set_xscale("log", base=2)
+    ax.set_xlabel("workers")
+    ax.set_ylabel(r"$t / s$")
+    ax.legend(frameon=False)
+
+    fig.savefig(f"{get_filename(args)[:-5]}.png", bbox_inches="tight", dpi=300)
+    plt.show()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args["run"]:
+        run_experiment()
+
+    if args["plot"]:
+        plot()
@@ -0,0 +1,143 @@
+import numpy as np
+import os
+from time import perf_counter
+import json
+
+# Compares relabeling the index maps of local dendrograms with one mask per
+# structure to a single lookup table per slab, e.g.
+#   python relabel_index_maps.py --run 1 --ntasks 1 2 4 8
+
+
+def parse_args():
+    import argparse
+
+    def cast_to_bool(me):
+        return False if me in ["False", "0", 0] else True
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--ntasks",
+        type=int,
+        nargs="+",
+        help="numbers of pseudo parallel tasks",
+        default=[1, 2, 4, 8],
+    )
+    parser.add_argument(
+        "--res", type=int, help="resolution of the noisy 2D test data", default=256
+    )
+    parser.add_argument(
+        "--noise", type=float, help="amplitude of the noise", default=0.05
+    )
+    parser.add_argument("--plot", type=cast_to_bool, help="plot results", default=False)
+    parser.add_argument(
+        "--run", type=cast_to_bool, help="run experiment", default=False
+    )
+
+    return vars(parser.parse_args())
+
+
+def get_data(res, noise, seed=0):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(res)
+    rng = np.random.default_rng(seed)
+    return data.numpy() + noise * rng.random(data.shape)
+
+
+def get_filename(args):
+    base_path = __file__[: __file__.index(os.path.basename(__file__))]
+    return f"{base_path}/timing_data/relabel_index_maps.json"
+
+
+def get_timing_data(args):
+    filename = get_filename(args)
+    try:
+        with open(filename, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_timing_data(args, data):
+    filename = get_filename(args)
+    with open(filename, "w") as file:
+        json.dump(data, file, indent=4)
+
+
+def relabel_with_masks(dendrograms):
+    # previous relabeling, which scans the local index map once per structure
+    all_structures = []
+    for d in dendrograms:
+        structures = [structure for structure in d.all_structures]
+        offset = len(all_structures)
+        for structure in structures:
+            d.index_map[d.index_map == structure.idx] += offset
+            structure.idx += offset
+        all_structures += structures
+    return all_structures
+
+
+def run_experiment():
+    from dendro.distributed_dendrogram import relabel_local_dendrograms
+    from dendro.distributed_dendrogram_v2 import DistributedDendrogramV2
+
+    args = parse_args()
+    data = get_data(args["res"], args["noise"])
+
+    timing_data = {"masks": {}, "lookup": {}}
+    for ntasks in args["ntasks"]:
+        slices = DistributedDendrogramV2.get_local_slices(data.shape[0], ntasks)
+        for method in timing_data.keys():
+            dendrograms = (
+                DistributedDendrogramV2.compute_local_dendrogram_pseudo_parallel(
+                    data, ntasks
+                )
+            )
+            n_structures = sum(len(d) for d in dendrograms)
+
+            t0 = perf_counter()
+            if method == "masks":
+                relabel_with_masks(dendrograms)
+            else:
+                relabel_local_dendrograms(dendrograms, slices, data.shape)
+            t1 = perf_counter()
+
+            timing_data[method][str(ntasks)] = {
+                "time": t1 - t0,
+                "structures": n_structures,
+            }
+            print(
+                f"{method}: relabeled {n_structures} structures of {ntasks} tasks in {t1 - t0:.2e}s"
+            )
+
+    write_timing_data(args, timing_data)
+
+
+def plot():
+    import matplotlib.pyplot as plt
+
+    args = parse_args()
+    timing_data = get_timing_data(args)
+
+    fig, ax = plt.subplots()
+    for method, timings in timing_data.items():
+        ntasks = np.array([int(me) for me in timings.keys()])
+        times = np.array([me["time"] for me in timings.values()])
+        ax.loglog(ntasks, times, marker="x", label=method)
+
+    ax.set_xscale("log", base=2)
+    ax.set_xlabel("tasks")
+    ax.set_ylabel(r"$t / s$")
+    ax.legend(frameon=False)
+
+    fig.savefig(f"{get_filename(args)[:-5]}.png", bbox_inches="tight", dpi=300)
+    plt.show()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args["run"]:
+        run_experiment()
+
+    if args["plot"]:
+        plot()
@@ -0,0 +1,149 @@
+import numpy as np
+import os
+import heat as ht
+from time import perf_counter
+import json
+
+# Run with several tasks, e.g. mpirun -n 4 python structure_exchange.py --run 1
+
+
+def _print(*args):
+    if ht.comm.rank == 0:
+        print(*args, flush=True)
+
+
+def parse_args():
+    import argparse
+
+    def cast_to_bool(me):
+        return False if me in ["False", "0", 0] else True
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--npix",
+        type=int,
+        nargs="+",
+        help="numbers of pixels per rank",
+        default=[10**3, 10**4, 10**5, 10**6],
+    )
+    parser.add_argument(
+        "--pix_per_structure",
+        type=int,
+        help="average number of pixels per structure",
+        default=20,
+    )
+    parser.add_argument(
+        "--repetitions", type=int, help="number of timed exchanges", default=5
+    )
+    parser.add_argument("--plot", type=cast_to_bool, help="plot results", default=False)
+    parser.add_argument(
+        "--run", type=cast_to_bool, help="run experiment", default=False
+    )
+
+    return vars(parser.parse_args())
+
+
+def get_structures(npix, pix_per_structure, shape, seed=0):
+    rng = np.random.default_rng(seed)
+    indices = np.stack([rng.integers(0, n, size=npix) for n in shape], axis=1)
+    values = rng.random(npix)
+    splits = np.sort(rng.integers(0, npix, size=npix // pix_per_structure))
+    return np.split(indices, splits), np.split(values, splits)
+
+
+def exchange_pickled(comm, indices, values):
+    raw_data = [(i, me, val) for i, (me, val) in enumerate(zip(indices, values))]
+    return comm.allgather(raw_data)
+
+
+def exchange_buffers(comm, indices, values, shape):
+    from dendro.exchange import allgather_structures
+
+    return allgather_structures(comm, indices, shape, values=values)
+
+
+def get_filename(args):
+    base_path = __file__[: __file__.index(os.path.basename(__file__))]
+    return f"{base_path}/timing_data/structure_exchange.json"
+
+
+def get_timing_data(args):
+    filename = get_filename(args)
+    try:
+        with open(filename, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_timing_data(args, data):
+    filename = get_filename(args)
+    with open(filename, "w") as file:
+        json.dump(data, file, indent=4)
+
+
+def run_experiment():
+    args = parse_args()
+    comm = ht.comm
+    shape = (512, 512, 512)
+
+    timing_data = get_timing_data(args)
+    for method in ["pickle", "buffers"]:
+        timing_data[f"{method}-{comm.size}"] = {}
+
+    for npix in args["npix"]:
+        indices, values = get_structures(
+            npix, args["pix_per_structure"], shape, seed=comm.rank
+        )
+        payload = sum(me.nbytes for me in indices + values) * comm.size
+
+        for method in ["pickle", "buffers"]:
+            times = []
+            for _ in range(args["repetitions"]):
+                comm.Barrier()
+                t0 = perf_counter()
+                if method == "pickle":
+                    exchange_pickled(comm, indices, values)
+                else:
+                    exchange_buffers(comm, indices, values, shape)
+                t1 = perf_counter()
+                times.append(comm.allreduce(t1 - t0, op=ht.MPI.MAX))
+
+            timing_data[f"{method}-{comm.size}"][str(payload)] = min(times)
+            _print(
+                f"Exchanged {payload / 1e6:.2f} MB in {len(indices)} structures per rank on {comm.size} tasks with {method} in {min(times):.2e}s"
+            )
+
+    if comm.rank == 0:
+        write_timing_data(args, timing_data)
+
+
+def plot():
+    import matplotlib.pyplot as plt
+
+    args = parse_args()
+    timing_data = get_timing_data(args)
+
+    fig, ax = plt.subplots()
+
+    for label, timings in timing_data.items():
+        payload = np.array([int(me) for me in timings.keys()])
+        times = np.array([me for me in timings.values()])
+        idx = np.argsort(payload)
+        ax.loglog(payload[idx] / 1e6, times[idx], marker="x", label=label)
+
+    ax.set_xlabel("payload / MB")
+    ax.set_ylabel(r"$t_\text{exchange} / s$")
+    ax.legend(frameon=False)
+
+    fig.savefig(f"{get_filename(args)[:-5]}.png", bbox_inches="tight", dpi=300)
+    plt.show()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args["run"]:
+        run_experiment()
+
+    if args["plot"]:
+        plot()
@@ -0,0 +1,274 @@
+import numpy as np
+
+from dendro.coordinate_set import CoordinateSet
+
+
+# Structures of a local dendrogram whose subtree does not reach a face that is
+# shared with another rank are already final: they are connected components of
+# a superlevel set that cannot grow across the face. Only their place in the
+# global tree is unknown. For the global merge, such an interior subtree is
+# replaced by a placeholder made of the pixels on its rim, which are the only
+# pixels that other structures can be adjacent to. The subtree itself is
+# described by summaries and its pixels stay on the owning rank.
+
+
+def get_slab_faces(axis, start, stop, size):
+    faces = []
+    if start > 0:
+        faces.append((axis, start))
+    if stop < size:
+        faces.append((axis, stop - 1))
+    return faces
+
+
+def get_block_faces(block, shape):
+    faces = []
+    for axis, (s, size) in enumerate(zip(block, shape)):
+        faces += get_slab_faces(axis, s.start, s.stop, size)
+    return faces
+
+
+def touches_faces(indices, faces):
+    return any(np.any(indices[:, axis] == position) for axis, position in faces)
+
+
+def classify_structures(structures, faces):
+    """
+    Returns whether each structure or any of its descendants touches one of the
+    faces. The structures need to be in prefix order.
+    """
+    position = {structure.idx: i for i, structure in enumerate(structures)}
+    touching = np.array(
+        [touches_faces(np.asarray(me._indices), faces) for me in structures],
+        dtype=bool,
+    )
+    for i in reversed(range(len(structures))):
+        parent = structures[i].parent
+        if touching[i] and parent is not None:
+            touching[position[parent.idx]] = True
+    return touching
+
+
+def get_rim(indices, shape, block=None, occupied=None):
+    """
+    Mask of the pixels that have a neighbour inside the data which is not part
+    of the pixels themselves. If a block and the `occupied` pixels of all
+    structures in it are given, neighbours inside the block only count if they
+    are occupied.
+    """
+    pixels = CoordinateSet(indices)
+    rim = np.zeros(len(indices), dtype=bool)
+    for axis in range(indices.shape[1]):
+        for step in [1, -1]:
+            neighbours = indices.copy()
+            neighbours[:, axis] += step
+            inside = (neighbours[:, axis] >= 0) & (neighbours[:, axis] < shape[axis])
+            outside = ~pixels.contains(neighbours)
+            if block is not None:
+                in_block = np.all(
+                    [
+                        (neighbours[:, i] >= s.start) & (neighbours[:, i] < s.stop)
+                        for i, s in enumerate(block)
+                    ],
+                    axis=0,
+                )
+                outside &= ~in_block | occupied.contains(neighbours)
+            rim |= inside & outside
+    return rim
+
+
+def get_halo_region(start, stop, size, halo):
+    return max(start - halo, 0), min(stop + halo, size)
+
+
+def get_subtree_extents(structures, axis):
+    """
+    Smallest and largest position of the pixels in the subtree of each
+    structure along the axis. The structures need to be in prefix order.
+    """
+    position = {structure.idx: i for i, structure in enumerate(structures)}
+    extents = np.array(
+        [
+            (np.min(me[:, axis]), np.max(me[:, axis]))
+            for me in (np.asarray(s._indices) for s in structures)
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    for i in reversed(range(len(structures))):
+        parent = structures[i].parent
+        if parent is not None:
+            j = position[parent.idx]
+            extents[j, 0] = min(extents[j, 0], extents[i, 0])
+            extents[j, 1] = max(extents[j, 1], extents[i, 1])
+    return extents
+
+
+def classify_halo_structures(structures, axis, cores, rank, size, halo):
+    """
+    Local dendrograms are computed on the core slab of a rank extended by a
+    halo. The subtree of a structure is resolved if it does not touch the
+    faces of the extended slab of this rank or of any rank whose core it
+    overlaps. All these ranks then know the complete subtree and agree on it.
+    Returns whether each structure is resolved and whether this rank owns it,
+    which is the rank whose core holds the first pixel of the resolved subtree.
+    The structures need to be in prefix order.
+    """
+    extents = get_subtree_extents(structures, axis)
+    regions = [get_halo_region(start, stop, size, halo) for start, stop in cores]
+
+    def is_inside(lo, hi, region):
+        start, stop = region
+        return (start == 0 or lo > start) and (stop == size or hi < stop - 1)
+
+    resolved = np.zeros(len(structures), dtype=bool)
+    for i, (lo, hi) in enumerate(extents):
+        overlapping = [
+            q for q, (start, stop) in enumerate(cores) if lo < stop and hi >= start
+        ]
+        resolved[i] = all(is_inside(lo, hi, regions[q]) for q in {rank, *overlapping})
+
+    # subtrees are owned as a whole
+    position = {structure.idx: i for i, structure in enumerate(structures)}
+    owned = np.zeros(len(structures), dtype=bool)
+    for i, structure in enumerate(structures):
+        if not resolved[i]:
+            continue
+        parent = structure.parent
+        if parent is None or not resolved[position[parent.idx]]:
+            owned[i] = cores[rank][0] <= extents[i, 0] < cores[rank][1]
+        else:
+            owned[i] = owned[position[parent.idx]]
+    return resolved, owned
+
+
+def pack_structures(structures, faces, shape):
+    """
+    Split the structures of a local dendrogram, in prefix order, into
+
+     - boundary structures (idx, indices, values), which are sent in full,
+     - placeholders (idx, indices, values) with the rim of interior subtrees,
+     - summaries (idx, parent, vmin, vmax, npix) of interior structures, in
+       prefix order and with parent -1 for the roots of interior subtrees,
+     - the pixels of the interior structures as a dict of (indices, values).
+    """
+    touching = classify_structures(structures, faces)
+    return _pack_structures(structures, ~touching, ~touching, shape)
+
+
+def pack_halo_structures(structures, axis, cores, rank, shape, halo):
+    """
+    Like `pack_structures` for a local dendrogram of a slab extended by a halo.
+    Resolved subtrees are interior subtrees of the rank that owns them and are
+    dropped on all other ranks. Of all other structures, only the pixels in the
+    core of this rank are sent.
+    """
+    resolved, owned = classify_halo_structures(
+        structures, axis, cores, rank, shape[axis], halo
+    )
+    start, stop = cores[rank]
+
+    def restrict(indices):
+        return (indices[:, axis] >= start) & (indices[:, axis] < stop)
+
+    return _pack_structures(structures, resolved, owned, shape, restrict)
+
+
+def _pack_structures(structures, interior, owned, shape, restrict=None):
+    position = {structure.idx: i for i, structure in enumerate(structures)}
+
+    boundary, placeholders, summaries, pixels = [], [], [], {}
+    for structure, is_interior, is_owned in zip(structures, interior, owned):
+        indices = np.asarray(structure._indices)
+        values = np.asarray(structure._values)
+
+        if not is_interior:
+            if restrict is not None:
+                local = restrict(indices)
+                indices, values = indices[local], values[local]
+            boundary.append((structure.idx, indices, values))
+            continue
+        if not is_owned:
+            continue
+
+        parent = structure.parent
+        is_root = parent is None or not interior[position[parent.idx]]
+        summaries.append(
+            (
+                structure.idx,
+                -1 if is_root else parent.idx,
+                structure.vmin,
+                structure.vmax,
+                len(values),
+            )
+        )
+        pixels[structure.idx] = (indices, values)
+
+        if is_root:
+            subtree = [structure] + structure.descendants
+            subtree_indices = np.concatenate(
+                [np.asarray(me._indices) for me in subtree]
+            )
+            subtree_values = np.concatenate([np.asarray(me._values) for me in subtree])
+            rim = get_rim(subtree_indices, shape)
+            placeholders.append(
+                (structure.idx, subtree_indices[rim], subtree_values[rim])
+            )
+
+    return boundary, placeholders, summaries, pixels
+
+
+class StructureSummary:
+    """
+    Wire format of a local structure: its value range, its number of pixels
+    and the pixels on its rim, which are the only pixels that other structures
+    can be adjacent to. All other pixels stay on the rank that owns it.
+    """
+
+    __slots__ = ("idx", "rank", "vmin", "vmax", "npix", "indices", "values")
+
+    def __init__(self, idx, rank, vmin, vmax, npix, indices, values):
+        self.idx = idx
+        self.rank = rank
+        self.vmin = vmin
+        self.vmax = vmax
+        self.npix = npix
+        self.indices = indices
+        self.values = values
+
+
+def summarize_structures(structures, rank, shape, block=None):
+    """
+    Summaries of the structures of a local dendrogram and the pixels that are
+    not part of the summaries as a dict of (indices, values) by idx. If the
+    block of the local dendrogram is given, pixels that only touch pixels
+    outside of structures within the block are not part of the rim.
+    """
+    occupied = None
+    if block is not None:
+        empty = np.zeros((0, len(shape)), dtype=np.int64)
+        occupied = CoordinateSet(
+            np.concatenate([empty, *[np.asarray(me._indices) for me in structures]])
+        )
+
+    summaries, pixels = [], {}
+    for structure in structures:
+        indices = np.asarray(structure._indices)
+        values = np.asarray(structure._values)
+        rim = get_rim(indices, shape, block, occupied)
+        if not np.any(rim):
+            # a structure that touches nothing still needs a pixel in the merge
+            rim[np.argmax(values)] = True
+
+        summaries.append(
+            StructureSummary(
+                structure.idx,
+                rank,
+                structure.vmin,
+                structure.vmax,
+                len(values),
+                indices[rim],
+                values[rim],
+            )
+        )
+        pixels[structure.idx] = (indices[~rim], values[~rim])
+    return summaries, pixels
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class CoordinateSet:
+    """
+    Set of integer coordinates, stored as sorted raveled indices into the
+    bounding box of the coordinates.
+
+    Membership of many rows is answered at once by raveling them and looking
+    them up with a binary search, such that queries are O(m log n) instead of
+    comparing all pairs of rows.
+    """
+
+    def __init__(self, coordinates):
+        coordinates = self._as_rows(coordinates)
+        self.ndim = coordinates.shape[1]
+
+        if len(coordinates) == 0:
+            self._lower = np.zeros(self.ndim, dtype=np.int64)
+            self._shape = np.zeros(self.ndim, dtype=np.int64)
+        else:
+            self._lower = coordinates.min(axis=0)
+            self._shape = coordinates.max(axis=0) - self._lower + 1
+
+        raveled = self._ravel(coordinates)
+        self._order = np.argsort(raveled, kind="stable")
+        self._sorted = raveled[self._order]
+
+    @staticmethod
+    def _as_rows(coordinates):
+        coordinates = np.asarray(coordinates, dtype=np.int64)
+        if coordinates.ndim == 1:
+            coordinates = coordinates[:, None]
+        return coordinates
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def _inside(self, rows):
+        return np.all(
+            (rows >= self._lower) & (rows < self._lower + self._shape), axis=1
+        )
+
+    def _ravel(self, rows):
+        return np.ravel_multi_index(tuple((rows - self._lower).T), self._shape)
+
+    def index(self, rows):
+        """
+        Position of each row in the coordinates that the set was built from, or
+        -1 for rows that are not in the set.
+        """
+        rows = self._as_rows(rows)
+        assert rows.shape[1] == self.ndim
+
+        index = -np.ones(len(rows), dtype=np.int64)
+        inside = self._inside(rows)
+        if not np.any(inside) or len(self) == 0:
+            return index
+
+        raveled = self._ravel(rows[inside])
+        position = np.minimum(np.searchsorted(self._sorted, raveled), len(self) - 1)
+        found = self._sorted[position] == raveled
+
+        index[np.flatnonzero(inside)[found]] = self._order[position[found]]
+        return index
+
+    def contains(self, rows):
+        """
+        Which of the rows occur in the set.
+        """
+        return self.index(rows) >= 0
+
+    def intersects(self, rows):
+        return bool(np.any(self.contains(rows)))
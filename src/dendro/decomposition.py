@@ -0,0 +1,255 @@
+import numpy as np
+from mpi4py import MPI
+
+from dendro.boundary import get_block_faces
+
+
+def get_counts(size, parts):
+    # same balanced partition that heat uses for split arrays
+    counts = np.full(parts, size // parts, dtype=np.int64)
+    counts[: size % parts] += 1
+    return counts
+
+
+def get_balanced_offsets(weights, parts):
+    """
+    Offsets that split an axis into parts with about the same total weight.
+    Every part keeps at least one element if there are enough elements.
+    """
+    weights = np.asarray(weights, dtype=float)
+    size = len(weights)
+    total = weights.sum()
+    if total == 0 or parts > size:
+        return np.concatenate([[0], np.cumsum(get_counts(size, parts))])
+
+    # cut before or after the element where the cumulative weight reaches the
+    # target, whichever is closer
+    cumulative = np.cumsum(weights)
+    targets = total * np.arange(1, parts) / parts
+    cuts = np.searchsorted(cumulative, targets)
+    below = np.where(cuts > 0, cumulative[np.maximum(cuts - 1, 0)], 0)
+    cuts += cumulative[cuts] - targets < targets - below
+    offsets = [0]
+    for i, cut in enumerate(cuts.tolist()):
+        offsets.append(min(max(cut, offsets[-1] + 1), size - (parts - 1 - i)))
+    offsets.append(size)
+    return np.array(offsets, dtype=np.int64)
+
+
+def get_valid_mask(data, min_value="min"):
+    # voxels that can be part of a structure
+    valid = np.isfinite(data)
+    if min_value not in ["min", None]:
+        valid &= data >= min_value
+    return valid
+
+
+def get_imbalance(loads):
+    # ratio of the largest to the mean load, which is one for perfect balance
+    mean = np.mean(loads)
+    return float(np.max(loads) / mean) if mean > 0 else 1.0
+
+
+def get_grids(size, ndim):
+    """
+    All process grids with `ndim` axes and `size` ranks in total.
+    """
+    if ndim == 1:
+        return [(size,)]
+    return [
+        (n, *rest)
+        for n in range(1, size + 1)
+        if size % n == 0
+        for rest in get_grids(size // n, ndim - 1)
+    ]
+
+
+class BlockDecomposition:
+    """
+    Cartesian process grid that assigns one block of the data to every rank.
+    Ranks are ordered row-major in the grid like in MPI Cartesian
+    communicators. Entries of `dims` that are zero are chosen by
+    `MPI.Compute_dims`, such that the blocks are as cubic as possible.
+
+    By default, every axis is split into parts of equal length. If `weights`
+    with the work per element along every axis are given, the parts carry
+    about the same work instead.
+    """
+
+    def __init__(self, shape, size, dims=None, weights=None):
+        dims = [0] * len(shape) if dims is None else list(dims)
+        self.shape = tuple(shape)
+        self.size = size
+        self.dims = tuple(MPI.Compute_dims(size, dims))
+        if weights is None:
+            self.offsets = [
+                np.concatenate([[0], np.cumsum(get_counts(n, parts))])
+                for n, parts in zip(self.shape, self.dims)
+            ]
+        else:
+            self.offsets = [
+                get_balanced_offsets(me, parts) for me, parts in zip(weights, self.dims)
+            ]
+
+    @classmethod
+    def slab(cls, shape, size, axis, weights=None):
+        dims = [1] * len(shape)
+        dims[axis] = size
+        return cls(shape, size, dims, weights)
+
+    def get_coords(self, rank):
+        return tuple(int(me) for me in np.unravel_index(rank, self.dims))
+
+    def get_rank(self, coords):
+        return int(np.ravel_multi_index(coords, self.dims))
+
+    def get_block(self, rank):
+        return tuple(
+            slice(int(offsets[i]), int(offsets[i + 1]))
+            for offsets, i in zip(self.offsets, self.get_coords(rank))
+        )
+
+    def get_faces(self, rank):
+        return get_block_faces(self.get_block(rank), self.shape)
+
+    def get_neighbours(self, rank):
+        """
+        Ranks of the blocks that share a face with the block of `rank` as a dict
+        with keys (axis, direction), where direction is -1 or 1.
+        """
+        coords = self.get_coords(rank)
+        neighbours = {}
+        for axis in range(len(self.dims)):
+            for direction in [-1, 1]:
+                other = list(coords)
+                other[axis] += direction
+                if 0 <= other[axis] < self.dims[axis]:
+                    neighbours[(axis, direction)] = self.get_rank(other)
+        return neighbours
+
+    def count_face_pixels(self):
+        """
+        Number of pixels on faces that blocks share with a neighbour, summed
+        over all blocks.
+        """
+        total = 0
+        for rank in range(self.size):
+            lshape = [s.stop - s.start for s in self.get_block(rank)]
+            for axis, _ in self.get_faces(rank):
+                total += int(np.prod(lshape)) // max(lshape[axis], 1)
+        return total
+
+    def get_local_block(self, data):
+        """
+        Redistribute a DNDarray such that every rank gets its block as a numpy
+        array. Every rank sends the part of its slab that overlaps with the
+        block of every other rank.
+        """
+        comm = data.comm
+        local = data.larray.cpu().numpy()
+        block = self.get_block(comm.rank)
+        if data.split is None:
+            return local[block].copy()
+
+        split = data.split
+        counts, displs = data.counts_displs()
+        start, stop = displs[comm.rank], displs[comm.rank] + counts[comm.rank]
+
+        def overlap(s, start, stop):
+            lo = max(s.start, start)
+            return lo, max(min(s.stop, stop), lo)
+
+        pieces = []
+        for other in range(comm.size):
+            piece = list(self.get_block(other))
+            lo, hi = overlap(piece[split], start, stop)
+            piece[split] = slice(lo - start, hi - start)
+            pieces.append(local[tuple(piece)])
+        pieces = comm.alltoall(pieces)
+
+        result = np.empty([s.stop - s.start for s in block], dtype=local.dtype)
+        for source, piece in enumerate(pieces):
+            target = [slice(0, n) for n in result.shape]
+            lo, hi = overlap(
+                block[split], displs[source], displs[source] + counts[source]
+            )
+            target[split] = slice(lo - block[split].start, hi - block[split].start)
+            result[tuple(target)] = piece
+        return result
+
+
+def get_weight_profiles(data, min_value="min"):
+    """
+    Number of valid voxels in every slice along every axis of a DNDarray, which
+    is the same on all ranks.
+    """
+    comm = data.comm
+    valid = get_valid_mask(data.larray.cpu().numpy(), min_value)
+
+    offset = 0
+    if data.split is not None:
+        _, displs = data.counts_displs()
+        offset = displs[comm.rank]
+
+    profiles = []
+    for axis in range(data.ndim):
+        others = tuple(i for i in range(data.ndim) if i != axis)
+        local = valid.sum(axis=others).astype(np.int64)
+        if axis != data.split:
+            profiles.append(local if data.split is None else comm.allreduce(local))
+            continue
+        profile = np.zeros(data.shape[axis], dtype=np.int64)
+        profile[offset : offset + len(local)] = local
+        profiles.append(comm.allreduce(profile))
+    return profiles
+
+
+def estimate_loads(blocks, profiles):
+    """
+    Estimate the number of valid voxels in every block from the weight
+    profiles, assuming that they are independent along different axes. The
+    estimate is exact for slabs.
+    """
+    total = profiles[0].sum()
+    if total == 0:
+        return np.zeros(blocks.size)
+
+    loads = np.full(blocks.size, float(total))
+    for rank in range(blocks.size):
+        for s, profile in zip(blocks.get_block(rank), profiles):
+            loads[rank] *= profile[s].sum() / total
+    return loads
+
+
+def choose_grid(shape, size, profiles, balance=False, slabs_only=False):
+    """
+    Choose the process grid with the smallest predicted cost, which is the
+    largest load of a rank plus the number of pixels on shared faces that enter
+    the merge. Returns the grid and a summary of the decision.
+    """
+    candidates = {}
+    for dims in get_grids(size, len(shape)):
+        if any(n > length for n, length in zip(dims, shape)):
+            continue
+        if slabs_only and sum(n > 1 for n in dims) > 1:
+            continue
+        blocks = BlockDecomposition(shape, size, dims, profiles if balance else None)
+        loads = estimate_loads(blocks, profiles)
+        face_pixels = blocks.count_face_pixels()
+        candidates[dims] = {
+            "predicted_cost": float(loads.max() + face_pixels),
+            "predicted_imbalance": get_imbalance(loads),
+            "face_pixels": face_pixels,
+        }
+
+    if len(candidates) == 0:
+        raise ValueError(f"Cannot distribute data of shape {shape} to {size} ranks")
+
+    best = min(candidates, key=lambda dims: candidates[dims]["predicted_cost"])
+    return best, {
+        "grid": best,
+        **candidates[best],
+        "candidates": {
+            str(dims): me["predicted_cost"] for dims, me in candidates.items()
+        },
+    }
@@ -5,8 +5,16 @@ from numba import njit
 from astrodendro.dendrogram import Dendrogram
 from astrodendro.structure import Structure as astrodendro_structure
 
+from dendro.coordinate_set import CoordinateSet
+from dendro.exchange import allgather_structures
+from dendro.union_find import DisjointSet
+
 
 class Structure(astrodendro_structure):
+    # summaries of structures of other ranks whose pixels apart from the rim
+    # have not been pulled yet
+    _summaries = ()
+
     def __init__(self, indices, values, children=[], idx=None, dendrogram=None):
 
         self._dendrogram = dendrogram
@@ -30,11 +38,119 @@ class Structure(astrodendro_structure):
         self._values = values
         self.idx = idx
 
-        self._vmin, self._vmax = np.min(values), np.max(values)
+        self._vmin, self._vmax = values.min(), values.max()
         if idx >= 0:
-            self._smallest_index = np.min(self._indices)
+            self._smallest_index = indices.min()
             self._reset_cache()
 
+    # Pixels that are merged into a structure are only appended to a list of
+    # pieces, which are concatenated once the pixels are needed as one array.
+    # This way merging into a structure does not copy all of its pixels.
+    @staticmethod
+    def _concatenate(pieces):
+        return np.concatenate(pieces)
+
+    @property
+    def _indices(self):
+        if len(self._index_pieces) > 1:
+            self._index_pieces = [self._concatenate(self._index_pieces)]
+        return self._index_pieces[0]
+
+    @_indices.setter
+    def _indices(self, value):
+        self._index_pieces = [value]
+
+    @property
+    def _values(self):
+        if len(self._value_pieces) > 1:
+            self._value_pieces = [self._concatenate(self._value_pieces)]
+        return self._value_pieces[0]
+
+    @_values.setter
+    def _values(self, value):
+        self._value_pieces = [value]
+
+    def _append_pixels(self, indices, values):
+        self._index_pieces.append(indices)
+        self._value_pieces.append(values)
+
+    def get_npix(self, subtree=True):
+        if subtree:
+            return super().get_npix(subtree=True)
+        return sum(len(me) for me in self._value_pieces)
+
+    def compact(self):
+        return CompactStructure(self._indices, self._values, idx=self.idx)
+
+
+class CompactStructure(Structure):
+    # Structures in the finished dendrogram keep their pixels as arrays. The list
+    # of values and the list of index tuples that astrodendro works with are only
+    # built when they are accessed.
+    @property
+    def _indices(self):
+        if self._index_list is None:
+            self._index_list = [tuple(me) for me in self._index_array.tolist()]
+        return self._index_list
+
+    @_indices.setter
+    def _indices(self, value):
+        self._index_array = np.asarray(value)
+        self._index_list = None
+
+    @property
+    def _values(self):
+        if self._value_list is None:
+            self._value_list = self._value_array.tolist()
+        return self._value_list
+
+    @_values.setter
+    def _values(self, value):
+        self._value_array = np.asarray(value)
+        self._value_list = None
+
+    def indices(self, subtree=True):
+        if subtree or self._tree_index is not None:
+            return super().indices(subtree=subtree)
+        return tuple(self._index_array.T)
+
+    def values(self, subtree=True):
+        if subtree or self._tree_index is not None:
+            return super().values(subtree=subtree)
+        return self._value_array
+
+    def get_npix(self, subtree=True):
+        if subtree:
+            return self.get_npix(subtree=False) + sum(
+                me.get_npix(subtree=False) for me in self.descendants
+            )
+        return len(self._value_array)
+
+    def compact(self):
+        return self
+
+
+class RemoteStructure(CompactStructure):
+    # Structure whose pixels are kept on another rank, such that only a summary
+    # of it is known here.
+    def __init__(self, vmin, vmax, npix, ndim, idx=None, rank=None, dendrogram=None):
+        self._dendrogram = dendrogram
+        self.parent = None
+        self.children = []
+        self._indices = np.zeros((0, ndim), dtype=np.int64)
+        self._values = np.zeros(0)
+        self._vmin, self._vmax = vmin, vmax
+        self._npix = npix
+        self._smallest_index = None
+        self.rank = rank
+        self.idx = idx
+        self._reset_cache()
+
+    def get_npix(self, subtree=True):
+        if subtree:
+            return super().get_npix(subtree=True)
+        return self._npix + len(self._value_array)
+
 
 class DistributedDendrogram(Dendrogram):
     @staticmethod
@@ -53,7 +169,7 @@ class DistributedDendrogram(Dendrogram):
         )
 
         # communicate data
-        chunks = DistributedDendrogram.gather_chunks(chunks, data.comm)
+        chunks = DistributedDendrogram.gather_chunks(chunks, data.comm, data.shape)
         global_data = data.numpy()
 
         # assemble global dendrogram serially
@@ -140,9 +256,9 @@ class DistributedDendrogram(Dendrogram):
         return chunks
 
     @staticmethod
-    def gather_chunks(chunks, comm):
-        all_chunks = comm.allgather(chunks)
-        for i, _chunks in enumerate(all_chunks):
+    def gather_chunks(chunks, comm, shape):
+        all_chunks = allgather_structures(comm, chunks, shape)
+        for i, (_, _chunks, _) in enumerate(all_chunks):
             if i != comm.rank:
                 chunks += _chunks
         return chunks
@@ -157,33 +273,25 @@ class DistributedDendrogram(Dendrogram):
         if isinstance(other, (list, type(chunk))):
             if isinstance(chunk, list):
                 chunk = np.array(chunk)
-            if isinstance(other, list):
-                other = np.array(other)
             assert chunk.ndim == 2
 
+            neighbours = []
             for i in range(chunk.shape[1]):
                 one = np.zeros((1, chunk.shape[1]), dtype=int)
                 one[:, i] = 1
-                if shares_row(chunk + one, other):
-                    return True
-                if shares_row(chunk - one, other):
-                    return True
+                neighbours += [chunk + one, chunk - one]
 
-            return False
+            return CoordinateSet(other).intersects(np.concatenate(neighbours))
         elif isinstance(other, (Structure, astrodendro_structure)):
-            if DistributedDendrogram.is_adjacent(chunk, other._indices):
-                return True
-            else:
-                to_look_at = [me for me in other._children]
-
-                while len(to_look_at) > 0:
-                    _structure = to_look_at.pop(0)
-                    if DistributedDendrogram.is_adjacent(chunk, _structure._indices):
-                        return True
-                    else:
-                        to_look_at += _structure._children
-
-                return False
+            # look for adjacency with the structure and all its descendants at once
+            indices = [np.asarray(other._indices)]
+            to_look_at = [me for me in other._children]
+            while len(to_look_at) > 0:
+                _structure = to_look_at.pop(0)
+                indices.append(np.asarray(_structure._indices))
+                to_look_at += _structure._children
+
+            return DistributedDendrogram.is_adjacent(chunk, np.concatenate(indices))
         else:
             raise NotImplementedError(
                 f"Got input of {type(other)} that we can't handle"
@@ -195,15 +303,14 @@ class DistributedDendrogram(Dendrogram):
         for i in range(chunk.shape[1]):
             one = np.zeros((1, chunk.shape[1]), dtype=int)
             one[:, i] = 1
-            adjacent += list(index_map[*(chunk + one).T])
-            adjacent += list(index_map[*(chunk - one).T])
-        return [me for me in np.unique(adjacent) if me >= 0]
+            adjacent += [index_map[*(chunk + one).T]]
+            adjacent += [index_map[*(chunk - one).T]]
+        adjacent = np.unique(np.concatenate(adjacent))
+        return adjacent[adjacent >= 0]
 
     @staticmethod
-    def get_adjacent_structures(structures, adjacent_structure_indices):
-        ancestor_indices = np.unique(
-            [structures[i].ancestor.idx for i in adjacent_structure_indices]
-        )
+    def get_adjacent_structures(structures, adjacent_structure_indices, ancestors):
+        ancestor_indices = np.unique(ancestors.find(adjacent_structure_indices))
         return [structures[i] for i in ancestor_indices]
 
     @staticmethod
@@ -211,6 +318,7 @@ class DistributedDendrogram(Dendrogram):
         dendrogram = Dendrogram()
         dendrogram.data = data
         dendrogram.index_map = -np.ones(np.add(data.shape, 1), dtype=np.int32)
+        ancestors = DisjointSet()
 
         # print(len(chunks) / data.size)
 
@@ -220,7 +328,7 @@ class DistributedDendrogram(Dendrogram):
                 chunks[0],
                 data[*chunks[0].T],
                 dendrogram=dendrogram,
-                idx=0,
+                idx=ancestors.add(),
             )
         ]
         dendrogram.index_map[*chunks[0].T] = 0
@@ -234,7 +342,7 @@ class DistributedDendrogram(Dendrogram):
                 )
             )
             adjacent_structures = DistributedDendrogram.get_adjacent_structures(
-                structures, adjacent_structure_indices
+                structures, adjacent_structure_indices, ancestors
             )
 
             if len(adjacent_structures) == 0:  # create new leaf
@@ -242,7 +350,7 @@ class DistributedDendrogram(Dendrogram):
                     Structure(
                         chunk,
                         data[*chunk.T],
-                        idx=len(structures),
+                        idx=ancestors.add(),
                         dendrogram=dendrogram,
                     )
                 )
@@ -250,13 +358,15 @@ class DistributedDendrogram(Dendrogram):
 
             elif len(adjacent_structures) == 1:  # merge into existing structure
                 structure = adjacent_structures[0]
-                structure._indices = np.vstack([structure._indices, chunk])
-                structure._values = np.append(structure._values, data[*chunk.T])
+                values = data[*chunk.T]
+                structure._append_pixels(chunk, values)
                 structure._vmin, structure._vmax = (
-                    np.min(structure._values),
-                    np.max(structure._values),
+                    min(structure._vmin, np.min(values)),
+                    max(structure._vmax, np.max(values)),
+                )
+                structure._smallest_index = min(
+                    structure._smallest_index, np.min(chunk)
                 )
-                structure._smallest_index = np.min(structure._indices)
                 dendrogram.index_map[*chunk.T] = structure.idx
 
             else:  # create parent structure
@@ -266,30 +376,82 @@ class DistributedDendrogram(Dendrogram):
                         chunk,
                         data[*chunk.T],
                         children=adjacent_structures,
-                        idx=len(structures),
+                        idx=ancestors.add(),
                         dendrogram=dendrogram,
                     )
                 )
+                ancestors.union(
+                    [me.idx for me in adjacent_structures], structures[-1].idx
+                )
                 dendrogram.index_map[*chunk.T] = structures[-1].idx
 
-        # identify trunk
-        dendrogram._trunk = [
-            structure for structure in structures if structure.parent is None
-        ]
-
-        # make astrodendro-compatible
-        for structure in structures:
-            structure._level = 0
-            if structure.parent is not None:
-                parent = structure.parent
-                while parent is not None:
-                    structure._level += 1
-                    parent = parent.parent
+        finalize_structures(dendrogram, structures)
+        return dendrogram
 
-            structure._values = list(structure._values)
-            structure._indices = [tuple(me) for me in structure._indices]
 
-        return dendrogram
+def finalize_structures(dendrogram, structures):
+    compact = {structure.idx: structure.compact() for structure in structures}
+    for structure in structures:
+        me = compact[structure.idx]
+        me._dendrogram = dendrogram
+        me.children = [compact[child.idx] for child in structure.children]
+        for child in me.children:
+            child.parent = me
+
+    dendrogram._structures_dict = compact
+    dendrogram._trunk = [me for me in compact.values() if me.parent is None]
+
+    # compute levels in a single pass from the trunk to the leaves
+    to_look_at = list(dendrogram._trunk)
+    for structure in to_look_at:
+        structure._level = 0
+    while len(to_look_at) > 0:
+        structure = to_look_at.pop()
+        for child in structure.children:
+            child._level = structure._level + 1
+            to_look_at.append(child)
+
+    return list(compact.values())
+
+
+def relabel_local_structures(dendrograms):
+    """
+    Shift the idx of the structures of local dendrograms such that they are
+    unique. Returns the structures of all local dendrograms.
+    """
+    structures = []
+    for dendrogram in dendrograms:
+        local_structures = list(dendrogram.all_structures)
+        offset = len(structures)
+        for structure in local_structures:
+            structure.idx += offset
+        structures += local_structures
+    return structures
+
+
+def relabel_local_dendrograms(dendrograms, slices, shape):
+    """
+    Shift the idx of the structures of local dendrograms such that they are
+    unique and assemble the index maps of the local dendrograms, which are
+    relabeled through a lookup table, into an index map of the full data.
+    `slices` are the parts of the data that the local dendrograms cover.
+    Returns the structures of all local dendrograms and the index map.
+    """
+    structures = []
+    index_map = -np.ones(shape, dtype=np.int32)
+    for dendrogram, s in zip(dendrograms, slices):
+        local_structures = list(dendrogram.all_structures)
+        offset = len(structures)
+
+        ids = np.array([me.idx for me in local_structures], dtype=np.int64)
+        lookup = -np.ones(ids.max(initial=-1) + 2, dtype=np.int32)
+        lookup[ids + 1] = ids + offset
+        index_map[s] = lookup[dendrogram.index_map + 1]
+
+        for structure in local_structures:
+            structure.idx += offset
+        structures += local_structures
+    return structures, index_map
 
 
 @njit
@@ -0,0 +1,375 @@
+import heat as ht
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+import logging
+
+from dendro.distributed_dendrogram_v3 import DistributedDendrogramV3
+from dendro.distributed_dendrogram_vertical import (
+    DistributedDendrogramVertical,
+    LinearLookup,
+    is_lower,
+    merge_reduced_trees,
+)
+from dendro.exchange import allgather_arrays
+from dendro.instrumentation import Instrumentation
+from dendro.local_dendrogram import compute_flat
+
+
+# Every rank computes the dendrogram of its slab. A local structure is a
+# component of a superlevel set of the slab from the moment its highest pixel,
+# its top, is added. Components of the whole data only differ where pixels of
+# neighbouring slabs touch, so neighbouring ranks only exchange the values and
+# local structures of the plane between them. Every pair of touching pixels is
+# an edge between two local structures at the height of its lower pixel, the
+# saddle. Together with the edges between local children and their parents at
+# the top of the parent, this gives a small graph whose nodes are the tops and
+# the saddles. Sorting the nodes by height and joining the components of the
+# edges below each node with a union-find, like Kruskal's algorithm, gives the
+# global tree. The cost of this merge depends on the number of local
+# structures and boundary pixels, but not on the pixels inside the structures.
+# Every pixel then belongs to the global structure of the lowest node of its
+# local structure above it, or to the last ancestor of that structure that was
+# created before the pixel was added.
+
+
+def get_tops(labels, linear, values, n_structures):
+    """
+    Position of the highest pixel of every structure.
+    """
+    order = np.lexsort((linear, values, labels))
+    ends = np.searchsorted(labels[order], np.arange(n_structures), side="right")
+    return order[ends - 1]
+
+
+def compute_slab(local_data, shape, axis, start, min_value=None):
+    """
+    Dendrogram of a slab that starts at `start` along `axis` of data of the
+    given shape, computed by the numba engine. Ties are added by decreasing
+    linear index and leaves on plateaus are kept, such that the saddle graph
+    can decide whether they are merged. Returns the parents of the structures,
+    the structure, linear index and value of every pixel as float64, the
+    position of the top of every structure and the local index map.
+    """
+    parents, offsets, indices, values = compute_flat(
+        local_data,
+        min_value=-np.inf if min_value is None else min_value,
+        kind="stable",
+        merge_plateaus=False,
+    )
+    values = values.astype(np.float64)
+    labels = np.repeat(np.arange(len(parents), dtype=np.int64), np.diff(offsets))
+    index_map = -np.ones(local_data.shape, dtype=np.int64)
+    index_map[*indices.T] = labels
+
+    indices[:, axis] += start
+    linear = np.ravel_multi_index(indices.T, shape).astype(np.int64)
+    tops = get_tops(labels, linear, values, len(parents))
+    return parents, labels, linear, values, tops, index_map
+
+
+def get_plane(local_data, index_map, top_linear, shape, axis, start, position):
+    """
+    Values, linear indices and tops of the structures of the pixels in a plane
+    of a slab, where the tops are -1 for pixels outside of structures.
+    """
+    labels = np.take(index_map, position, axis=axis).flatten()
+    tops = np.where(labels >= 0, top_linear[np.maximum(labels, 0)], -1)
+    values = np.take(local_data, position, axis=axis).astype(np.float64).flatten()
+
+    ranges = [np.arange(n, dtype=np.int64) for n in shape]
+    ranges[axis] = np.array([start + position], dtype=np.int64)
+    linear = np.ravel_multi_index(np.ix_(*ranges), shape).flatten()
+    return values, linear, tops
+
+
+def get_slab_graph(parents, linear, values, tops):
+    """
+    Nodes as (values, linear) and edges as linear indices of the upper and
+    lower node of the tree of a slab.
+    """
+    has_parent = parents >= 0
+    top_linear = linear[tops]
+    nodes = values[tops], top_linear
+    edges = top_linear[has_parent], top_linear[parents[has_parent]]
+    return nodes, edges
+
+
+def get_saddle_graph(last_plane, first_plane):
+    """
+    Nodes and edges like `get_slab_graph` of the edges between the last plane
+    of a slab and the first plane of the next slab.
+    """
+    values, linear, tops = last_plane
+    other_values, other_linear, other_tops = first_plane
+    both = (tops >= 0) & (other_tops >= 0)
+    values, linear, tops = values[both], linear[both], tops[both]
+    other_values = other_values[both]
+    other_linear = other_linear[both]
+    other_tops = other_tops[both]
+
+    swap = is_lower(other_values, other_linear, values, linear)
+    saddle_values = np.where(swap, other_values, values)
+    saddles = np.where(swap, other_linear, linear)
+    upper_tops = np.where(swap, tops, other_tops)
+    lower_tops = np.where(swap, other_tops, tops)
+
+    # the saddle joins the structure of the upper pixel and its own structure
+    own = lower_tops != saddles
+    nodes = saddle_values, saddles
+    edges = (
+        np.concatenate([upper_tops, lower_tops[own]]),
+        np.concatenate([saddles, saddles[own]]),
+    )
+    return nodes, edges
+
+
+def merge_saddle_graph(node_values, node_linear, child, parent):
+    """
+    Global tree from the nodes and edges of the saddle graph, where nodes may
+    be repeated. Returns the linear indices of the unique nodes, the structure
+    of every node, and the parent and the (value, linear index) of the top of
+    every structure.
+    """
+    node_linear, unique = np.unique(node_linear, return_index=True)
+    node_values = node_values[unique]
+    order = np.lexsort((node_linear, node_values))
+    positions = np.empty(len(order), dtype=np.int64)
+    positions[order] = np.arange(len(order))
+
+    lookup = LinearLookup(node_linear)
+    structures, parents, tops = merge_reduced_trees(
+        positions, node_values, lookup(child), lookup(parent)
+    )
+    tops = node_values[order[tops]], node_linear[order[tops]]
+    return node_linear, structures, (parents, tops)
+
+
+def label_local_pixels(labels, linear, values, node_linear, structures, tree):
+    """
+    Global structure of the pixels of the local structures of a slab, given
+    the output of `merge_saddle_graph`.
+    """
+    parents, (top_values, top_linear) = tree
+    node = LinearLookup(node_linear)(linear)
+
+    # lowest node of the local structure above every pixel, which exists
+    # because the top of every local structure is a node
+    order = np.lexsort((linear, values, labels))
+    marked = np.where(node[order] >= 0, np.arange(len(order)), len(order))
+    above = np.minimum.accumulate(marked[::-1])[::-1]
+    anchor = np.empty(len(order), dtype=np.int64)
+    anchor[order] = order[above]
+
+    result = structures[node[anchor]]
+    while True:
+        up = parents[result]
+        move = up >= 0
+        move[move] = is_lower(
+            values[move], linear[move], top_values[up[move]], top_linear[up[move]]
+        )
+        if not np.any(move):
+            return result
+        result[move] = up[move]
+
+
+class DistributedDendrogramKruskal(DistributedDendrogramVertical):
+    """
+    Dendrogram of data that is distributed in slabs, whose local dendrograms
+    are merged through the saddle graph of the planes between the slabs. Only
+    the default pruning of astrodendro is supported.
+    """
+
+    logger = logging.getLogger("Dendrogram")
+    instrumentation = Instrumentation()
+
+    @staticmethod
+    def compute(
+        data,
+        min_npix=0,
+        min_value="min",
+        min_delta=0,
+        output="replicated",
+        instrument=False,
+        log=False,
+    ):
+        assert isinstance(data, ht.DNDarray)
+        if min_npix > 0 or min_delta > 0:
+            raise NotImplementedError("The saddle graph does not support pruning")
+
+        self = DistributedDendrogramKruskal()
+        self.data = data if data.split is not None else ht.resplit(data, 0)
+        self.comm = data.comm
+        self.params = dict(min_npix=min_npix, min_value=min_value, min_delta=min_delta)
+        self.instrument(instrument, log)
+        min_value = None if min_value == "min" else min_value
+
+        t0 = perf_counter()
+        local_data = self.data.larray.cpu().numpy()
+        _, displs = self.data.counts_displs()
+        start = displs[self.comm.rank]
+        slab = compute_slab(
+            local_data, self.data.shape, self.data.split, start, min_value
+        )
+        t1 = perf_counter()
+        nodes, edges = self.communicate_planes(local_data, slab)
+        node_linear, structures, tree = self.merge_saddle_graph(nodes, edges)
+        _, labels, linear, values, _, _ = slab
+        labels = label_local_pixels(
+            labels, linear, values, node_linear, structures, tree
+        )
+        t2 = perf_counter()
+        self.time_local_dendrogram = t1 - t0
+        self._tree = tree
+
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.add_time("local_dendrogram", t1 - t0)
+            stats.add_time("merge", t2 - t1)
+            self.statistics = stats.as_dict()
+
+        if output == "distributed":
+            self.distribute_labels(labels, values, linear)
+        elif output == "replicated":
+            self.gather_labels(labels, values, linear)
+        else:
+            raise NotImplementedError(f"Don't know output mode {output!r}")
+        return self
+
+    def communicate_planes(self, local_data, slab):
+        """
+        Send the first plane of the slab to the previous rank and receive the
+        first plane of the next rank. Returns the nodes and edges of the tree
+        of the slab and of the saddle graph with the next rank.
+        """
+        comm = self.comm
+        data = self.data
+        parents, _, linear, values, tops, index_map = slab
+        counts, displs = data.counts_displs()
+        size = counts[comm.rank]
+
+        def get_local_plane(position):
+            return get_plane(
+                local_data,
+                index_map,
+                linear[tops],
+                data.shape,
+                data.split,
+                displs[comm.rank],
+                position,
+            )
+
+        # ranks are paired along the split axis, so ranks without pixels only
+        # pass the plane of their successor on
+        has_next = comm.rank + 1 < comm.size
+        first = get_local_plane(0) if size > 0 else None
+        received = None
+        if size == 0:
+            if has_next:
+                received = comm.recv(source=comm.rank + 1)
+            if comm.rank > 0:
+                comm.send(received, dest=comm.rank - 1)
+        elif comm.rank > 0 and has_next:
+            received = comm.sendrecv(first, dest=comm.rank - 1, source=comm.rank + 1)
+        elif comm.rank > 0:
+            comm.send(first, dest=comm.rank - 1)
+        elif has_next:
+            received = comm.recv(source=comm.rank + 1)
+
+        nodes, edges = get_slab_graph(parents, linear, values, tops)
+        nodes, edges = [nodes], [edges]
+        if received is not None and size > 0:
+            saddle_nodes, saddle_edges = get_saddle_graph(
+                get_local_plane(size - 1), received
+            )
+            nodes.append(saddle_nodes)
+            edges.append(saddle_edges)
+
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.count("sent_pixels", 0 if first is None else len(first[0]))
+            stats.count("saddles", sum(len(me[1]) for me in nodes[1:]))
+        return nodes, edges
+
+    def merge_saddle_graph(self, nodes, edges):
+        """
+        Gather the saddle graphs of all ranks and compute the global tree.
+        """
+        comm = self.comm
+        node_values = allgather_arrays(comm, np.concatenate([me[0] for me in nodes]))
+        node_linear = allgather_arrays(comm, np.concatenate([me[1] for me in nodes]))
+        child = allgather_arrays(comm, np.concatenate([me[0] for me in edges]))
+        parent = allgather_arrays(comm, np.concatenate([me[1] for me in edges]))
+
+        node_linear, structures, tree = merge_saddle_graph(
+            node_values, node_linear, child, parent
+        )
+        self._iterations = len(node_linear)
+
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.counters["iterations"] = self._iterations
+            stats.count("saddle_edges", len(child))
+        return node_linear, structures, tree
+
+    @staticmethod
+    def compute_pseudo_parallel(data, ntasks, min_value="min", threads=1):
+        """
+        Compute the dendrogram with `ntasks` slabs on a single process, where
+        the slabs are computed on a pool of `threads` threads.
+        """
+        self = DistributedDendrogramKruskal()
+        self.data = np.asarray(data)
+        min_value = None if min_value == "min" else min_value
+        shape = self.data.shape
+
+        def compute(s):
+            local_data = self.data[s]
+            slab = compute_slab(local_data, shape, 0, s.start, min_value)
+            parents, _, linear, values, tops, index_map = slab
+            planes = [
+                get_plane(local_data, index_map, linear[tops], shape, 0, s.start, i)
+                for i in [0, s.stop - s.start - 1]
+            ]
+            return slab, planes, get_slab_graph(parents, linear, values, tops)
+
+        slices = DistributedDendrogramV3.get_local_slices(shape[0], ntasks)
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(compute, slices))
+        slabs = [me[0] for me in results]
+        planes = [me[1] for me in results]
+        nodes = [me[2][0] for me in results]
+        edges = [me[2][1] for me in results]
+
+        for (_, last), (first, _) in zip(planes[:-1], planes[1:]):
+            saddle_nodes, saddle_edges = get_saddle_graph(last, first)
+            nodes.append(saddle_nodes)
+            edges.append(saddle_edges)
+
+        node_linear, structures, tree = merge_saddle_graph(
+            np.concatenate([me[0] for me in nodes]),
+            np.concatenate([me[1] for me in nodes]),
+            np.concatenate([me[0] for me in edges]),
+            np.concatenate([me[1] for me in edges]),
+        )
+        self._iterations = len(node_linear)
+
+        labels = np.concatenate(
+            [
+                label_local_pixels(
+                    labels, linear, values, node_linear, structures, tree
+                )
+                for _, labels, linear, values, _, _ in slabs
+            ]
+        )
+        linear = np.concatenate([me[2] for me in slabs])
+        values = np.concatenate([me[3] for me in slabs])
+
+        parents, _ = tree
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(labels, minlength=len(parents)))]
+        )
+        indices = np.stack(np.unravel_index(linear[order], shape), axis=1)
+        self.set_structures_from_flat(parents, offsets, indices, values[order])
+        return self
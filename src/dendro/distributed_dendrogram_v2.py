@@ -4,7 +4,15 @@ from time import perf_counter
 
 from astrodendro.dendrogram import Dendrogram
 
-from dendro.distributed_dendrogram import Structure
+from dendro.distributed_dendrogram import (
+    Structure,
+    finalize_structures,
+    relabel_local_structures,
+)
+from dendro.exchange import allgather_structures
+from dendro.process_pool import compute_local_dendrograms
+from dendro.structure_queue import StructureQueue
+from dendro.union_find import DisjointSet
 
 
 class DistributedDendrogramV2(Dendrogram):
@@ -47,34 +55,43 @@ class DistributedDendrogramV2(Dendrogram):
     def communicate_structures(self, local_dendrogram):
         structures = [structure for structure in local_dendrogram.all_structures]
 
-        # unpack data from structures for communication
-        raw_data = [
-            (structure.idx, structure._indices, structure._values)
-            for structure in structures
-        ]
-
-        # communicate the data
-        all_raw_data = self.comm.allgather(raw_data)
+        # communicate the data as flat buffers
+        all_data = allgather_structures(
+            self.comm,
+            [np.asarray(structure._indices) for structure in structures],
+            self.data.shape,
+            values=[np.asarray(structure._values) for structure in structures],
+            ids=[structure.idx for structure in structures],
+        )
 
         # repack the data into structures
-        for i, _data in enumerate(all_raw_data):
+        for i, (ids, indices, values) in enumerate(all_data):
             if i != self.comm.rank:
-                for me in _data:
-                    structures += [Structure(idx=me[0], indices=me[1], values=me[2])]
+                structures += [
+                    Structure(idx=idx, indices=me, values=val)
+                    for idx, me, val in zip(ids.tolist(), indices, values)
+                ]
 
         return structures
 
     @staticmethod
-    def compute_local_dendrogram_pseudo_parallel(data, ntasks, **kwargs):
-        elements_per_task = data.shape[0] // ntasks
-        local_slices = [
+    def get_local_slices(size, ntasks):
+        elements_per_task = size // ntasks
+        return [
             slice(i * elements_per_task, (i + 1) * elements_per_task)
             for i in range(ntasks)
         ]
 
-        local_dendrograms = [
-            Dendrogram.compute(np.array(data[s])) for s in local_slices
-        ]
+    @staticmethod
+    def compute_local_dendrogram_pseudo_parallel(data, ntasks, workers=None, **kwargs):
+        local_slices = DistributedDendrogramV2.get_local_slices(data.shape[0], ntasks)
+
+        if workers is None:
+            local_dendrograms = [
+                Dendrogram.compute(np.array(data[s])) for s in local_slices
+            ]
+        else:
+            local_dendrograms = compute_local_dendrograms(data, local_slices, workers)
 
         for i, dendrogram in enumerate(local_dendrograms):
             for structure in dendrogram.all_structures:
@@ -85,23 +102,15 @@ class DistributedDendrogramV2(Dendrogram):
         return local_dendrograms
 
     @staticmethod
-    def compute_pseudo_parallel(data, ntasks):
+    def compute_pseudo_parallel(data, ntasks, workers=None):
         self = DistributedDendrogramV2()
         self.data = data
 
         local_dendrograms = self.compute_local_dendrogram_pseudo_parallel(
-            data=self.data, ntasks=ntasks
+            data=self.data, ntasks=ntasks, workers=workers
         )
 
-        all_structures = []
-        for d in local_dendrograms:
-            structures = [structure for structure in d.all_structures]
-            offset = len(all_structures)
-            for structure in structures:
-                d.index_map[d.index_map == structure.idx] += offset
-                structure.idx += offset
-
-            all_structures += structures
+        all_structures = relabel_local_structures(local_dendrograms)
 
         self.compute_from_structures(all_structures)
         return self
@@ -141,41 +150,29 @@ class DistributedDendrogramV2(Dendrogram):
         vmax = [structure._vmax for structure in structures]
         return [structures[i] for i in np.argsort(vmax)[::-1]]
 
-    @staticmethod
-    def insert_structure_within(structures, insert):
-        vmax = np.array([structure._vmax for structure in structures])
-        insert_at = np.nonzero(vmax < insert._vmax)[0][0]
-        return structures[:insert_at] + [insert] + structures[insert_at:]
-
     @staticmethod
     def insert_structure(structures, to_insert):
-        if len(structures) == 0:
-            structures = [to_insert]
-        elif to_insert._vmax > structures[0]._vmax:
-            structures = [to_insert] + structures
-        elif to_insert._vmax <= structures[-1]._vmax:
-            structures.append(to_insert)
-        else:
-            structures = DistributedDendrogramV2.insert_structure_within(
-                structures, to_insert
-            )
+        structures.push(to_insert)
         return structures
 
     def compute_from_structures(self, structures):
         merged_structures = []
         self.index_map = -np.ones(np.add(self.data.shape, 1), dtype=np.int32)
+        self._ancestors = DisjointSet()
 
-        structures = self.sort_structures(structures)
+        structures = StructureQueue(self.sort_structures(structures))
 
         self._iterations = 0
         t0 = perf_counter()
         while len(structures) > 0:
             self._iterations += 1
             # print(len(structures), len([me for me in structures if me.idx <0]), self.data.size)
-            to_merge = structures.pop(0)
+            to_merge = structures.pop()
 
             # figure out if we need to break apart the structure
-            vmax_other = structures[0]._vmax if len(structures) > 0 else to_merge._vmin
+            vmax_other = (
+                structures.peek()._vmax if len(structures) > 0 else to_merge._vmin
+            )
             if (
                 vmax_other > to_merge._vmin
                 and vmax_other < to_merge._vmax
@@ -194,7 +191,7 @@ class DistributedDendrogramV2(Dendrogram):
                 to_merge, self.index_map
             )
             ancestor_indices = np.unique(
-                [merged_structures[i].ancestor.idx for i in adjacent_structure_indices]
+                self._ancestors.find(adjacent_structure_indices)
             )
             adjacent_structures = [merged_structures[i] for i in ancestor_indices]
 
@@ -203,7 +200,7 @@ class DistributedDendrogramV2(Dendrogram):
                 leaf = Structure(
                     indices=to_merge._indices,
                     values=to_merge._values,
-                    idx=len(merged_structures),
+                    idx=self._ancestors.add(),
                     children=[],
                     dendrogram=self,
                 )
@@ -211,25 +208,27 @@ class DistributedDendrogramV2(Dendrogram):
                 merged_structures.append(leaf)
             elif len(adjacent_structures) == 1:  # merge into existing structure
                 merge_into = adjacent_structures[0]
-                merge_into._indices = np.vstack(
-                    [merge_into._indices, to_merge._indices]
-                )
-                merge_into._values = np.append(merge_into._values, to_merge._values)
+                merge_into._append_pixels(to_merge._indices, to_merge._values)
                 merge_into._vmin, merge_into._vmax = (
-                    np.min(merge_into._values),
-                    np.max(merge_into._values),
+                    min(merge_into._vmin, to_merge._vmin),
+                    max(merge_into._vmax, to_merge._vmax),
+                )
+                merge_into._smallest_index = min(
+                    merge_into._smallest_index, np.min(to_merge._indices)
                 )
-                merge_into._smallest_index = np.min(merge_into._indices)
                 self.index_map[*to_merge._indices.T] = merge_into.idx
 
             else:  # create new branch
                 branch = Structure(
                     indices=to_merge._indices,
                     values=to_merge._values,
-                    idx=len(merged_structures),
+                    idx=self._ancestors.add(),
                     children=adjacent_structures,
                     dendrogram=self,
                 )
+                self._ancestors.union(
+                    [me.idx for me in adjacent_structures], branch.idx
+                )
                 self.index_map[*branch._indices.T] = branch.idx
                 merged_structures.append(branch)
 
@@ -237,21 +236,7 @@ class DistributedDendrogramV2(Dendrogram):
         t1 = perf_counter()
         self.time_merge_dendrograms = t1 - t0
 
-        self._trunk = [
-            structure for structure in merged_structures if structure.parent is None
-        ]
-
-        # make astrodendro-compatible
-        for structure in merged_structures:
-            structure._level = 0
-            if structure.parent is not None:
-                parent = structure.parent
-                while parent is not None:
-                    structure._level += 1
-                    parent = parent.parent
-
-            structure._values = list(structure._values)
-            structure._indices = [tuple(me) for me in structure._indices]
+        finalize_structures(self, merged_structures)
 
     @staticmethod
     def get_adjacent_structure_indices(structure, index_map):
@@ -260,6 +245,7 @@ class DistributedDendrogramV2(Dendrogram):
         for i in range(idx.shape[1]):
             one = np.zeros((1, idx.shape[1]), dtype=int)
             one[:, i] = 1
-            adjacent += list(index_map[*(idx + one).T])
-            adjacent += list(index_map[*(idx - one).T])
-        return [me for me in np.unique(adjacent) if me >= 0]
+            adjacent += [index_map[*(idx + one).T]]
+            adjacent += [index_map[*(idx - one).T]]
+        adjacent = np.unique(np.concatenate(adjacent))
+        return adjacent[adjacent >= 0]
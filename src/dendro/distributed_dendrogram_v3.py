@@ -1,24 +1,107 @@
 import heat as ht
 import numpy as np
+from mpi4py import MPI
 from time import perf_counter
 import logging
 
 from astrodendro.dendrogram import Dendrogram
 
-from dendro.distributed_dendrogram import Structure
+from dendro.distributed_dendrogram import (
+    CompactStructure,
+    RemoteStructure,
+    Structure,
+    finalize_structures,
+)
+from dendro.boundary import (
+    get_block_faces,
+    get_halo_region,
+    get_slab_faces,
+    pack_halo_structures,
+    pack_structures,
+    summarize_structures,
+)
+from dendro.coordinate_set import CoordinateSet
+from dendro.decomposition import (
+    BlockDecomposition,
+    choose_grid,
+    get_imbalance,
+    get_valid_mask,
+    get_weight_profiles,
+)
+from dendro.exchange import (
+    allgather_structures,
+    bcast_arrays,
+    gather_structures,
+    scatter_arrays,
+)
+from dendro.local_dendrogram import compute_local_dendrogram
+from dendro.process_pool import compute_local_dendrograms
+from dendro.structure_queue import StructureQueue
+from dendro.union_find import DisjointSet
+from dendro.instrumentation import Instrumentation
 
 
 class DistributedDendrogramV3(Dendrogram):
     logger = logging.getLogger("Dendrogram")
     wcs = None
+    comm = None
+    engine = "python"
+    communication = "all"
+    blocks = None
+    halo = 0
+    local_engine = "astrodendro"
+    threads = 1
+    output = "replicated"
+    load_balance = None
+    layout = None
+    _local_block = None
+    instrumentation = Instrumentation()
 
     @staticmethod
-    def compute(data, min_npix=0, min_value="min", min_delta=0, **kwargs):
+    def compute(
+        data,
+        min_npix=0,
+        min_value="min",
+        min_delta=0,
+        engine="python",
+        communication="all",
+        output="replicated",
+        grid=None,
+        balance=False,
+        halo=0,
+        local_engine="astrodendro",
+        threads=1,
+        instrument=False,
+        log=False,
+        **kwargs,
+    ):
         assert isinstance(data, ht.DNDarray)
 
         self = DistributedDendrogramV3()
         self.data = data
         self.comm = data.comm
+        self.engine = engine
+        self.communication = communication
+        self.halo = halo
+        self.local_engine = local_engine
+        self.threads = threads
+        self.output = output
+        self.instrument(instrument, log)
+        if halo > 0 and communication != "boundary":
+            raise NotImplementedError("A halo requires boundary communication")
+        if communication == "summary" and engine != "python":
+            raise NotImplementedError("Summaries require the python engine")
+        if threads > 1 and local_engine != "numba":
+            raise NotImplementedError("Threads require the numba local engine")
+        if threads > 1 and (min_npix > 0 or min_delta > 0):
+            raise NotImplementedError("Threads do not support pruning")
+
+        # a grid with the number of ranks along every axis, where zeros are
+        # chosen automatically, replaces the slabs of the split axis
+        slabs_only = output != "replicated" or communication == "root"
+        if grid == "auto":
+            grid = self.choose_layout(min_value, balance, slabs_only)
+        self.decompose(min_value, grid, balance, slabs_only or halo > 0)
 
         self.params = dict(min_npix=min_npix, min_value=min_value, min_delta=min_delta)
 
@@ -29,14 +112,45 @@ class DistributedDendrogramV3(Dendrogram):
             min_npix=min_npix, min_value=min_value, min_delta=min_delta, **kwargs
         )
 
-        structures = self.communicate_structures(local_dendrogram)
-
-        self.compute_from_structures(structures)
+        if self.communication == "boundary":
+            structures, interior = self.communicate_boundary_structures(
+                local_dendrogram
+            )
+            self.compute_from_structures(structures)
+            self.graft_interior_structures(interior)
+        elif self.communication == "all":
+            structures = self.communicate_structures(local_dendrogram)
+            self.compute_from_structures(structures)
+        elif self.communication == "summary":
+            structures = self.communicate_summaries(local_dendrogram)
+            self.compute_from_structures(structures)
+        elif self.communication == "tree":
+            self.reduce_structures(list(local_dendrogram.all_structures))
+        elif self.communication == "stream":
+            self.stream_structures(list(local_dendrogram.all_structures))
+        elif self.communication == "root":
+            self.merge_on_root(list(local_dendrogram.all_structures))
+        else:
+            raise NotImplementedError(
+                f"Don't know communication mode {self.communication!r}"
+            )
 
-        self.make_output_astrodendro_compatible()
+        if output == "distributed":
+            self.distribute_output()
+        elif output == "replicated" and isinstance(self.index_map, ht.DNDarray):
+            self.gather()
+        elif output == "replicated":
+            self.make_output_astrodendro_compatible()
+        else:
+            raise NotImplementedError(f"Don't know output mode {output!r}")
 
         return self
 
+    def instrument(self, enabled=True, log=False):
+        self.instrumentation = Instrumentation(
+            enabled=enabled, logger=self.logger if log else None
+        )
+
     def make_output_astrodendro_compatible(self):
 
         self.data = self.data.numpy()
@@ -45,82 +159,1016 @@ class DistributedDendrogramV3(Dendrogram):
         s = tuple(slice(0, s, 1) for s in self.data.shape)
         self.index_map = self.index_map[s]
 
+    def choose_layout(self, min_value="min", balance=False, slabs_only=False):
+        """
+        Predict the cost of every process grid from the number of valid voxels
+        along every axis and return the cheapest one. The decision is kept in
+        `layout`.
+        """
+        profiles = get_weight_profiles(self.data, min_value)
+        grid, self.layout = choose_grid(
+            self.data.shape, self.comm.size, profiles, balance, slabs_only
+        )
+
+        stats = self.instrumentation
+        if stats.verbose:
+            stats.log(
+                "Chose process grid %s with predicted cost %.3g.",
+                grid,
+                self.layout["predicted_cost"],
+            )
+        return grid
+
+    def decompose(self, min_value="min", grid=None, balance=False, slabs_only=False):
+        """
+        Distribute the data to the ranks according to the grid. Data that is
+        split along the only axis with more than one rank stays as it is, other
+        slabs are redistributed as split DNDarray and grids with more than one
+        split axis use blocks.
+
+        With `balance`, the cuts are placed such that all ranks get about the
+        same number of valid voxels above `min_value` rather than the same
+        number of rows. The loads of all ranks before and after repartitioning
+        are kept in `load_balance`.
+        """
+        data, comm = self.data, self.comm
+        if grid is None:
+            if data.split is not None and not balance:
+                return
+            grid = [1] * data.ndim
+            grid[0 if data.split is None else data.split] = comm.size
+
+        weights = None
+        if balance:
+            valid = get_valid_mask(data.larray.cpu().numpy(), min_value)
+            loads_before = comm.allgather(int(valid.sum()))
+            weights = get_weight_profiles(data, min_value)
+
+        blocks = BlockDecomposition(data.shape, comm.size, grid, weights)
+        axes = [axis for axis, n in enumerate(blocks.dims) if n > 1]
+        if len(axes) > 1:
+            if slabs_only:
+                raise NotImplementedError(
+                    "Block decomposition is only supported with replicated output"
+                )
+            self.blocks = blocks
+            local = self._local_block = blocks.get_local_block(data)
+        else:
+            axis = axes[0] if axes else (data.split or 0)
+            if axis == data.split and not balance:
+                return
+            local = blocks.get_local_block(data)
+            self.data = ht.array(local, is_split=axis, comm=comm)
+
+        if balance:
+            loads_after = comm.allgather(int(get_valid_mask(local, min_value).sum()))
+            self.load_balance = {
+                "loads_before": loads_before,
+                "loads_after": loads_after,
+                "imbalance_before": get_imbalance(loads_before),
+                "imbalance_after": get_imbalance(loads_after),
+            }
+
+            stats = self.instrumentation
+            if stats.verbose:
+                stats.log(
+                    "Repartitioned the data, which changed the load imbalance from %.2f to %.2f.",
+                    self.load_balance["imbalance_before"],
+                    self.load_balance["imbalance_after"],
+                )
+
+    def get_local_data(self):
+        if self.blocks is None:
+            return self.data.larray.numpy()
+        if self._local_block is None:
+            self._local_block = self.blocks.get_local_block(self.data)
+        return self._local_block
+
+    def get_local_slab(self):
+        s = [slice(0, n) for n in self.data.shape]
+        if self.data.split is not None:
+            counts, offsets = self.data.counts_displs()
+            start = offsets[self.comm.rank]
+            s[self.data.split] = slice(start, start + counts[self.comm.rank])
+        return tuple(s)
+
+    def distribute_output(self):
+        """
+        Keep the data and the index map as split arrays and keep only pixels in
+        the local slab in the structures. The tree and the number of pixels of
+        all structures are known on all ranks. Use `gather` to get a dendrogram
+        that is compatible with astrodendro.
+
+        The tree, stream and root modes only send the tree and the labels of
+        the local pixels back from the root and are distributed already. The
+        other modes merge on every rank, so the local index map is built from
+        the pixels of the merged structures in the local slab and the
+        replicated index map is dropped.
+        """
+        if isinstance(self.index_map, ht.DNDarray):
+            return
+
+        split = self.data.split
+        local_slab = self.get_local_slab()
+        offset = np.array([me.start for me in local_slab])
+        index_map = -np.ones(self.data.lshape, dtype=np.int32)
+        self.index_map = None
+
+        structures = {}
+        for structure in self.all_structures:
+            indices, values = structure._index_array, structure._value_array
+            if split is not None:
+                position = indices[:, split]
+                local = (position >= local_slab[split].start) & (
+                    position < local_slab[split].stop
+                )
+                indices, values = indices[local], values[local]
+            index_map[*(indices - offset).T] = structure.idx
+            me = RemoteStructure(
+                structure.vmin,
+                structure.vmax,
+                structure.get_npix(subtree=False) - len(values),
+                self.data.ndim,
+                idx=structure.idx,
+            )
+            me._indices, me._values = indices, values
+            structures[me.idx] = me
+        self.index_map = ht.array(index_map, is_split=split, comm=self.comm)
+
+        for structure in self.all_structures:
+            structures[structure.idx].children = [
+                structures[child.idx] for child in structure.children
+            ]
+        finalize_structures(self, list(structures.values()))
+
+    def merge_on_root(self, structures, root=0):
+        """
+        Gather the local structures on one rank and merge them there. Only the
+        tree and the labels of the pixels of every rank are sent back, such that
+        the index map and the pixels of the structures stay distributed.
+        """
+        comm = self.comm
+        shape = self.data.shape
+        indices = [np.asarray(me._indices) for me in structures]
+        values = [np.asarray(me._values) for me in structures]
+        gathered = gather_structures(comm, indices, shape, values=values, root=root)
+
+        tree, labels = None, None
+        if comm.rank == root:
+            self.compute_from_structures(
+                [
+                    Structure(idx=idx, indices=me, values=val)
+                    for ids, _indices, _values in gathered
+                    for idx, me, val in zip(ids.tolist(), _indices, _values)
+                ]
+            )
+            tree = self.get_merged_tree()
+
+            # labels of the pixels of every rank in the order they were sent
+            empty = np.zeros((0, len(shape)), dtype=np.int64)
+            labels = [
+                self.index_map[*np.concatenate([empty, *_indices]).T]
+                for _, _indices, _ in gathered
+            ]
+            del gathered
+
+        indices = np.concatenate([np.zeros((0, len(shape)), dtype=np.int64), *indices])
+        values = np.concatenate([np.zeros(0), *values])
+        labels = scatter_arrays(comm, labels, len(values), np.int32, root=root)
+        tree = comm.bcast(tree, root=root)
+        self.set_distributed_structures(*tree, labels, indices, values)
+
+    def get_merged_tree(self):
+        # parents, vmin, vmax and number of pixels of the merged structures
+        merged = list(self._structures_dict.values())
+        return (
+            np.array([-1 if me.parent is None else me.parent.idx for me in merged]),
+            np.array([me.vmin for me in merged]),
+            np.array([me.vmax for me in merged]),
+            np.array([me.get_npix(subtree=False) for me in merged]),
+        )
+
+    def scatter_merged_structures(self, root=0):
+        """
+        Send the tree and the slab of the index map of every rank from the root,
+        which has merged all structures. The pixels of the structures are taken
+        from the local data, such that neither the pixels of all structures nor
+        the full index map are replicated on every rank.
+        """
+        comm = self.comm
+        local_slabs = comm.gather(self.get_local_slab(), root=root)
+
+        tree, slabs = None, None
+        if comm.rank == root:
+            tree = self.get_merged_tree()
+            slabs = [self.index_map[s].ravel() for s in local_slabs]
+            self.index_map = None
+
+        count = int(np.prod(self.data.lshape))
+        labels = scatter_arrays(comm, slabs, count, np.int32, root=root)
+        labels = labels.reshape(self.data.lshape)
+        tree = bcast_arrays(comm, tree, root=root)
+
+        local = labels >= 0
+        offset = np.array([me.start for me in self.get_local_slab()])
+        indices = np.argwhere(local) + offset
+        values = self.data.larray.numpy()[local]
+        self.set_distributed_structures(*tree, labels[local], indices, values)
+
+    def set_distributed_structures(
+        self, parents, vmin, vmax, npix, labels, indices, values
+    ):
+        """
+        Build the index map of the local slab and structures that only keep
+        their pixels in the local slab from the tree and the labels of the
+        local pixels.
+        """
+        local_slab = self.get_local_slab()
+        offset = np.array([me.start for me in local_slab])
+        index_map = -np.ones(self.data.lshape, dtype=np.int32)
+        index_map[*(indices - offset).T] = labels
+        self.index_map = ht.array(index_map, is_split=self.data.split, comm=self.comm)
+
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=len(parents))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        structures = []
+        for idx in range(len(parents)):
+            me = RemoteStructure(
+                vmin[idx], vmax[idx], npix[idx] - counts[idx], self.data.ndim, idx=idx
+            )
+            local = order[offsets[idx] : offsets[idx + 1]]
+            me._indices, me._values = indices[local], values[local]
+            structures.append(me)
+        for idx, parent in enumerate(parents.tolist()):
+            if parent >= 0:
+                structures[parent].children.append(structures[idx])
+
+        finalize_structures(self, structures)
+
+    def gather(self):
+        """
+        Gather the data, the index map and the pixels of all structures on all
+        ranks after computing with distributed output.
+        """
+        if not isinstance(self.index_map, ht.DNDarray):
+            return self
+
+        structures = list(self.all_structures)
+        all_data = allgather_structures(
+            self.comm,
+            [me._index_array for me in structures],
+            self.data.shape,
+            values=[me._value_array for me in structures],
+            ids=[me.idx for me in structures],
+        )
+
+        pixels = {me.idx: ([], []) for me in structures}
+        for ids, indices, values in all_data:
+            for idx, me, val in zip(ids.tolist(), indices, values):
+                pixels[idx][0].append(me)
+                pixels[idx][1].append(val)
+
+        gathered = {}
+        for me in structures:
+            gathered[me.idx] = CompactStructure(
+                indices=np.concatenate(pixels[me.idx][0]),
+                values=np.concatenate(pixels[me.idx][1]),
+                idx=me.idx,
+            )
+        for me in structures:
+            gathered[me.idx].children = [gathered[child.idx] for child in me.children]
+
+        finalize_structures(self, list(gathered.values()))
+        self.index_map = self.index_map.numpy()
+        self.data = self.data.numpy()
+        return self
+
     def compute_local_dendrogram(self, **kwargs):
         data = self.data
         comm = data.comm
 
+        local_data = self.get_local_data()
+        offset = np.zeros((1, data.ndim), dtype=int)
+        if self.halo > 0:
+            # heat exchanges the halos with the neighbouring ranks
+            data.get_halo(self.halo)
+            local_data = data.array_with_halos.cpu().numpy()
+            counts, offsets = data.counts_displs()
+            offset[:, data.split] = get_halo_region(
+                offsets[comm.rank],
+                offsets[comm.rank] + counts[comm.rank],
+                data.shape[data.split],
+                self.halo,
+            )[0]
+        elif self.blocks is None:
+            _, offsets = data.counts_displs()
+            offset[:, data.split] = offsets[comm.rank]
+        else:
+            offset[0] = [s.start for s in self.blocks.get_block(comm.rank)]
+
         t0 = perf_counter()
-        local_dendrogram = Dendrogram.compute(data.larray.numpy(), **kwargs)
+        if self.threads > 1:
+            local_dendrogram = self.compute_threaded_local_dendrogram(
+                local_data, self.threads, **kwargs
+            )
+        else:
+            local_dendrogram = self.get_local_engine(self.local_engine)(
+                local_data, **kwargs
+            )
         t1 = perf_counter()
         self.time_local_dendrogram = t1 - t0
 
         # add offsets to local indices
-        _, offsets = data.counts_displs()
-        offset = np.zeros((1, data.ndim), dtype=int)
-        offset[:, data.split] = offsets[comm.rank]
         for structure in local_dendrogram.all_structures:
             structure._indices = np.array(structure._indices) + offset
 
         return local_dendrogram
 
+    def compute_threaded_local_dendrogram(
+        self, local_data, threads, min_value="min", **kwargs
+    ):
+        """
+        Compute the dendrogram of the local data from sub-slabs along the first
+        axis, which are computed by the numba engine on a pool of `threads`
+        threads and merged through the saddle graph of the planes between them
+        before anything is communicated. Pixels of the returned structures are
+        in local coordinates.
+        """
+        from dendro.distributed_dendrogram_kruskal import DistributedDendrogramKruskal
+        from dendro.process_pool import unflatten_dendrogram
+
+        ntasks = min(threads, local_data.shape[0])
+        if ntasks < 2:
+            return self.get_local_engine(self.local_engine)(
+                local_data, min_value=min_value, **kwargs
+            )
+        merged = DistributedDendrogramKruskal.compute_pseudo_parallel(
+            local_data, ntasks, min_value=min_value, threads=threads
+        )
+
+        # the merge needs structures that keep their pixels as arrays
+        flat = self.flatten_structures(list(merged._structures_dict.values()))
+        dendrogram = unflatten_dendrogram(local_data.shape, *flat)
+        dendrogram.data = local_data
+        return dendrogram
+
     def communicate_structures(self, local_dendrogram):
         structures = [structure for structure in local_dendrogram.all_structures]
 
-        # unpack data from structures for communication
-        raw_data = [
-            (structure.idx, structure._indices, structure._values)
-            for structure in structures
-        ]
-
-        # communicate the data
-        all_raw_data = self.comm.allgather(raw_data)
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.count("sent_pixels", sum(len(me._values) for me in structures))
+
+        # communicate the data as flat buffers
+        all_data = allgather_structures(
+            self.comm,
+            [np.asarray(structure._indices) for structure in structures],
+            self.data.shape,
+            values=[np.asarray(structure._values) for structure in structures],
+            ids=[structure.idx for structure in structures],
+        )
 
         # repack the data into structures
-        for i, _data in enumerate(all_raw_data):
+        for i, (ids, indices, values) in enumerate(all_data):
             if i != self.comm.rank:
-                for me in _data:
-                    structures += [Structure(idx=me[0], indices=me[1], values=me[2])]
+                structures += [
+                    Structure(idx=idx, indices=me, values=val)
+                    for idx, me, val in zip(ids.tolist(), indices, values)
+                ]
 
         return structures
 
+    def communicate_boundary_structures(self, local_dendrogram):
+        counts, offsets = self.data.counts_displs()
+        split, rank = self.data.split, self.comm.rank
+        if self.blocks is not None:
+            faces = self.blocks.get_faces(rank)
+        elif split is None:
+            faces = []
+        else:
+            faces = get_slab_faces(
+                split,
+                offsets[rank],
+                offsets[rank] + counts[rank],
+                self.data.shape[split],
+            )
+
+        if self.halo > 0:
+            cores = [(start, start + n) for start, n in zip(offsets, counts)]
+            boundary, placeholders, summaries, pixels = pack_halo_structures(
+                list(local_dendrogram.all_structures),
+                split,
+                cores,
+                rank,
+                self.data.shape,
+                self.halo,
+            )
+        else:
+            boundary, placeholders, summaries, pixels = pack_structures(
+                list(local_dendrogram.all_structures), faces, self.data.shape
+            )
+        self.count_sent_pixels(boundary, placeholders, summaries)
+
+        all_data = self.comm.allgather((boundary, placeholders, summaries))
+
+        structures = []
+        interior = []
+        for i, (_boundary, _placeholders, _summaries) in enumerate(all_data):
+            structures += self.unpack_structures(_boundary, _placeholders)
+            interior.append((_placeholders, _summaries, pixels if i == rank else None))
+        return structures, interior
+
+    def reduce_structures(self, structures):
+        """
+        Merge the local dendrograms in log2(P) rounds. In every round, pairs of
+        ranks that own adjacent slabs merge their partial dendrograms and half of
+        the ranks drop out. The first rank broadcasts the result.
+
+        `time_merge_dendrograms` is the time this rank spent merging, which is
+        zero on ranks that only send.
+        """
+        comm = self.comm
+        stats = self.instrumentation
+
+        t0 = perf_counter()
+        time_merge = 0.0
+        if comm.size == 1:
+            self.compute_from_structures(structures)
+            time_merge = self.time_merge_dendrograms
+
+        step = 1
+        while step < comm.size:
+            if comm.rank % (2 * step) == step:
+                comm.send(self.pack_partial_structures(structures), comm.rank - step)
+                break
+            if comm.rank + step < comm.size:
+                received = comm.recv(source=comm.rank + step)
+                structures = self.merge_partial_dendrograms(
+                    structures, self.unpack_structures(received, [])
+                )
+                time_merge += self.time_merge_dendrograms
+                if stats.enabled:
+                    stats.count("reduction_rounds")
+            step *= 2
+
+        self.share_merged_structures(root=0)
+        self.time_merge_dendrograms = time_merge
+        t1 = perf_counter()
+
+        if stats.enabled:
+            stats.add_time("reduction", t1 - t0)
+            self.statistics = stats.as_dict()
+
+    def stream_structures(self, structures, root=0):
+        """
+        Merge the local dendrograms on the root in the order in which they
+        arrive. Every other rank posts its structures with a non-blocking send
+        as soon as its local dendrogram is ready, so the root merges the partial
+        dendrograms of fast ranks while slow ranks are still computing. The root
+        broadcasts the result.
+
+        The overlap is the time the root spent merging before the last receive
+        completed, measured with the clock of the root only. The ranks in the
+        order in which their structures arrived are recorded as `arrivals`.
+        """
+        comm = self.comm
+        stats = self.instrumentation
+
+        t0 = perf_counter()
+        request = None
+        time_merge = 0.0
+        self.arrivals = []
+        if comm.rank != root:
+            request = comm.handle.isend(
+                self.pack_partial_structures(structures), dest=root
+            )
+            t1 = perf_counter()
+            if stats.enabled:
+                stats.add_time("post", t1 - t0)
+        else:
+            if comm.size == 1:
+                self.compute_from_structures(structures)
+                time_merge = self.time_merge_dendrograms
+
+            last_received, merges = t0, []
+            status = MPI.Status()
+            for _ in range(comm.size - 1):
+                t1 = perf_counter()
+                received = comm.handle.recv(source=MPI.ANY_SOURCE, status=status)
+                t2 = last_received = perf_counter()
+                structures = self.merge_partial_dendrograms(
+                    structures, self.unpack_structures(received, [])
+                )
+                t3 = perf_counter()
+                merges.append((t2, t3))
+                time_merge += self.time_merge_dendrograms
+                self.arrivals.append(status.source)
+                if stats.enabled:
+                    stats.add_time("wait", t2 - t1)
+                    stats.add_time("stream_merge", t3 - t2)
+
+            if stats.enabled:
+                stats.add_time(
+                    "overlap",
+                    sum(
+                        max(0.0, min(end, last_received) - start)
+                        for start, end in merges
+                    ),
+                )
+
+        t1 = perf_counter()
+        self.share_merged_structures(root=root)
+        self.time_merge_dendrograms = time_merge
+        if request is not None:
+            request.wait()
+        t2 = perf_counter()
+
+        if stats.enabled:
+            stats.add_time("local", self.time_local_dendrogram)
+            stats.add_time("broadcast", t2 - t1)
+            stats.add_time("stream", t2 - t0)
+            self.statistics = stats.as_dict()
+            self.statistics["rank_timers"] = comm.allgather(dict(stats.timers))
+
+    def share_merged_structures(self, root=0):
+        if self.output == "distributed":
+            self.scatter_merged_structures(root=root)
+        else:
+            self.broadcast_merged_structures(root=root)
+
+    def broadcast_merged_structures(self, root=0):
+        # the flat arrays are sent as buffers instead of one pickled object
+        flat = None
+        if self.comm.rank == root:
+            flat = self.flatten_structures(list(self._structures_dict.values()))
+        flat = bcast_arrays(self.comm, flat, root=root)
+        if self.comm.rank != root:
+            self.set_structures_from_flat(*flat)
+
+    def merge_partial_dendrograms(self, structures, other):
+        # merged structures are a valid input for merging with neighbouring slabs
+        self.compute_from_structures(structures + other)
+        return [
+            Structure(idx=me.idx, indices=me._index_array, values=me._value_array)
+            for me in self._structures_dict.values()
+        ]
+
     @staticmethod
-    def compute_local_dendrogram_pseudo_parallel(
-        data, ntasks, min_npix=0, min_value="min", min_delta=0, **kwargs
-    ):
-        elements_per_task = data.shape[0] // ntasks
+    def pack_partial_structures(structures):
+        return [
+            (me.idx, np.asarray(me._indices), np.asarray(me._values))
+            for me in structures
+        ]
+
+    @staticmethod
+    def flatten_structures(structures):
+        # structures need to be labelled by their position
+        parents = np.array(
+            [-1 if me.parent is None else me.parent.idx for me in structures],
+            dtype=np.int64,
+        )
+        counts = [len(me._value_array) for me in structures]
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        indices = np.concatenate([me._index_array for me in structures])
+        values = np.concatenate([me._value_array for me in structures])
+        return parents, offsets, indices, values
+
+    def set_structures_from_flat(self, parents, offsets, indices, values):
+        labels = np.repeat(np.arange(len(parents)), np.diff(offsets))
+        self.index_map = -np.ones(np.add(self.data.shape, 1), dtype=np.int32)
+        self.index_map[*indices.T] = labels
+        self.build_structures(parents, offsets, indices, values)
+
+    def build_structures(self, parents, offsets, indices, values):
+        children = [[] for _ in parents]
+        for idx, parent in enumerate(parents.tolist()):
+            if parent >= 0:
+                children[parent].append(idx)
+
+        # children are always merged before their parents
+        merged_structures = []
+        for idx in range(len(parents)):
+            merged_structures.append(
+                CompactStructure(
+                    indices=indices[offsets[idx] : offsets[idx + 1]],
+                    values=values[offsets[idx] : offsets[idx + 1]],
+                    idx=idx,
+                    children=[merged_structures[me] for me in children[idx]],
+                    dendrogram=self,
+                )
+            )
+
+        finalize_structures(self, merged_structures)
+        return merged_structures
+
+    def communicate_summaries(self, local_dendrogram):
+        """
+        Send summaries of all local structures to all ranks. The pixels that
+        are not part of the summaries stay on this rank until a structure needs
+        to be split.
+        """
+        rank = self.comm.rank
+        if self.blocks is None:
+            block = self.get_local_slab()
+        else:
+            block = self.blocks.get_block(rank)
+        summaries, pixels = summarize_structures(
+            list(local_dendrogram.all_structures), rank, self.data.shape, block
+        )
+        self._summary_pixels = {(rank, idx): me for idx, me in pixels.items()}
+        self.count_summaries(summaries)
+
+        all_summaries = self.comm.allgather(summaries)
+        return [
+            me for summaries in all_summaries for me in self.unpack_summaries(summaries)
+        ]
+
+    @staticmethod
+    def unpack_summaries(summaries):
+        structures = []
+        for summary in summaries:
+            structure = Structure(
+                idx=summary.idx, indices=summary.indices, values=summary.values
+            )
+            structure._vmin, structure._vmax = summary.vmin, summary.vmax
+            structure._summaries = (summary,)
+            structures.append(structure)
+        return structures
+
+    def count_summaries(self, summaries):
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.count("sent_summaries", len(summaries))
+            stats.count("sent_rim_pixels", sum(len(me.values) for me in summaries))
+            stats.count(
+                "kept_pixels", sum(me.npix - len(me.values) for me in summaries)
+            )
+
+    def fetch_pixels(self, summary):
+        """
+        Pixels of a summarized structure apart from its rim. All ranks merge the
+        same structures in the same order, so the owner broadcasts them.
+        """
+        key = (summary.rank, summary.idx)
+        if self.comm is None:
+            indices, values = self._summary_pixels[key]
+        else:
+            indices, values = self.comm.bcast(
+                self._summary_pixels.get(key), root=summary.rank
+            )
+
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.count("fetched_structures")
+            stats.count("fetched_pixels", len(values))
+        return indices, values
+
+    def complete_structure(self, structure, in_index_map=False):
+        # a structure needs all of its pixels before it can be split
+        for summary in getattr(structure, "_summaries", ()):
+            if summary.npix == len(summary.values):
+                continue
+            indices, values = self.fetch_pixels(summary)
+            structure._append_pixels(indices, values)
+            if in_index_map:
+                self.index_map[*indices.T] = structure.idx
+        structure._summaries = ()
+
+    @staticmethod
+    def carry_summaries(source, structure):
+        # the value range of summarized structures is only known from the summary
+        if len(getattr(source, "_summaries", ())) > 0:
+            structure._summaries = source._summaries
+            structure._vmin = min(structure._vmin, source._vmin)
+            structure._vmax = max(structure._vmax, source._vmax)
+
+    def fill_summarized_structures(self, structures):
+        """
+        Add the pixels of summaries that were never split to the merged
+        structures. With replicated output, the ranks that own these pixels
+        send them to all ranks now. With distributed output, pixels of other
+        ranks are only counted, which makes the structure a remote structure.
+        """
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.counters["merge_pixels"] = sum(len(me._values) for me in structures)
+
+        pixels = self._summary_pixels
+        if self.comm is not None and self.output != "distributed":
+            pixels = self.gather_summary_pixels(structures)
+
+        filled = []
+        for structure in structures:
+            summaries = structure._summaries
+            if len(summaries) == 0:
+                filled.append(structure)
+                continue
+
+            remote = 0
+            vmin = min(np.min(structure._values), *[me.vmin for me in summaries])
+            vmax = max(np.max(structure._values), *[me.vmax for me in summaries])
+            for summary in summaries:
+                key = (summary.rank, summary.idx)
+                if key in pixels:
+                    indices, values = pixels[key]
+                    structure._append_pixels(indices, values)
+                    self.index_map[*indices.T] = structure.idx
+                else:
+                    remote += summary.npix - len(summary.values)
+            structure._summaries = ()
+
+            if remote > 0:
+                me = RemoteStructure(
+                    vmin, vmax, remote, self.data.ndim, idx=structure.idx
+                )
+                me._indices, me._values = structure._indices, structure._values
+                me.children = structure.children
+                structure = me
+            filled.append(structure)
+
+        return filled
+
+    def gather_summary_pixels(self, structures):
+        # pixels of the summaries that were never split from the ranks that own them
+        rank = self.comm.rank
+        ids = [
+            me.idx
+            for structure in structures
+            for me in structure._summaries
+            if me.rank == rank and me.npix > len(me.values)
+        ]
+        all_data = allgather_structures(
+            self.comm,
+            [self._summary_pixels[(rank, idx)][0] for idx in ids],
+            self.data.shape,
+            values=[self._summary_pixels[(rank, idx)][1] for idx in ids],
+            ids=ids,
+        )
+
+        pixels = dict(self._summary_pixels)
+        for i, (_ids, indices, values) in enumerate(all_data):
+            for idx, me, val in zip(_ids.tolist(), indices, values):
+                pixels[(i, idx)] = (me, val)
+        return pixels
+
+    @staticmethod
+    def unpack_structures(boundary, placeholders):
+        # subtrees without rim cover everything and need no placeholder
+        return [
+            Structure(idx=me[0], indices=me[1], values=me[2])
+            for me in boundary + placeholders
+            if len(me[2]) > 0
+        ]
+
+    def count_sent_pixels(self, boundary, placeholders, summaries):
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.count("sent_boundary_pixels", sum(len(me[2]) for me in boundary))
+            stats.count("sent_rim_pixels", sum(len(me[2]) for me in placeholders))
+            stats.count("sent_summaries", len(summaries))
+
+    def graft_interior_structures(self, interior):
+        """
+        Replace the placeholders in the merged dendrogram by the interior
+        subtrees that they stand for. Structures of other ranks are only known
+        by their summaries and are inserted as remote structures.
+        """
+        ndim = self.index_map.ndim
+        merged = list(self._structures_dict.values())
+        replaced = {}
+        grafted = []
+        own = []
+        for rank, (placeholders, summaries, pixels) in enumerate(interior):
+            created = {}
+            for idx, parent, vmin, vmax, npix in summaries:
+                if pixels is None:
+                    structure = RemoteStructure(vmin, vmax, npix, ndim, rank=rank)
+                else:
+                    structure = CompactStructure(*pixels[idx], idx=idx)
+                    structure.children = []
+                    own.append(structure)
+                if parent >= 0:
+                    structure.parent = created[parent]
+                    created[parent].children.append(structure)
+                created[idx] = structure
+            grafted += list(created.values())
+
+            for idx, rim, _ in placeholders:
+                if len(rim) == 0:
+                    continue
+                label = self.index_map[tuple(rim[0])]
+                replaced[label] = (created[idx], rim)
+
+        for label, (structure, rim) in replaced.items():
+            placeholder = merged[label]
+            structure.parent = placeholder.parent
+            if placeholder.parent is not None:
+                siblings = placeholder.parent.children
+                siblings[siblings.index(placeholder)] = structure
+            for child in placeholder.children:
+                child.parent = structure
+            structure.children += placeholder.children
+
+            # keep pixels that were merged into the placeholder
+            extra = ~CoordinateSet(rim).contains(placeholder._index_array)
+            if np.any(extra):
+                structure._indices = np.concatenate(
+                    [structure._index_array, placeholder._index_array[extra]]
+                )
+                structure._values = np.concatenate(
+                    [structure._value_array, placeholder._value_array[extra]]
+                )
+                structure._vmin = min(structure._vmin, placeholder._vmin)
+            if isinstance(structure, RemoteStructure):
+                self.index_map[*rim.T] = -1
+
+        kept = [me for me in merged if me.idx not in replaced]
+        structures = kept + grafted
+
+        # relabel all structures and the index map
+        labels = -np.ones(len(merged) + 1, dtype=self.index_map.dtype)
+        labels[[me.idx for me in kept]] = np.arange(len(kept))
+        position = {id(me): len(kept) + i for i, me in enumerate(grafted)}
+        for label, (structure, _) in replaced.items():
+            labels[label] = position[id(structure)]
+        self.index_map = labels[self.index_map]
+
+        for idx, structure in enumerate(structures):
+            structure.idx = idx
+            structure._dendrogram = self
+        for structure in own:
+            self.index_map[*structure._index_array.T] = structure.idx
+
+        finalize_structures(self, structures)
+
+    @staticmethod
+    def get_local_slices(size, ntasks):
+        elements_per_task = size // ntasks
         local_slices = [
             slice(i * elements_per_task, (i + 1) * elements_per_task)
             for i in range(ntasks)
         ]
-        local_slices[-1] = slice(local_slices[-1].start, None)
-
-        local_dendrograms = [
-            Dendrogram.compute(
-                np.array(data[s]),
-                min_npix=min_npix,
-                min_value=min_value,
-                min_delta=min_delta,
+        local_slices[-1] = slice(local_slices[-1].start, size)
+        return local_slices
+
+    @staticmethod
+    def get_local_blocks(shape, ntasks, grid=None, halo=0):
+        # slabs along the first axis, which may be extended by a halo, unless a
+        # grid is given
+        if grid is None:
+            return [
+                (slice(*get_halo_region(s.start, s.stop, shape[0], halo)), *rest)
+                for s in DistributedDendrogramV3.get_local_slices(shape[0], ntasks)
+                for rest in [[slice(0, n) for n in shape[1:]]]
+            ]
+        blocks = BlockDecomposition(shape, ntasks, grid)
+        return [blocks.get_block(rank) for rank in range(ntasks)]
+
+    @staticmethod
+    def get_local_engine(local_engine):
+        if local_engine == "astrodendro":
+            return Dendrogram.compute
+        elif local_engine == "numba":
+            return compute_local_dendrogram
+        raise NotImplementedError(f"Don't know local engine {local_engine!r}")
+
+    @staticmethod
+    def compute_local_dendrogram_pseudo_parallel(
+        data,
+        ntasks,
+        min_npix=0,
+        min_value="min",
+        min_delta=0,
+        grid=None,
+        halo=0,
+        workers=None,
+        local_engine="astrodendro",
+        **kwargs,
+    ):
+        local_blocks = DistributedDendrogramV3.get_local_blocks(
+            data.shape, ntasks, grid, halo
+        )
+
+        params = dict(min_npix=min_npix, min_value=min_value, min_delta=min_delta)
+        if workers is None:
+            compute = DistributedDendrogramV3.get_local_engine(local_engine)
+            local_dendrograms = [
+                compute(np.array(data[s]), **params) for s in local_blocks
+            ]
+        else:
+            local_dendrograms = compute_local_dendrograms(
+                data, local_blocks, workers, local_engine, **params
             )
-            for s in local_slices
-        ]
 
         for i, dendrogram in enumerate(local_dendrograms):
+            offset = np.array([[s.start for s in local_blocks[i]]])
             for structure in dendrogram.all_structures:
-                offset = np.zeros((1, data.ndim), int)
-                offset[:, 0] = local_slices[i].start
                 structure._indices = np.array(structure._indices) + offset
 
         return local_dendrograms
 
     @staticmethod
-    def compute_pseudo_parallel(data, ntasks):
+    def compute_pseudo_parallel(
+        data,
+        ntasks,
+        engine="python",
+        communication="all",
+        grid=None,
+        halo=0,
+        workers=None,
+        local_engine="astrodendro",
+        instrument=False,
+        log=False,
+    ):
         self = DistributedDendrogramV3()
         self.data = data
+        self.engine = engine
+        self.communication = communication
+        self.halo = halo
+        self.local_engine = local_engine
+        self.instrument(instrument, log)
+        if halo > 0 and (communication != "boundary" or grid is not None):
+            raise NotImplementedError("A halo requires boundary communication")
+        if communication == "summary" and engine != "python":
+            raise NotImplementedError("Summaries require the python engine")
 
         local_dendrograms = self.compute_local_dendrogram_pseudo_parallel(
-            data=self.data, ntasks=ntasks
+            data=self.data,
+            ntasks=ntasks,
+            grid=grid,
+            halo=halo,
+            workers=workers,
+            local_engine=local_engine,
         )
 
+        if communication == "boundary":
+            # every task owns its interior structures, so the result is complete
+            structures = []
+            interior = []
+            local_blocks = self.get_local_blocks(data.shape, ntasks, grid)
+            cores = [(block[0].start, block[0].stop) for block in local_blocks]
+            for rank, (d, block) in enumerate(zip(local_dendrograms, local_blocks)):
+                if halo > 0:
+                    boundary, placeholders, summaries, pixels = pack_halo_structures(
+                        list(d.all_structures), 0, cores, rank, data.shape, halo
+                    )
+                else:
+                    faces = get_block_faces(block, data.shape)
+                    boundary, placeholders, summaries, pixels = pack_structures(
+                        list(d.all_structures), faces, data.shape
+                    )
+                self.count_sent_pixels(boundary, placeholders, summaries)
+                structures += self.unpack_structures(boundary, placeholders)
+                interior.append((placeholders, summaries, pixels))
+
+            self.compute_from_structures(structures)
+            self.graft_interior_structures(interior)
+            return self
+
+        if communication == "summary":
+            # every task owns the pixels of its structures apart from the rims
+            structures = []
+            self._summary_pixels = {}
+            local_blocks = self.get_local_blocks(data.shape, ntasks, grid)
+            for rank, (d, block) in enumerate(zip(local_dendrograms, local_blocks)):
+                summaries, pixels = summarize_structures(
+                    list(d.all_structures), rank, data.shape, block
+                )
+                self._summary_pixels.update(
+                    {(rank, idx): me for idx, me in pixels.items()}
+                )
+                self.count_summaries(summaries)
+                structures += self.unpack_summaries(summaries)
+
+            self.compute_from_structures(structures)
+            return self
+
+        if communication == "tree":
+            # same pairing of tasks as in the reduction across ranks
+            parts = [list(d.all_structures) for d in local_dendrograms]
+            if ntasks == 1:
+                self.compute_from_structures(parts[0])
+            step = 1
+            while step < ntasks:
+                for rank in range(0, ntasks - step, 2 * step):
+                    parts[rank] = self.merge_partial_dendrograms(
+                        parts[rank], parts[rank + step]
+                    )
+                step *= 2
+            return self
+
+        if communication == "stream":
+            # the last tasks arrive first, so slabs that are not adjacent are
+            # merged before the gaps between them are filled
+            merged = list(local_dendrograms[0].all_structures)
+            if ntasks == 1:
+                self.compute_from_structures(merged)
+            for d in local_dendrograms[:0:-1]:
+                merged = self.merge_partial_dendrograms(merged, list(d.all_structures))
+            return self
+
         all_structures = []
         for d in local_dendrograms:
             structures = [structure for structure in d.all_structures]
@@ -141,15 +1189,29 @@ class DistributedDendrogramV3(Dendrogram):
         return self._uid
 
     def merge_structures(self, to_merge, merge_into):
-        merge_into._indices = np.vstack([merge_into._indices, to_merge._indices])
-        merge_into._values = np.append(merge_into._values, to_merge._values)
+        merge_into._append_pixels(to_merge._indices, to_merge._values)
+        merge_into._summaries += getattr(to_merge, "_summaries", ())
         merge_into._vmin = min([merge_into._vmin, to_merge._vmin])
         merge_into._vmax = min([merge_into._vmax, to_merge._vmax])
-        merge_into._smallest_index = np.min(merge_into._indices)
-        self.index_map[*to_merge._indices.T] = merge_into.idx
-        self.logger.info(
-            f"Merged {len(to_merge._values)} values between {to_merge._vmin:.2f} and {to_merge._vmax:.2f} into existing structure {merge_into.idx}, which now has {len(merge_into._values)} values between {merge_into._vmin:.2f} and {merge_into._vmax:.2f}"
+        merge_into._smallest_index = min(
+            merge_into._smallest_index, np.min(to_merge._indices)
         )
+        self.index_map[*to_merge._indices.T] = merge_into.idx
+
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.count("merges")
+            if stats.verbose:
+                stats.log(
+                    "Merged %d values between %.2f and %.2f into existing structure %d, which now has %d values between %.2f and %.2f",
+                    len(to_merge._values),
+                    to_merge._vmin,
+                    to_merge._vmax,
+                    merge_into.idx,
+                    merge_into.get_npix(subtree=False),
+                    merge_into._vmin,
+                    merge_into._vmax,
+                )
 
     def split_structure(self, structure, split_at, structures):
 
@@ -172,9 +1234,22 @@ class DistributedDendrogramV3(Dendrogram):
         structure._vmin = np.min(structure._values)
         structure._vmax = np.max(structure._values)
 
-        self.logger.info(
-            f"Split structure {structure.idx} at {split_at:.2f}. Remaining top part has {len(structure._values)} values between {structure._vmin:.2f} and {structure._vmax:.2f} and {len(structure._children)} children, bottom part has {len(bottom_part._values)} values between {bottom_part._vmin:.2f} to {bottom_part._vmax:.2f}."
-        )
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.count("splits")
+            if stats.verbose:
+                stats.log(
+                    "Split structure %d at %.2f. Remaining top part has %d values between %.2f and %.2f and %d children, bottom part has %d values between %.2f to %.2f.",
+                    structure.idx,
+                    split_at,
+                    len(structure._values),
+                    structure._vmin,
+                    structure._vmax,
+                    len(structure._children),
+                    len(bottom_part._values),
+                    bottom_part._vmin,
+                    bottom_part._vmax,
+                )
         return structure, bottom_part
 
     @staticmethod
@@ -182,38 +1257,33 @@ class DistributedDendrogramV3(Dendrogram):
         vmax = [structure._vmax for structure in structures]
         return [structures[i] for i in np.argsort(vmax)[::-1]]
 
-    @staticmethod
-    def insert_structure_within(structures, insert):
-        vmax = np.array([structure._vmax for structure in structures])
-        insert_at = np.nonzero(vmax < insert._vmax)[0][0]
-        return structures[:insert_at] + [insert] + structures[insert_at:]
-
-    @staticmethod
-    def insert_structure(structures, to_insert):
-        if len(structures) == 0:
-            structures = [to_insert]
-        elif to_insert._vmax > structures[0]._vmax:
-            structures = [to_insert] + structures
-        elif to_insert._vmax <= structures[-1]._vmax:
-            structures.append(to_insert)
-        else:
-            structures = DistributedDendrogramV3.insert_structure_within(
-                structures, to_insert
-            )
-        DistributedDendrogramV3.logger.info(
-            f"Inserted structure with {len(to_insert._values)} values between {to_insert._vmin:.2f} and {to_insert._vmax:.2f} into list of {len(structures)} remaining structures."
-        )
+    def insert_structure(self, structures, to_insert):
+        structures.push(to_insert)
+
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.count("insertions")
+            if stats.verbose:
+                stats.log(
+                    "Inserted structure with %d values between %.2f and %.2f into list of %d remaining structures.",
+                    len(to_insert._values),
+                    to_insert._vmin,
+                    to_insert._vmax,
+                    len(structures),
+                )
         return structures
 
     def split_adjacent_structures(self, to_merge, adjacent_structures, structures):
         for i, adjacent in enumerate(adjacent_structures):
             if to_merge._vmin < adjacent._vmin < to_merge._vmax:
+                self.complete_structure(to_merge)
                 to_merge, bottom_part = self.split_structure(
                     to_merge, adjacent._vmin, structures
                 )
                 structures = self.insert_structure(structures, bottom_part)
 
             if adjacent._vmin < to_merge._vmin < adjacent._vmax:
+                self.complete_structure(adjacent, in_index_map=True)
                 adjacent_structures[i], bottom_part = self.split_structure(
                     adjacent, to_merge._vmin, structures
                 )
@@ -221,6 +1291,7 @@ class DistributedDendrogramV3(Dendrogram):
                 self.index_map[*bottom_part._indices.T] = -1
 
             if adjacent._vmin < to_merge._vmax < adjacent._vmax:
+                self.complete_structure(adjacent, in_index_map=True)
                 adjacent_structures[i], bottom_part = self.split_structure(
                     adjacent, to_merge._vmax, structures
                 )
@@ -236,15 +1307,25 @@ class DistributedDendrogramV3(Dendrogram):
             leaf = Structure(
                 indices=to_merge._indices,
                 values=to_merge._values,
-                idx=len(merged_structures),
+                idx=self._ancestors.add(),
                 children=[],
                 dendrogram=self,
             )
+            self.carry_summaries(to_merge, leaf)
             self.index_map[*leaf._indices.T] = leaf.idx
             merged_structures.append(leaf)
-            self.logger.info(
-                f"Created new leaf with index {leaf.idx} and {len(leaf._values)} values between {leaf._vmin:.2f} and {leaf._vmax:.2f}."
-            )
+
+            stats = self.instrumentation
+            if stats.enabled:
+                stats.count("leaves")
+                if stats.verbose:
+                    stats.log(
+                        "Created new leaf with index %d and %d values between %.2f and %.2f.",
+                        leaf.idx,
+                        len(leaf._values),
+                        leaf._vmin,
+                        leaf._vmax,
+                    )
         elif len(adjacent_structures) == 1:  # merge into existing structure
             merge_into = adjacent_structures[0]
             self.merge_structures(to_merge=to_merge, merge_into=merge_into)
@@ -253,45 +1334,76 @@ class DistributedDendrogramV3(Dendrogram):
             branch = Structure(
                 indices=to_merge._indices,
                 values=to_merge._values,
-                idx=len(merged_structures),
+                idx=self._ancestors.add(),
                 children=adjacent_structures,
                 dendrogram=self,
             )
+            self.carry_summaries(to_merge, branch)
+            self._ancestors.union([me.idx for me in adjacent_structures], branch.idx)
             self.index_map[*branch._indices.T] = branch.idx
             merged_structures.append(branch)
-            self.logger.info(
-                f"Created branch with index {branch.idx} and {len(branch._values)} values between {branch._vmin:.2f} and {branch._vmax:.2f} and {len(branch._children)} children : {[me.idx for me in branch._children]}."
-            )
+
+            stats = self.instrumentation
+            if stats.enabled:
+                stats.count("branches")
+                if stats.verbose:
+                    stats.log(
+                        "Created branch with index %d and %d values between %.2f and %.2f and %d children : %s.",
+                        branch.idx,
+                        len(branch._values),
+                        branch._vmin,
+                        branch._vmax,
+                        len(branch._children),
+                        [me.idx for me in branch._children],
+                    )
         return merged_structures, structures
 
     def compute_from_structures(self, structures):
-        self.logger.info(
-            f"Start merging {len(structures)} structures from local dendrograms into one global one."
-        )
+        stats = self.instrumentation
+        if stats.verbose:
+            stats.log(
+                "Start merging %d structures from local dendrograms into one global one.",
+                len(structures),
+            )
+        if self.engine == "numba":
+            return self.compute_from_structures_numba(structures)
+        elif self.engine != "python":
+            raise NotImplementedError(f"Don't know engine {self.engine!r}")
 
         merged_structures = []
         self.index_map = -np.ones(np.add(self.data.shape, 1), dtype=np.int32)
+        self._ancestors = DisjointSet()
 
-        structures = self.sort_structures(structures)
+        structures = StructureQueue(self.sort_structures(structures))
 
         self._iterations = 0
         t0 = perf_counter()
         while len(structures) > 0:
             self._iterations += 1
-            self.logger.info(
-                f"--- Iteration {self._iterations}. Merged {len(merged_structures)} / {len(structures) + len(merged_structures)}."
-            )
+            if stats.verbose:
+                stats.log(
+                    "--- Iteration %d. Merged %d / %d.",
+                    self._iterations,
+                    len(merged_structures),
+                    len(structures) + len(merged_structures),
+                )
 
-            to_merge = structures.pop(0)
+            to_merge = structures.pop()
 
             # find adjacent structures
             adjacent_structures = self.get_adjacent_structures(
                 to_merge, merged_structures, self.index_map
             )
 
-            self.logger.info(
-                f"Merging structure with {len(to_merge._values)} values between {to_merge._vmin:.2f} and {to_merge._vmax:.2f} with {len(adjacent_structures)} adjacent structures: {[me.idx for me in adjacent_structures]}."
-            )
+            if stats.verbose:
+                stats.log(
+                    "Merging structure with %d values between %.2f and %.2f with %d adjacent structures: %s.",
+                    len(to_merge._values),
+                    to_merge._vmin,
+                    to_merge._vmax,
+                    len(adjacent_structures),
+                    [me.idx for me in adjacent_structures],
+                )
 
             # split structures if needed
             to_merge, adjacent_structures, structures = self.split_adjacent_structures(
@@ -311,21 +1423,45 @@ class DistributedDendrogramV3(Dendrogram):
         t1 = perf_counter()
         self.time_merge_dendrograms = t1 - t0
 
-        self._trunk = [
-            structure for structure in merged_structures if structure.parent is None
-        ]
+        if self.communication == "summary":
+            merged_structures = self.fill_summarized_structures(merged_structures)
+        finalize_structures(self, merged_structures)
+        self.record_statistics()
 
-        # make astrodendro-compatible
-        for structure in merged_structures:
-            structure._level = 0
-            if structure.parent is not None:
-                parent = structure.parent
-                while parent is not None:
-                    structure._level += 1
-                    parent = parent.parent
+    def record_statistics(self):
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.counters["iterations"] = self._iterations
+            stats.timers["merge"] = self.time_merge_dendrograms
+            self.statistics = stats.as_dict()
 
-            structure._values = list(structure._values)
-            structure._indices = [tuple(me) for me in structure._indices]
+    def compute_from_structures_numba(self, structures):
+        from dendro.merge_kernel import merge_flat_structures
+
+        structures = self.sort_structures(structures)
+
+        t0 = perf_counter()
+        self.index_map, parents, offsets, indices, values, self._iterations = (
+            merge_flat_structures(
+                [np.asarray(me._indices) for me in structures],
+                [np.asarray(me._values) for me in structures],
+                self.data.shape,
+            )
+        )
+        t1 = perf_counter()
+        self.time_merge_dendrograms = t1 - t0
+
+        merged_structures = self.build_structures(parents, offsets, indices, values)
+        self.record_statistics()
+
+        stats = self.instrumentation
+        if stats.verbose:
+            stats.log(
+                "Merged %d structures into %d in %d iterations.",
+                len(structures),
+                len(merged_structures),
+                self._iterations,
+            )
 
     @staticmethod
     def get_adjacent_structure_indices(structure, index_map):
@@ -334,16 +1470,22 @@ class DistributedDendrogramV3(Dendrogram):
         for i in range(idx.shape[1]):
             one = np.zeros((1, idx.shape[1]), dtype=int)
             one[:, i] = 1
-            adjacent += list(index_map[*(idx + one).T])
-            adjacent += list(index_map[*(idx - one).T])
-        return [me for me in np.unique(adjacent) if me >= 0]
-
-    @staticmethod
-    def get_adjacent_structures(structure, merged_structures, index_map):
-        adjacent_structure_indices = (
-            DistributedDendrogramV3.get_adjacent_structure_indices(structure, index_map)
-        )
-        ancestor_indices = np.unique(
-            [merged_structures[i].ancestor.idx for i in adjacent_structure_indices]
+            adjacent += [index_map[*(idx + one).T]]
+            adjacent += [index_map[*(idx - one).T]]
+        adjacent = np.unique(np.concatenate(adjacent))
+        return adjacent[adjacent >= 0]
+
+    def get_adjacent_structures(self, structure, merged_structures, index_map):
+        stats = self.instrumentation
+        if stats.enabled:
+            t0 = perf_counter()
+
+        adjacent_structure_indices = self.get_adjacent_structure_indices(
+            structure, index_map
         )
+        ancestor_indices = np.unique(self._ancestors.find(adjacent_structure_indices))
+
+        if stats.enabled:
+            stats.count("adjacency_queries")
+            stats.add_time("adjacency_query", perf_counter() - t0)
         return [merged_structures[i] for i in ancestor_indices]
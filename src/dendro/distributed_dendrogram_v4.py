@@ -5,10 +5,20 @@ from time import perf_counter
 import logging
 
 from astrodendro.dendrogram import Dendrogram
-from astrodendro.structure import Structure as astrodendro_structure
 
+from dendro.distributed_dendrogram import (
+    CompactStructure,
+    Structure,
+    finalize_structures,
+    relabel_local_structures,
+)
+from dendro.exchange import allgather_structures
+from dendro.process_pool import compute_local_dendrograms
+from dendro.structure_queue import StructureQueue
+from dendro.union_find import DisjointSet
 
-class TorchStructure(astrodendro_structure):
+
+class TorchStructure(Structure):
     def __init__(self, indices, values, children=[], idx=None, dendrogram=None):
 
         self._dendrogram = dendrogram
@@ -37,6 +47,15 @@ class TorchStructure(astrodendro_structure):
             self._smallest_index = torch.min(self._indices)
             self._reset_cache()
 
+    @staticmethod
+    def _concatenate(pieces):
+        return torch.cat(pieces)
+
+    def compact(self):
+        return CompactStructure(
+            self._indices.cpu().numpy(), self._values.cpu().numpy(), idx=self.idx
+        )
+
 
 class DistributedDendrogramV4(Dendrogram):
     device = "cpu"
@@ -82,7 +101,9 @@ class DistributedDendrogramV4(Dendrogram):
                 + offset
             )
             structure._values = torch.tensor(
-                structure._values, device=DistributedDendrogramV4.device
+                structure._values,
+                device=DistributedDendrogramV4.device,
+                dtype=data.larray.dtype,
             )
 
         return local_dendrogram
@@ -90,36 +111,49 @@ class DistributedDendrogramV4(Dendrogram):
     def communicate_structures(self, local_dendrogram):
         structures = [structure for structure in local_dendrogram.all_structures]
 
-        # unpack data from structures for communication
-        raw_data = [
-            (structure.idx, structure._indices, structure._values)
-            for structure in structures
-        ]
-
-        # communicate the data
-        all_raw_data = self.comm.allgather(raw_data)
+        # communicate the data as flat buffers
+        all_data = allgather_structures(
+            self.comm,
+            [structure._indices.cpu().numpy() for structure in structures],
+            self.data.shape,
+            values=[structure._values.cpu().numpy() for structure in structures],
+            ids=[structure.idx for structure in structures],
+        )
 
         # repack the data into structures
-        for i, _data in enumerate(all_raw_data):
+        device = DistributedDendrogramV4.device
+        dtype = self.data.larray.dtype
+        for i, (ids, indices, values) in enumerate(all_data):
             if i != self.comm.rank:
-                for me in _data:
-                    structures += [
-                        TorchStructure(idx=me[0], indices=me[1], values=me[2])
-                    ]
+                structures += [
+                    TorchStructure(
+                        idx=idx,
+                        indices=torch.as_tensor(me, device=device),
+                        values=torch.as_tensor(val, device=device, dtype=dtype),
+                    )
+                    for idx, me, val in zip(ids.tolist(), indices, values)
+                ]
 
         return structures
 
     @staticmethod
-    def compute_local_dendrogram_pseudo_parallel(data, ntasks, **kwargs):
-        elements_per_task = data.shape[0] // ntasks
-        local_slices = [
+    def get_local_slices(size, ntasks):
+        elements_per_task = size // ntasks
+        return [
             slice(i * elements_per_task, (i + 1) * elements_per_task)
             for i in range(ntasks)
         ]
 
-        local_dendrograms = [
-            Dendrogram.compute(np.array(data[s])) for s in local_slices
-        ]
+    @staticmethod
+    def compute_local_dendrogram_pseudo_parallel(data, ntasks, workers=None, **kwargs):
+        local_slices = DistributedDendrogramV4.get_local_slices(data.shape[0], ntasks)
+
+        if workers is None:
+            local_dendrograms = [
+                Dendrogram.compute(np.array(data[s])) for s in local_slices
+            ]
+        else:
+            local_dendrograms = compute_local_dendrograms(data, local_slices, workers)
 
         for i, dendrogram in enumerate(local_dendrograms):
             for structure in dendrogram.all_structures:
@@ -142,23 +176,15 @@ class DistributedDendrogramV4(Dendrogram):
         return local_dendrograms
 
     @staticmethod
-    def compute_pseudo_parallel(data, ntasks):
+    def compute_pseudo_parallel(data, ntasks, workers=None):
         self = DistributedDendrogramV4()
         self.data = data
 
         local_dendrograms = self.compute_local_dendrogram_pseudo_parallel(
-            data=self.data, ntasks=ntasks
+            data=self.data, ntasks=ntasks, workers=workers
         )
 
-        all_structures = []
-        for d in local_dendrograms:
-            structures = [structure for structure in d.all_structures]
-            offset = len(all_structures)
-            for structure in structures:
-                d.index_map[d.index_map == structure.idx] += offset
-                structure.idx += offset
-
-            all_structures += structures
+        all_structures = relabel_local_structures(local_dendrograms)
 
         self.compute_from_structures(all_structures)
         return self
@@ -205,27 +231,9 @@ class DistributedDendrogramV4(Dendrogram):
         vmax = [structure._vmax for structure in structures]
         return [structures[i] for i in np.argsort(vmax)[::-1]]
 
-    @staticmethod
-    def insert_structure_within(structures, insert):
-        vmax = torch.tensor(
-            [structure._vmax for structure in structures],
-            device=DistributedDendrogramV4.device,
-        )
-        insert_at = torch.nonzero(vmax < insert._vmax, as_tuple=False)[0][0]
-        return structures[:insert_at] + [insert] + structures[insert_at:]
-
     @staticmethod
     def insert_structure(structures, to_insert):
-        if len(structures) == 0:
-            structures = [to_insert]
-        elif to_insert._vmax > structures[0]._vmax:
-            structures = [to_insert] + structures
-        elif to_insert._vmax <= structures[-1]._vmax:
-            structures.append(to_insert)
-        else:
-            structures = DistributedDendrogramV4.insert_structure_within(
-                structures, to_insert
-            )
+        structures.push(to_insert)
         DistributedDendrogramV4.logger.info(
             f"Inserted structure with {len(to_insert._values)} values between {to_insert._vmin:.2f} and {to_insert._vmax:.2f} into list of {len(structures)} remaining structures."
         )
@@ -238,7 +246,7 @@ class DistributedDendrogramV4(Dendrogram):
             leaf = TorchStructure(
                 indices=to_merge._indices,
                 values=to_merge._values,
-                idx=len(merged_structures),
+                idx=self._ancestors.add(),
                 children=[],
                 dendrogram=self,
             )
@@ -262,14 +270,15 @@ class DistributedDendrogramV4(Dendrogram):
                 )
                 structures = self.insert_structure(structures, bottom_part)
 
-            merge_into._indices = torch.vstack([merge_into._indices, to_merge._indices])
-            merge_into._values = torch.hstack([merge_into._values, to_merge._values])
+            merge_into._append_pixels(to_merge._indices, to_merge._values)
             merge_into._vmin = min([merge_into._vmin, to_merge._vmin])
             merge_into._vmax = min([merge_into._vmax, to_merge._vmax])
-            merge_into._smallest_index = torch.min(merge_into._indices)
+            merge_into._smallest_index = min(
+                merge_into._smallest_index, torch.min(to_merge._indices)
+            )
             self.index_map[*to_merge._indices.T] = merge_into.idx
             self.logger.info(
-                f"Merged {len(to_merge._values)} values between {to_merge._vmin:.2f} and {to_merge._vmax:.2f} into existing structure, which now has {len(merge_into._values)} values between {merge_into._vmin:.2f} and {merge_into._vmax:.2f}"
+                f"Merged {len(to_merge._values)} values between {to_merge._vmin:.2f} and {to_merge._vmax:.2f} into existing structure, which now has {merge_into.get_npix(subtree=False)} values between {merge_into._vmin:.2f} and {merge_into._vmax:.2f}"
             )
 
         else:  # create new branch
@@ -296,10 +305,11 @@ class DistributedDendrogramV4(Dendrogram):
             branch = TorchStructure(
                 indices=to_merge._indices,
                 values=to_merge._values,
-                idx=len(merged_structures),
+                idx=self._ancestors.add(),
                 children=adjacent_structures,
                 dendrogram=self,
             )
+            self._ancestors.union([me.idx for me in adjacent_structures], branch.idx)
             self.index_map[*branch._indices.T] = branch.idx
             merged_structures.append(branch)
             self.logger.info(
@@ -318,8 +328,9 @@ class DistributedDendrogramV4(Dendrogram):
             dtype=torch.int32,
             device=DistributedDendrogramV4.device,
         )
+        self._ancestors = DisjointSet()
 
-        structures = self.sort_structures(structures)
+        structures = StructureQueue(self.sort_structures(structures))
 
         self._iterations = 0
         t0 = perf_counter()
@@ -329,7 +340,7 @@ class DistributedDendrogramV4(Dendrogram):
                 f"Starting iteration {self._iterations} of merging dendrograms. Merged dendrogram contains {len(merged_structures)} structures and have {len(structures)} left to merge."
             )
 
-            to_merge = structures.pop(0)
+            to_merge = structures.pop()
 
             # find adjacent structures
             adjacent_structures = self.get_adjacent_structures(
@@ -348,21 +359,7 @@ class DistributedDendrogramV4(Dendrogram):
         t1 = perf_counter()
         self.time_merge_dendrograms = t1 - t0
 
-        self._trunk = [
-            structure for structure in merged_structures if structure.parent is None
-        ]
-
-        # make astrodendro-compatible
-        for structure in merged_structures:
-            structure._level = 0
-            if structure.parent is not None:
-                parent = structure.parent
-                while parent is not None:
-                    structure._level += 1
-                    parent = parent.parent
-
-            structure._values = list(structure._values)
-            structure._indices = [tuple(me) for me in structure._indices]
+        finalize_structures(self, merged_structures)
 
     @staticmethod
     def get_adjacent_structure_indices(structure, index_map):
@@ -375,14 +372,12 @@ class DistributedDendrogramV4(Dendrogram):
             one[:, i] = 1
             adjacent += [index_map[*(idx + one).T]]
             adjacent += [index_map[*(idx - one).T]]
-        return [me for me in torch.unique(torch.hstack(adjacent)) if me >= 0]
+        adjacent = torch.unique(torch.hstack(adjacent))
+        return adjacent[adjacent >= 0].cpu().numpy()
 
-    @staticmethod
-    def get_adjacent_structures(structure, merged_structures, index_map):
-        adjacent_structure_indices = (
-            DistributedDendrogramV4.get_adjacent_structure_indices(structure, index_map)
-        )
-        ancestor_indices = np.unique(
-            [merged_structures[i].ancestor.idx for i in adjacent_structure_indices]
+    def get_adjacent_structures(self, structure, merged_structures, index_map):
+        adjacent_structure_indices = self.get_adjacent_structure_indices(
+            structure, index_map
         )
+        ancestor_indices = np.unique(self._ancestors.find(adjacent_structure_indices))
         return [merged_structures[i] for i in ancestor_indices]
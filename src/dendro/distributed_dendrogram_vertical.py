@@ -0,0 +1,521 @@
+import heat as ht
+import numpy as np
+from time import perf_counter
+import logging
+
+from dendro.distributed_dendrogram_v3 import DistributedDendrogramV3
+from dendro.exchange import allgather_arrays, alltoall_arrays
+from dendro.instrumentation import Instrumentation
+from dendro.vertical_split import get_band_pairs
+
+
+# Pixels are ordered by value and then by linear index, such that there are no
+# ties. Every rank owns a band of consecutive pixels in this order and every
+# edge between neighbouring pixels belongs to the band of its lower pixel.
+# Adding the pixels of a band from the top down, like astrodendro does, gives a
+# merge tree of the band, where pixels of higher bands that share an edge with
+# the band are external leaves. Only the nodes of this tree that matter for
+# other bands are kept: leaves, saddles where components meet, and glue pixels
+# that are external leaves of lower bands. The reduced trees of all bands are
+# stitched at the glue pixels by repeating the sweep on the reduced trees,
+# which gives the global tree. Every other pixel belongs to the structure
+# that was on top of the highest node above it at the time it was added.
+
+
+def is_lower(values, linear, other_values, other_linear):
+    return (values < other_values) | (
+        (values == other_values) & (linear < other_linear)
+    )
+
+
+def get_edges(values, linear, valid, halo_axis=None):
+    """
+    Edges between valid neighbouring pixels as linear indices and values of
+    their lower and upper pixel. If `halo_axis` is given, the last layer along
+    this axis is a halo that only takes part in edges along this axis.
+    """
+    edges = [[], [], [], []]
+    for axis in range(values.ndim):
+        v, lin, m = values, linear, valid
+        if halo_axis is not None and axis != halo_axis:
+            core = [slice(None)] * values.ndim
+            core[halo_axis] = slice(0, -1)
+            v, lin, m = v[tuple(core)], lin[tuple(core)], m[tuple(core)]
+
+        a = [slice(None)] * values.ndim
+        b = [slice(None)] * values.ndim
+        a[axis], b[axis] = slice(0, -1), slice(1, None)
+        a, b = tuple(a), tuple(b)
+        both = m[a] & m[b]
+        va, vb, la, lb = v[a][both], v[b][both], lin[a][both], lin[b][both]
+
+        swap = is_lower(vb, lb, va, la)
+        edges[0].append(np.where(swap, lb, la))
+        edges[1].append(np.where(swap, la, lb))
+        edges[2].append(np.where(swap, vb, va))
+        edges[3].append(np.where(swap, va, vb))
+    return [np.concatenate(me) for me in edges]
+
+
+def get_bands(values, linear, start_values, start_linear):
+    """
+    Band of every pixel given the first pixel of every band, which need to be
+    sorted.
+    """
+    bands = np.zeros(len(values), dtype=np.int64)
+    for value, index in zip(start_values[1:], start_linear[1:]):
+        bands += ~is_lower(values, linear, value, index)
+    return bands
+
+
+class LinearLookup:
+    """
+    Position of linear indices in an array of unique linear indices.
+    """
+
+    def __init__(self, linear):
+        self.order = np.argsort(linear)
+        self.sorted = linear[self.order]
+
+    def __call__(self, linear):
+        position = np.searchsorted(self.sorted, linear)
+        found = position < len(self.sorted)
+        found[found] = self.sorted[position[found]] == linear[found]
+        return np.where(
+            found, self.order[np.minimum(position, len(self.order) - 1)], -1
+        )
+
+
+def sweep_band(n, lower, upper, glue):
+    """
+    Add the pixels 0 to n - 1 of a band from the top down. `lower` and `upper`
+    are the nodes of the edges of the band, where nodes from n on are the
+    external leaves. Returns the node above every pixel that is kept in the
+    reduced tree, which is the pixel itself for kept pixels, and the edges of
+    the reduced tree from the upper to the lower node.
+    """
+    order = np.argsort(lower, kind="stable")
+    upper = upper[order].tolist()
+    starts = np.searchsorted(lower[order], np.arange(n + 1)).tolist()
+    glue = glue.tolist()
+
+    size = max([n - 1, *upper]) + 1
+    parent = list(range(size))
+    lowest = list(range(size))
+    anchor = [0] * n
+    child, tree_parent = [], []
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for i in range(n - 1, -1, -1):
+        roots = {find(me) for me in upper[starts[i] : starts[i + 1]]}
+        if len(roots) == 1 and not glue[i]:
+            root = roots.pop()
+            parent[i] = root
+            anchor[i] = lowest[root]
+            continue
+
+        for root in roots:
+            child.append(lowest[root])
+            tree_parent.append(i)
+            parent[root] = i
+        anchor[i] = i
+
+    return (
+        np.array(anchor, dtype=np.int64),
+        np.array(child, dtype=np.int64),
+        np.array(tree_parent, dtype=np.int64),
+    )
+
+
+def merge_reduced_trees(positions, values, child, parent):
+    """
+    Repeat the sweep on the union of the reduced trees of all bands, where
+    nodes are identified by their position in the global order and edges go
+    from the upper to the lower node. Like astrodendro, leaves whose maximum
+    equals the value of the node where they meet other structures are merged
+    into the structure of that node. Returns the structure of every node, and
+    the parent and the position of the highest pixel of every structure. The
+    structures are numbered in the order they are created, such that children
+    come before their parents.
+    """
+    order = np.argsort(parent, kind="stable")
+    children = child[order].tolist()
+    starts = np.searchsorted(parent[order], np.arange(len(positions) + 1)).tolist()
+    values = values.tolist()
+
+    ancestor = list(range(len(positions)))
+    top = [-1] * len(positions)
+    structure = [-1] * len(positions)
+    parents, tops, vmax, is_leaf, merged = [], [], [], [], []
+
+    def find(forest, node):
+        while forest[node] != node:
+            forest[node] = forest[forest[node]]
+            node = forest[node]
+        return node
+
+    for node in np.argsort(positions)[::-1].tolist():
+        roots = {find(ancestor, me) for me in children[starts[node] : starts[node + 1]]}
+        value = values[node]
+
+        # leaves on a plateau at the height of this node are merged into it
+        flat = [me for me in roots if is_leaf[top[me]] and vmax[top[me]] == value]
+        remaining = [me for me in roots if me not in flat]
+        if len(remaining) == 1:
+            belongs_to = top[remaining[0]]
+        elif len(remaining) == 0 and len(flat) > 0:
+            belongs_to = top[flat.pop()]
+        else:
+            belongs_to = len(parents)
+            parents.append(-1)
+            tops.append(positions[node])
+            vmax.append(value)
+            is_leaf.append(len(remaining) == 0)
+            merged.append(belongs_to)
+            for me in remaining:
+                parents[top[me]] = belongs_to
+
+        for me in flat:
+            merged[top[me]] = belongs_to
+        for me in roots:
+            ancestor[me] = node
+        top[node] = belongs_to
+        structure[node] = belongs_to
+
+    # drop the merged leaves and number the remaining structures consecutively
+    merged = np.array([find(merged, me) for me in range(len(merged))], dtype=np.int64)
+    kept = merged == np.arange(len(merged))
+    number = np.cumsum(kept) - 1
+    parents = np.array(parents, dtype=np.int64)[kept]
+    return (
+        number[merged[np.array(structure, dtype=np.int64)]],
+        np.where(parents >= 0, number[np.maximum(parents, 0)], -1),
+        np.array(tops, dtype=np.int64)[kept],
+    )
+
+
+def label_pixels(structures, positions, parents, tops):
+    """
+    Move the pixels up from the structure of the node above them to the last
+    ancestor that was created before the pixel was added.
+    """
+    labels = structures.copy()
+    while True:
+        up = parents[labels]
+        move = up >= 0
+        move[move] = tops[up[move]] > positions[move]
+        if not np.any(move):
+            return labels
+        labels[move] = up[move]
+
+
+class DistributedDendrogramVertical(DistributedDendrogramV3):
+    """
+    Dendrogram of data that is distributed in bands of values rather than in
+    space. Only the default pruning of astrodendro is supported.
+    """
+
+    logger = logging.getLogger("Dendrogram")
+    instrumentation = Instrumentation()
+
+    @staticmethod
+    def compute(
+        data,
+        min_npix=0,
+        min_value="min",
+        min_delta=0,
+        output="replicated",
+        instrument=False,
+        log=False,
+    ):
+        assert isinstance(data, ht.DNDarray)
+        if min_npix > 0 or min_delta > 0:
+            raise NotImplementedError("Value bands do not support pruning")
+
+        self = DistributedDendrogramVertical()
+        self.data = data if data.split is not None else ht.resplit(data, 0)
+        self.comm = data.comm
+        self.params = dict(min_npix=min_npix, min_value=min_value, min_delta=min_delta)
+        self.instrument(instrument, log)
+        min_value = None if min_value == "min" else min_value
+
+        t0 = perf_counter()
+        values, linear, positions = self.get_band(min_value)
+        lower, upper, glue, external = self.communicate_edges(values, linear, min_value)
+        t1 = perf_counter()
+        anchor, child, parent = sweep_band(len(values), lower, upper, glue)
+        t2 = perf_counter()
+        labels = self.merge_bands(
+            values, linear, positions, external, anchor, child, parent
+        )
+        t3 = perf_counter()
+        self.time_local_dendrogram = t2 - t1
+
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.add_time("distribute", t1 - t0)
+            stats.add_time("local_dendrogram", t2 - t1)
+            stats.add_time("merge", t3 - t2)
+            self.statistics = stats.as_dict()
+
+        if output == "distributed":
+            self.distribute_labels(labels, values, linear)
+        elif output == "replicated":
+            self.gather_labels(labels, values, linear)
+        else:
+            raise NotImplementedError(f"Don't know output mode {output!r}")
+        return self
+
+    def get_band(self, min_value=None):
+        """
+        Values and linear indices of the pixels of the band of this rank and
+        their position in the global order. The first pixel of every band is
+        kept to tell which band a pixel belongs to.
+        """
+        comm = self.comm
+        values, linear = get_band_pairs(self.data, min_value=min_value)
+        counts = np.array(comm.allgather(len(values)), dtype=np.int64)
+        start = counts[: comm.rank].sum()
+
+        first = (values[0], linear[0]) if len(values) > 0 else None
+        starts = [(rank, me) for rank, me in enumerate(comm.allgather(first)) if me]
+        self.band_ranks = np.array([rank for rank, _ in starts], dtype=np.int64)
+        self.band_starts = (
+            np.array([me[0] for _, me in starts], dtype=np.float64),
+            np.array([me[1] for _, me in starts], dtype=np.int64),
+        )
+        return values, linear, start + np.arange(len(values), dtype=np.int64)
+
+    def get_rank_of_band(self, values, linear):
+        return self.band_ranks[get_bands(values, linear, *self.band_starts)]
+
+    def get_local_edges(self, min_value=None):
+        """
+        Edges between pixels of the local slab and with the first layer of the
+        slab of the next rank.
+        """
+        data = self.data
+        local = data.larray.cpu().numpy()
+        _, displs = data.counts_displs()
+        split = data.split
+
+        data.get_halo(1)
+        halo_axis = None
+        if data.halo_next is not None:
+            local = np.concatenate([local, data.halo_next.cpu().numpy()], axis=split)
+            halo_axis = split
+
+        ranges = [np.arange(n, dtype=np.int64) for n in local.shape]
+        ranges[split] = ranges[split] + displs[self.comm.rank]
+        linear = np.ravel_multi_index(np.ix_(*ranges), data.shape)
+        valid = np.isfinite(local)
+        if min_value is not None:
+            valid &= local > min_value
+        return get_edges(local.astype(np.float64), linear, valid, halo_axis)
+
+    def communicate_edges(self, values, linear, min_value=None):
+        """
+        Send every edge to the band of its lower pixel and every pixel that is
+        an external leaf of another band to its own band as glue pixel.
+        Returns the edges as nodes of the band, the glue pixels and the linear
+        indices of the external leaves.
+        """
+        comm = self.comm
+        lower, upper, lower_values, upper_values = self.get_local_edges(min_value)
+        lower_rank = self.get_rank_of_band(lower_values, lower)
+        upper_rank = self.get_rank_of_band(upper_values, upper)
+
+        crossing = lower_rank != upper_rank
+        glue = [upper[crossing & (upper_rank == rank)] for rank in range(comm.size)]
+        glue = np.concatenate(alltoall_arrays(comm, glue, np.int64))
+
+        parts = [lower_rank == rank for rank in range(comm.size)]
+        lower = np.concatenate(
+            alltoall_arrays(comm, [lower[me] for me in parts], np.int64)
+        )
+        upper = np.concatenate(
+            alltoall_arrays(comm, [upper[me] for me in parts], np.int64)
+        )
+
+        lookup = LinearLookup(linear)
+        is_glue = np.zeros(len(linear), dtype=bool)
+        is_glue[lookup(glue)] = True
+
+        lower = lookup(lower)
+        nodes = lookup(upper)
+        external, inverse = np.unique(upper[nodes < 0], return_inverse=True)
+        nodes[nodes < 0] = len(linear) + inverse
+
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.count("band_pixels", len(linear))
+            stats.count("glue_pixels", int(is_glue.sum()))
+            stats.count("external_leaves", len(external))
+        return lower, nodes, is_glue, external
+
+    def merge_bands(self, values, linear, positions, external, anchor, child, parent):
+        """
+        Stitch the reduced trees of all bands on all ranks and label the pixels
+        of the band of this rank with their structure.
+        """
+        comm = self.comm
+        node_linear = np.concatenate([linear, external])
+        kept = np.flatnonzero(anchor == np.arange(len(anchor)))
+
+        all_linear = allgather_arrays(comm, linear[kept])
+        all_positions = allgather_arrays(comm, positions[kept])
+        all_values = allgather_arrays(comm, values[kept])
+        all_child = allgather_arrays(comm, node_linear[child])
+        all_parent = allgather_arrays(comm, node_linear[parent])
+
+        lookup = LinearLookup(all_linear)
+        structures, parents, tops = merge_reduced_trees(
+            all_positions, all_values, lookup(all_child), lookup(all_parent)
+        )
+        self._iterations = len(all_linear)
+        self._tree = parents, tops
+
+        stats = self.instrumentation
+        if stats.enabled:
+            stats.counters["iterations"] = self._iterations
+            stats.count("reduced_edges", len(all_child))
+
+        return label_pixels(
+            structures[lookup(node_linear[anchor])], positions, parents, tops
+        )
+
+    def get_tree(self, labels, values):
+        # extent of the structures from the pixels of all bands
+        parents, _ = self._tree
+        npix = np.bincount(labels, minlength=len(parents))
+        vmin = np.full(len(parents), np.inf)
+        vmax = np.full(len(parents), -np.inf)
+        np.minimum.at(vmin, labels, values)
+        np.maximum.at(vmax, labels, values)
+        npix = self.comm.allreduce(npix)
+        vmin = np.min(self.comm.allgather(vmin), axis=0)
+        vmax = np.max(self.comm.allgather(vmax), axis=0)
+        return parents, vmin, vmax, npix
+
+    def distribute_labels(self, labels, values, linear):
+        """
+        Send the labels to the ranks that hold the pixels in their slab and
+        keep the output distributed like `DistributedDendrogramV3`.
+        """
+        comm = self.comm
+        data = self.data
+        tree = self.get_tree(labels, values)
+
+        _, displs = data.counts_displs()
+        position = np.unravel_index(linear, data.shape)[data.split]
+        rank = np.searchsorted(np.asarray(displs), position, side="right") - 1
+        parts = [rank == me for me in range(comm.size)]
+        labels = alltoall_arrays(comm, [labels[me] for me in parts], np.int32)
+        values = alltoall_arrays(comm, [values[me] for me in parts], np.float64)
+        linear = alltoall_arrays(comm, [linear[me] for me in parts], np.int64)
+
+        indices = np.stack(np.unravel_index(np.concatenate(linear), data.shape), axis=1)
+        self.set_distributed_structures(
+            *tree, np.concatenate(labels), indices, np.concatenate(values)
+        )
+
+    def gather_labels(self, labels, values, linear):
+        """
+        Gather the labels and pixels of all bands on all ranks and build a
+        dendrogram that is compatible with astrodendro.
+        """
+        comm = self.comm
+        parents, _ = self._tree
+        labels = allgather_arrays(comm, labels)
+        values = allgather_arrays(comm, values)
+        linear = allgather_arrays(comm, linear)
+
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(labels, minlength=len(parents)))]
+        )
+        indices = np.stack(np.unravel_index(linear[order], self.data.shape), axis=1)
+        self.set_structures_from_flat(parents, offsets, indices, values[order])
+        self.make_output_astrodendro_compatible()
+
+    @staticmethod
+    def compute_pseudo_parallel(data, ntasks, min_value="min"):
+        """
+        Compute the dendrogram with `ntasks` bands on a single process.
+        """
+        self = DistributedDendrogramVertical()
+        self.data = np.asarray(data)
+        min_value = None if min_value == "min" else min_value
+
+        valid = np.isfinite(self.data)
+        if min_value is not None:
+            valid &= self.data > min_value
+        linear = np.arange(self.data.size, dtype=np.int64).reshape(self.data.shape)
+        values = self.data.astype(np.float64)
+        order = np.lexsort((linear[valid], values[valid]))
+        linear, values = linear[valid][order], values[valid][order]
+
+        elements_per_task = max(int(np.ceil(len(values) / ntasks)), 1)
+        band_of = -np.ones(self.data.size, dtype=np.int64)
+        band_of[linear] = np.arange(len(linear)) // elements_per_task
+        position_of = -np.ones(self.data.size, dtype=np.int64)
+        position_of[linear] = np.arange(len(linear))
+
+        lower, upper, _, _ = get_edges(
+            self.data.astype(np.float64),
+            np.arange(self.data.size, dtype=np.int64).reshape(self.data.shape),
+            valid,
+        )
+        glue = np.zeros(self.data.size, dtype=bool)
+        glue[upper[band_of[lower] != band_of[upper]]] = True
+
+        all_linear, all_child, all_parent, anchors = [], [], [], []
+        for band in range(ntasks):
+            s = slice(band * elements_per_task, (band + 1) * elements_per_task)
+            band_linear = linear[s]
+            mine = band_of[lower] == band
+            external, inverse = np.unique(
+                upper[mine & (band_of[upper] != band)], return_inverse=True
+            )
+            lookup = LinearLookup(band_linear)
+            nodes = lookup(upper[mine])
+            nodes[nodes < 0] = len(band_linear) + inverse
+
+            anchor, child, parent = sweep_band(
+                len(band_linear), lookup(lower[mine]), nodes, glue[band_linear]
+            )
+            node_linear = np.concatenate([band_linear, external])
+            kept = anchor == np.arange(len(anchor))
+            all_linear.append(band_linear[kept])
+            all_child.append(node_linear[child])
+            all_parent.append(node_linear[parent])
+            anchors.append(node_linear[anchor])
+
+        all_linear = np.concatenate(all_linear)
+        lookup = LinearLookup(all_linear)
+        structures, parents, tops = merge_reduced_trees(
+            position_of[all_linear],
+            self.data.ravel()[all_linear].astype(np.float64),
+            lookup(np.concatenate(all_child)),
+            lookup(np.concatenate(all_parent)),
+        )
+        self._iterations = len(all_linear)
+        labels = label_pixels(
+            structures[lookup(np.concatenate(anchors))],
+            np.arange(len(linear)),
+            parents,
+            tops,
+        )
+
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(labels, minlength=len(parents)))]
+        )
+        indices = np.stack(np.unravel_index(linear[order], self.data.shape), axis=1)
+        self.set_structures_from_flat(parents, offsets, indices, values[order])
+        return self
@@ -0,0 +1,172 @@
+import numpy as np
+from mpi4py import MPI
+
+
+# Structures are exchanged as a few contiguous buffers instead of pickled lists
+# of arrays: the ids and pixel counts of all structures, the raveled indices of
+# all pixels and their values. The receiving side unravels the indices once and
+# hands out views into the received buffers.
+
+
+def _get_handle(comm):
+    return comm if isinstance(comm, MPI.Comm) else comm.handle
+
+
+def _gatherv(comm, sendbuf, counts, root=None):
+    # gathers on all ranks if no root is given
+    counts = np.asarray(counts, dtype=np.int64)
+    displs = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    sendbuf = np.ascontiguousarray(sendbuf)
+    handle = _get_handle(comm)
+
+    if root is None:
+        recvbuf = np.empty(counts.sum(), dtype=sendbuf.dtype)
+        handle.Allgatherv(sendbuf, [recvbuf, counts, displs, None])
+    elif handle.rank == root:
+        recvbuf = np.empty(counts.sum(), dtype=sendbuf.dtype)
+        handle.Gatherv(sendbuf, [recvbuf, counts, displs, None], root=root)
+    else:
+        recvbuf = None
+        handle.Gatherv(sendbuf, None, root=root)
+    return recvbuf
+
+
+def scatter_arrays(comm, arrays, count, dtype, root=0):
+    """
+    Send one array from the root to every rank. `arrays` is only needed on the
+    root and `count` is the length of the array that is received.
+    """
+    handle = _get_handle(comm)
+    recvbuf = np.empty(count, dtype=dtype)
+    if handle.rank == root:
+        counts = np.array([len(me) for me in arrays], dtype=np.int64)
+        displs = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sendbuf = np.concatenate([np.zeros(0, dtype=dtype), *arrays]).astype(dtype)
+        handle.Scatterv([sendbuf, counts, displs, None], recvbuf, root=root)
+    else:
+        handle.Scatterv(None, recvbuf, root=root)
+    return recvbuf
+
+
+def bcast_arrays(comm, arrays, root=0):
+    """
+    Send arrays from the root to every rank. Only the shapes and dtypes are
+    pickled, the contents are sent with buffer broadcasts. `arrays` is only
+    needed on the root.
+    """
+    handle = _get_handle(comm)
+    if handle.rank == root:
+        arrays = [np.ascontiguousarray(me) for me in arrays]
+        meta = handle.bcast([(me.shape, me.dtype.str) for me in arrays], root=root)
+    else:
+        meta = handle.bcast(None, root=root)
+        arrays = [np.empty(shape, dtype=dtype) for shape, dtype in meta]
+    for me in arrays:
+        handle.Bcast(me, root=root)
+    return arrays
+
+
+def allgather_arrays(comm, array):
+    """
+    Concatenation of a one dimensional array of every rank in the order of
+    the ranks.
+    """
+    counts = comm.allgather(len(array))
+    return _gatherv(comm, array, counts)
+
+
+def alltoall_arrays(comm, arrays, dtype):
+    """
+    Send `arrays[i]` to rank i. Returns the arrays received from every rank,
+    which are views into one receive buffer.
+    """
+    handle = _get_handle(comm)
+    counts = np.array([len(me) for me in arrays], dtype=np.int64)
+    recvcounts = np.empty_like(counts)
+    handle.Alltoall(counts, recvcounts)
+
+    displs = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    recvdispls = np.concatenate([[0], np.cumsum(recvcounts)[:-1]])
+    sendbuf = np.concatenate([np.zeros(0, dtype=dtype), *arrays]).astype(dtype)
+    recvbuf = np.empty(recvcounts.sum(), dtype=dtype)
+    handle.Alltoallv(
+        [sendbuf, counts, displs, None], [recvbuf, recvcounts, recvdispls, None]
+    )
+    return [recvbuf[i : i + n] for i, n in zip(recvdispls, recvcounts)]
+
+
+def flatten_structures(indices, shape, values=None, ids=None):
+    """
+    Concatenate the pixels of structures into flat arrays. Returns the ids, the
+    number of pixels per structure, the raveled indices and the values.
+    """
+    counts = np.array([len(me) for me in indices], dtype=np.int64)
+    ids = np.arange(len(counts)) if ids is None else ids
+    ids = np.asarray(ids, dtype=np.int64)
+
+    empty = np.zeros((0, len(shape)), dtype=np.int64)
+    indices = np.concatenate([empty, *indices]).reshape(-1, len(shape))
+    linear = np.ravel_multi_index(tuple(indices.T), shape).astype(np.int64)
+
+    if values is not None:
+        values = np.concatenate([np.zeros(0), *values]).astype(np.float64)
+    return ids, counts, linear, values
+
+
+def split_flat_structures(ids, counts, linear, shape, values=None):
+    """
+    Inverse of `flatten_structures`, where indices and values of the structures
+    are views into one array each.
+    """
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    indices = np.stack(np.unravel_index(linear, shape), axis=1)
+    indices = [indices[offsets[i] : offsets[i + 1]] for i in range(len(counts))]
+    if values is not None:
+        values = [values[offsets[i] : offsets[i + 1]] for i in range(len(counts))]
+    return ids, indices, values
+
+
+def allgather_structures(comm, indices, shape, values=None, ids=None):
+    """
+    Gather the pixels of the structures on all ranks with buffer collectives.
+    Returns a list with (ids, indices, values) for every rank, where values is
+    None if no values are given.
+    """
+    return gather_structures(comm, indices, shape, values, ids, root=None)
+
+
+def gather_structures(comm, indices, shape, values=None, ids=None, root=0):
+    """
+    Like `allgather_structures`, but the structures are only gathered on the
+    root and all other ranks get None.
+    """
+    ids, counts, linear, values = flatten_structures(indices, shape, values, ids)
+
+    sizes = np.array(comm.allgather((len(counts), len(linear))), dtype=np.int64)
+    n_structures, n_pixels = sizes.T
+
+    meta = np.stack([ids, counts], axis=1).ravel()
+    meta = _gatherv(comm, meta, 2 * n_structures, root)
+    all_linear = _gatherv(comm, linear, n_pixels, root)
+    if values is not None:
+        values = _gatherv(comm, values, n_pixels, root)
+    if meta is None:
+        return None
+    meta = meta.reshape(-1, 2)
+
+    structure_offsets = np.concatenate([[0], np.cumsum(n_structures)])
+    pixel_offsets = np.concatenate([[0], np.cumsum(n_pixels)])
+    gathered = []
+    for rank in range(len(sizes)):
+        s = slice(structure_offsets[rank], structure_offsets[rank + 1])
+        p = slice(pixel_offsets[rank], pixel_offsets[rank + 1])
+        gathered.append(
+            split_flat_structures(
+                meta[s, 0],
+                meta[s, 1],
+                all_linear[p],
+                shape,
+                None if values is None else values[p],
+            )
+        )
+    return gathered
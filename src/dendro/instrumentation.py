@@ -0,0 +1,30 @@
+class Instrumentation:
+    """
+    Counters and timers for the merge of distributed dendrograms.
+
+    Call sites check `enabled` before recording anything and `verbose` before
+    building log messages, so disabled instrumentation costs a single attribute
+    lookup. Human-readable messages are only written if a logger is given.
+    """
+
+    def __init__(self, enabled=False, logger=None):
+        self.enabled = enabled or logger is not None
+        self.logger = logger
+        self.counters = {}
+        self.timers = {}
+
+    @property
+    def verbose(self):
+        return self.logger is not None
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    def log(self, message, *args):
+        self.logger.info(message, *args)
+
+    def as_dict(self):
+        return {**self.counters, **{f"time_{k}": v for k, v in self.timers.items()}}
@@ -0,0 +1,198 @@
+import numpy as np
+from numba import njit
+
+
+# Native replacement for astrodendro's Dendrogram.compute. Pixels are added in
+# the same order as astrodendro adds them and every decision follows it, such
+# that the result is the same, including the pruning with min_delta and
+# min_npix. Structures are labelled by the position of the pixel they start
+# at. Instead of relabelling the footprint of merged structures, two
+# disjoint-set forests redirect labels: `ancestor` to the ancestor of a
+# structure and `merged` to the structure that a pruned leaf was merged into.
+# The kernels release the GIL, such that sub-slabs can be swept on threads.
+
+
+@njit(nogil=True)
+def _find(forest, label):
+    root = label
+    while forest[root] != root:
+        root = forest[root]
+    while forest[label] != root:
+        forest[label], label = root, forest[label]
+    return root
+
+
+@njit(nogil=True)
+def _sweep(linear, values, order, shape, min_delta, min_npix, merge_plateaus):
+    n = len(values)
+    ndim = len(shape)
+    strides = np.ones(ndim, dtype=np.int64)
+    for axis in range(ndim - 2, -1, -1):
+        strides[axis] = strides[axis + 1] * shape[axis + 1]
+
+    index_map = -np.ones(np.prod(shape), dtype=np.int64)
+    parent = -np.ones(n, dtype=np.int64)
+    ancestor = np.arange(n)
+    merged = np.arange(n)
+    vmin = np.empty(n)
+    vmax = np.empty(n)
+    npix = np.zeros(n, dtype=np.int64)
+    has_children = np.zeros(n, dtype=np.bool_)
+    alive = np.zeros(n, dtype=np.bool_)
+    labels = np.empty(n, dtype=np.int64)
+
+    adjacent = np.empty(2 * ndim, dtype=np.int64)
+    remaining = np.empty(2 * ndim, dtype=np.int64)
+    to_merge = np.empty(2 * ndim, dtype=np.int64)
+
+    for i in order:
+        value = values[i]
+        pixel = linear[i]
+
+        # unique ancestors of the neighbours that are already part of structures
+        count = 0
+        for axis in range(ndim):
+            position = (pixel // strides[axis]) % shape[axis]
+            for step in (-1, 1):
+                if not 0 <= position + step < shape[axis]:
+                    continue
+                label = index_map[pixel + step * strides[axis]]
+                if label < 0:
+                    continue
+                label = _find(ancestor, label)
+                known = False
+                for j in range(count):
+                    known |= adjacent[j] == label
+                if not known:
+                    adjacent[count] = label
+                    count += 1
+        adjacent[:count].sort()
+
+        n_merge = 0
+        if count == 0:
+            belongs_to = i
+            alive[i] = True
+            vmin[i] = vmax[i] = value
+        elif count == 1:
+            belongs_to = adjacent[0]
+        else:
+            # leaves that are not significant are merged with this pixel
+            n_remaining = 0
+            for j in range(count):
+                me = adjacent[j]
+                if not has_children[me] and (
+                    (merge_plateaus and vmax[me] == value)
+                    or vmax[me] - value < min_delta
+                    or npix[me] < min_npix
+                ):
+                    to_merge[n_merge] = me
+                    n_merge += 1
+                else:
+                    remaining[n_remaining] = me
+                    n_remaining += 1
+
+            if n_remaining == 0:
+                n_merge -= 1
+                belongs_to = to_merge[n_merge]
+            elif n_remaining == 1:
+                belongs_to = remaining[0]
+            else:
+                belongs_to = i
+                alive[i] = True
+                has_children[i] = True
+                vmin[i] = vmax[i] = value
+                for j in range(n_remaining):
+                    parent[remaining[j]] = i
+                    ancestor[remaining[j]] = i
+
+        npix[belongs_to] += 1
+        vmin[belongs_to] = min(vmin[belongs_to], value)
+        vmax[belongs_to] = max(vmax[belongs_to], value)
+        index_map[pixel] = belongs_to
+        labels[i] = belongs_to
+
+        for j in range(n_merge):
+            me = to_merge[j]
+            npix[belongs_to] += npix[me]
+            vmin[belongs_to] = min(vmin[belongs_to], vmin[me])
+            vmax[belongs_to] = max(vmax[belongs_to], vmax[me])
+            alive[me] = False
+            ancestor[me] = belongs_to
+            merged[me] = belongs_to
+
+    for i in range(n):
+        labels[i] = _find(merged, labels[i])
+
+    # orphan leaves in the trunk that are not significant are removed
+    for me in range(n):
+        if alive[me] and parent[me] < 0 and not has_children[me]:
+            if vmax[me] - vmin[me] < min_delta or npix[me] < min_npix:
+                alive[me] = False
+    for i in range(n):
+        if not alive[labels[i]]:
+            labels[i] = -1
+
+    return labels, parent, alive
+
+
+def compute_flat(
+    data, min_npix=0, min_value="min", min_delta=0, kind=None, merge_plateaus=True
+):
+    """
+    Compute the dendrogram of a numpy array like astrodendro. Returns the
+    parents, pixel offsets, indices and values of the structures in the format
+    of `dendro.process_pool.flatten_dendrogram`, where structures are numbered
+    like in astrodendro.
+
+    Pixels are added in the order of `np.argsort(values, kind=kind)`, reversed.
+    Astrodendro uses the default kind, which does not fix the order of ties.
+    With `kind="stable"`, tied pixels are added by decreasing linear index. If
+    `merge_plateaus` is False, leaves whose maximum equals the value of the
+    pixel where they meet other structures are kept instead of being merged.
+    """
+    if min_value == "min":
+        min_value = np.min(data[np.isfinite(data)]) - 1
+
+    keep = data > min_value
+    linear = np.flatnonzero(keep)
+    values = data[keep]
+    order = np.argsort(values, kind=kind)[::-1]
+
+    labels, parent, alive = _sweep(
+        linear,
+        values.astype(np.float64),
+        order,
+        np.array(data.shape, dtype=np.int64),
+        float(min_delta),
+        float(min_npix),
+        merge_plateaus,
+    )
+
+    # number the structures by their smallest pixel, like astrodendro
+    kept = labels >= 0
+    smallest = np.full(len(values), np.iinfo(np.int64).max)
+    np.minimum.at(smallest, labels[kept], linear[kept])
+    structures = np.flatnonzero(alive)
+    structures = structures[np.argsort(smallest[structures])]
+    idx = -np.ones(len(values) + 1, dtype=np.int64)
+    idx[structures] = np.arange(len(structures))
+
+    parents = idx[parent[structures]]
+    labels = idx[labels]
+    pixels = np.argsort(labels[kept], kind="stable")
+    counts = np.bincount(labels[kept], minlength=len(structures))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    indices = np.stack(np.unravel_index(linear[kept][pixels], data.shape), axis=1)
+    return parents, offsets, indices, values[kept][pixels]
+
+
+def compute_local_dendrogram(data, **kwargs):
+    """
+    Drop-in replacement for `astrodendro.Dendrogram.compute` for the local
+    dendrograms of the distributed versions.
+    """
+    from dendro.process_pool import unflatten_dendrogram
+
+    dendrogram = unflatten_dendrogram(data.shape, *compute_flat(data, **kwargs))
+    dendrogram.data = data
+    return dendrogram
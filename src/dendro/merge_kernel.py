@@ -0,0 +1,284 @@
+import numpy as np
+from numba import njit
+
+
+# The kernel follows the merge of DistributedDendrogramV3 step by step, but
+# keeps everything in flat arrays. Pixels are raveled indices into the padded
+# index map and each structure stores its pixels as a linked list through
+# `nxt`, such that merging is O(1) and splitting walks the pixels only once.
+# Pending structures are identified by node and merged structures by label.
+
+
+@njit
+def _grow(array, size):
+    if size < len(array):
+        return array
+    grown = np.empty(2 * len(array), dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+@njit
+def _heap_less(key, order, i, j):
+    return key[i] < key[j] or (key[i] == key[j] and order[i] < order[j])
+
+
+@njit
+def _heap_swap(key, order, node, i, j):
+    key[i], key[j] = key[j], key[i]
+    order[i], order[j] = order[j], order[i]
+    node[i], node[j] = node[j], node[i]
+
+
+@njit
+def _heap_push(key, order, node, size, counter, vmax, me):
+    key[size], order[size], node[size] = -vmax, counter, me
+    i = size
+    while i > 0:
+        parent = (i - 1) // 2
+        if not _heap_less(key, order, i, parent):
+            break
+        _heap_swap(key, order, node, i, parent)
+        i = parent
+
+
+@njit
+def _heap_pop(key, order, node, size):
+    me = node[0]
+    size -= 1
+    _heap_swap(key, order, node, 0, size)
+    i = 0
+    while True:
+        smallest = i
+        for child in (2 * i + 1, 2 * i + 2):
+            if child < size and _heap_less(key, order, child, smallest):
+                smallest = child
+        if smallest == i:
+            break
+        _heap_swap(key, order, node, i, smallest)
+        i = smallest
+    return me
+
+
+@njit
+def _find(ancestors, label):
+    root = label
+    while ancestors[root] != root:
+        root = ancestors[root]
+    while ancestors[label] != root:
+        ancestors[label], label = root, ancestors[label]
+    return root
+
+
+@njit
+def _get_adjacent_labels(head, nxt, pix, index_map, strides, ancestors, buffer):
+    n = 0
+    pixel = head
+    while pixel >= 0:
+        for stride in strides:
+            for neighbour in (pix[pixel] + stride, pix[pixel] - stride):
+                if neighbour < 0:
+                    neighbour += len(index_map)
+                label = index_map[neighbour]
+                if label >= 0:
+                    if n == len(buffer):
+                        buffer = _grow(buffer, n + 1)
+                    buffer[n] = _find(ancestors, label)
+                    n += 1
+        pixel = nxt[pixel]
+    return np.unique(buffer[:n]), buffer
+
+
+@njit
+def _split(head, nxt, val, split_at):
+    # returns head, tail, vmin and vmax of the top and the bottom part
+    top = np.array([-1, -1])
+    bottom = np.array([-1, -1])
+    extrema = np.array([np.inf, -np.inf, np.inf, -np.inf])
+    pixel = head
+    while pixel >= 0:
+        following = nxt[pixel]
+        nxt[pixel] = -1
+        part, offset = (top, 0) if val[pixel] > split_at else (bottom, 2)
+        if part[0] < 0:
+            part[0] = pixel
+        else:
+            nxt[part[1]] = pixel
+        part[1] = pixel
+        extrema[offset] = min(extrema[offset], val[pixel])
+        extrema[offset + 1] = max(extrema[offset + 1], val[pixel])
+        pixel = following
+    return top, bottom, extrema
+
+
+@njit
+def _set_labels(head, nxt, pix, index_map, label):
+    pixel = head
+    while pixel >= 0:
+        index_map[pix[pixel]] = label
+        pixel = nxt[pixel]
+
+
+@njit
+def _merge_kernel(head, tail, vmin, vmax, nxt, pix, val, index_map, strides):
+    n_pending = len(head)
+    p_head, p_tail, p_vmin, p_vmax = head.copy(), tail.copy(), vmin.copy(), vmax.copy()
+
+    capacity = max(n_pending, 1)
+    h_key = np.empty(capacity, dtype=np.float64)
+    h_order = np.empty(capacity, dtype=np.int64)
+    h_node = np.empty(capacity, dtype=np.int64)
+    for i in range(n_pending):
+        _heap_push(h_key, h_order, h_node, i, i, p_vmax[i], i)
+    size = n_pending
+    counter = n_pending
+
+    m_head = np.empty(capacity, dtype=np.int64)
+    m_tail = np.empty(capacity, dtype=np.int64)
+    m_vmin = np.empty(capacity, dtype=np.float64)
+    m_vmax = np.empty(capacity, dtype=np.float64)
+    m_parent = np.empty(capacity, dtype=np.int64)
+    ancestors = np.empty(capacity, dtype=np.int64)
+    n_merged = 0
+
+    buffer = np.empty(64, dtype=np.int64)
+    iterations = 0
+    while size > 0:
+        iterations += 1
+        me = _heap_pop(h_key, h_order, h_node, size)
+        size -= 1
+
+        adjacent, buffer = _get_adjacent_labels(
+            p_head[me], nxt, pix, index_map, strides, ancestors, buffer
+        )
+
+        # split structures if needed
+        for label in adjacent:
+            for case in range(3):
+                if case == 0 and p_vmin[me] < m_vmin[label] < p_vmax[me]:
+                    split_at = m_vmin[label]
+                    top, bottom, extrema = _split(p_head[me], nxt, val, split_at)
+                    p_head[me], p_tail[me] = top[0], top[1]
+                    p_vmin[me], p_vmax[me] = extrema[0], extrema[1]
+                elif case == 1 and m_vmin[label] < p_vmin[me] < m_vmax[label]:
+                    split_at = p_vmin[me]
+                elif case == 2 and m_vmin[label] < p_vmax[me] < m_vmax[label]:
+                    split_at = p_vmax[me]
+                else:
+                    continue
+
+                if case > 0:
+                    top, bottom, extrema = _split(m_head[label], nxt, val, split_at)
+                    m_head[label], m_tail[label] = top[0], top[1]
+                    m_vmin[label], m_vmax[label] = extrema[0], extrema[1]
+                    _set_labels(bottom[0], nxt, pix, index_map, -1)
+
+                # insert the bottom part into the pending structures
+                p_head = _grow(p_head, n_pending + 1)
+                p_tail = _grow(p_tail, n_pending + 1)
+                p_vmin = _grow(p_vmin, n_pending + 1)
+                p_vmax = _grow(p_vmax, n_pending + 1)
+                p_head[n_pending], p_tail[n_pending] = bottom[0], bottom[1]
+                p_vmin[n_pending], p_vmax[n_pending] = extrema[2], extrema[3]
+
+                h_key = _grow(h_key, size + 1)
+                h_order = _grow(h_order, size + 1)
+                h_node = _grow(h_node, size + 1)
+                _heap_push(h_key, h_order, h_node, size, counter, extrema[3], n_pending)
+                size += 1
+                counter += 1
+                n_pending += 1
+
+        # recompute adjacent structures after splitting
+        adjacent, buffer = _get_adjacent_labels(
+            p_head[me], nxt, pix, index_map, strides, ancestors, buffer
+        )
+
+        if len(adjacent) == 1:  # merge into existing structure
+            label = adjacent[0]
+            nxt[m_tail[label]] = p_head[me]
+            m_tail[label] = p_tail[me]
+            m_vmin[label] = min(m_vmin[label], p_vmin[me])
+            m_vmax[label] = min(m_vmax[label], p_vmax[me])
+        else:  # create new leaf or branch
+            label = n_merged
+            m_head = _grow(m_head, n_merged + 1)
+            m_tail = _grow(m_tail, n_merged + 1)
+            m_vmin = _grow(m_vmin, n_merged + 1)
+            m_vmax = _grow(m_vmax, n_merged + 1)
+            m_parent = _grow(m_parent, n_merged + 1)
+            ancestors = _grow(ancestors, n_merged + 1)
+            m_head[label], m_tail[label] = p_head[me], p_tail[me]
+            m_vmin[label], m_vmax[label] = p_vmin[me], p_vmax[me]
+            m_parent[label] = -1
+            ancestors[label] = label
+            for child in adjacent:
+                m_parent[child] = label
+                ancestors[child] = label
+            n_merged += 1
+        _set_labels(p_head[me], nxt, pix, index_map, label)
+
+    # collect the pixels of the merged structures
+    offsets = np.zeros(n_merged + 1, dtype=np.int64)
+    order = np.empty(len(pix), dtype=np.int64)
+    for label in range(n_merged):
+        n = offsets[label]
+        pixel = m_head[label]
+        while pixel >= 0:
+            order[n] = pixel
+            n += 1
+            pixel = nxt[pixel]
+        offsets[label + 1] = n
+
+    return m_parent[:n_merged].copy(), offsets, order[: offsets[-1]], iterations
+
+
+def merge_flat_structures(indices, values, shape):
+    """
+    Merge pending structures, given in the order in which they are popped, into
+    a global dendrogram. Returns the index map over the shape padded by one, the
+    parent of every merged structure, the pixel offsets of the merged
+    structures, their indices and values and the number of iterations.
+    """
+    padded_shape = tuple(np.add(shape, 1))
+    strides = np.cumprod((padded_shape[1:] + (1,))[::-1])[::-1].astype(np.int64)
+    index_map = -np.ones(np.prod(padded_shape), dtype=np.int32)
+
+    # nothing to merge
+    if len(values) == 0:
+        return (
+            index_map.reshape(padded_shape),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(1, dtype=np.int64),
+            np.zeros((0, len(shape)), dtype=np.int64),
+            np.zeros(0, dtype=np.float64),
+            0,
+        )
+
+    counts = np.array([len(me) for me in values], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    empty = np.zeros((0, len(shape)), dtype=np.int64)
+    pix = np.ravel_multi_index(
+        tuple(np.concatenate([empty, *indices]).reshape(-1, len(shape)).T),
+        padded_shape,
+    ).astype(np.int64)
+    val = np.concatenate([[], *values]).astype(np.float64)
+
+    nxt = np.arange(1, len(pix) + 1, dtype=np.int64)
+    nxt[starts[1:] - 1] = -1
+    vmin = np.minimum.reduceat(val, starts[:-1])
+    vmax = np.maximum.reduceat(val, starts[:-1])
+
+    parents, offsets, order, iterations = _merge_kernel(
+        starts[:-1], starts[1:] - 1, vmin, vmax, nxt, pix, val, index_map, strides
+    )
+
+    merged_indices = np.stack(np.unravel_index(pix[order], padded_shape), axis=1)
+    return (
+        index_map.reshape(padded_shape),
+        parents,
+        offsets,
+        merged_indices,
+        val[order],
+        iterations,
+    )
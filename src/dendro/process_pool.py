@@ -0,0 +1,126 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from multiprocessing import shared_memory
+
+from astrodendro.dendrogram import Dendrogram
+
+
+# Local dendrograms of a pseudo parallel run are computed in worker processes.
+# The input is put into shared memory once, such that workers only receive its
+# name and the block they work on. Workers send the structures back as a few
+# flat arrays, which are much cheaper to pickle than astrodendro structures.
+# Workers are not forked from the calling process, because forking a process
+# that has started the threads of torch can deadlock. They are forked from a
+# server process instead, which only imports this module. This module
+# therefore only imports what the workers need at the top.
+
+
+def flatten_dendrogram(dendrogram):
+    """
+    Parents, pixel offsets, indices and values of all structures of an
+    astrodendro dendrogram, where structures are labelled by their idx.
+    """
+    structures = [dendrogram._structures_dict[i] for i in range(len(dendrogram))]
+    parents = np.array(
+        [-1 if me.parent is None else me.parent.idx for me in structures],
+        dtype=np.int64,
+    )
+    counts = [len(me._values) for me in structures]
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    empty = np.zeros((0, dendrogram.data.ndim), dtype=np.int64)
+    indices = np.concatenate([empty, *[np.array(me._indices) for me in structures]])
+    values = np.concatenate([np.zeros(0), *[me._values for me in structures]])
+    return parents, offsets, indices.reshape(-1, dendrogram.data.ndim), values
+
+
+def unflatten_dendrogram(shape, parents, offsets, indices, values):
+    """
+    Dendrogram from the output of `flatten_dendrogram`, whose structures keep
+    their pixels as arrays like the structures that are merged.
+    """
+    from dendro.distributed_dendrogram import Structure
+
+    dendrogram = Dendrogram()
+    dendrogram.n_dim = len(shape)
+    structures = [
+        Structure(
+            indices=indices[offsets[idx] : offsets[idx + 1]],
+            values=values[offsets[idx] : offsets[idx + 1]],
+            idx=idx,
+            children=[],
+            dendrogram=dendrogram,
+        )
+        for idx in range(len(parents))
+    ]
+    for idx, parent in enumerate(parents.tolist()):
+        if parent >= 0:
+            structures[parent].children.append(structures[idx])
+            structures[idx].parent = structures[parent]
+    dendrogram._structures_dict = dict(enumerate(structures))
+    dendrogram._trunk = [me for me in structures if me.parent is None]
+
+    dendrogram.index_map = -np.ones(shape, dtype=np.int32)
+    dendrogram.index_map[*indices.T] = np.repeat(
+        np.arange(len(parents)), np.diff(offsets)
+    )
+    return dendrogram
+
+
+def get_context():
+    # workers are forked from a server that has only imported this module
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def _compute_block(name, shape, dtype, block, local_engine, kwargs):
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        data = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        local_data = np.array(data[block])
+    finally:
+        memory.close()
+    if local_engine == "numba":
+        from dendro.local_dendrogram import compute_flat
+
+        return compute_flat(local_data, **kwargs)
+    return flatten_dendrogram(Dendrogram.compute(local_data, **kwargs))
+
+
+def compute_local_dendrograms(
+    data, blocks, workers=None, local_engine="astrodendro", **kwargs
+):
+    """
+    Compute the dendrograms of blocks of a numpy array in a pool of `workers`
+    processes, which defaults to the number of cores. The indices of the
+    structures of the returned dendrograms are relative to the block. With the
+    "numba" local engine, workers use `dendro.local_dendrogram.compute_flat`
+    instead of astrodendro.
+    """
+    data = np.ascontiguousarray(data)
+    memory = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+    try:
+        np.ndarray(data.shape, dtype=data.dtype, buffer=memory.buf)[...] = data
+        context = get_context()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(
+                    _compute_block,
+                    memory.name,
+                    data.shape,
+                    data.dtype,
+                    s,
+                    local_engine,
+                    kwargs,
+                )
+                for s in blocks
+            ]
+            flat = [future.result() for future in futures]
+    finally:
+        memory.close()
+        memory.unlink()
+
+    return [unflatten_dendrogram(data[s].shape, *me) for s, me in zip(blocks, flat)]
@@ -0,0 +1,35 @@
+import heapq
+from itertools import count
+
+
+class StructureQueue:
+    """
+    Pending structures of the global merge, ordered by decreasing `_vmax`.
+
+    Structures with equal `_vmax` are popped in the order in which they were
+    pushed, which is the same order that inserting into a list sorted by
+    `_vmax` gives.
+    """
+
+    def __init__(self, structures=()):
+        self._heap = []
+        self._counter = count()
+        for structure in structures:
+            self.push(structure)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        return (entry[-1] for entry in sorted(self._heap))
+
+    def push(self, structure):
+        heapq.heappush(
+            self._heap, (-float(structure._vmax), next(self._counter), structure)
+        )
+
+    def pop(self):
+        return heapq.heappop(self._heap)[-1]
+
+    def peek(self):
+        return self._heap[0][-1]
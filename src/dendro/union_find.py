@@ -0,0 +1,45 @@
+import numpy as np
+
+
+class DisjointSet:
+    """
+    Disjoint-set forest over the labels of merged structures.
+
+    The parent of a label is the label of the branch that the structure was
+    merged into, so the root of a label is the index of its ancestor. Lookups
+    take arrays of labels and compress the paths they walk.
+    """
+
+    def __init__(self, size=0, capacity=64):
+        self._parent = np.arange(max(size, capacity), dtype=np.int64)
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def add(self):
+        if self.size == len(self._parent):
+            self._parent = np.append(
+                self._parent, np.arange(self.size, 2 * self.size, dtype=np.int64)
+            )
+        self.size += 1
+        return self.size - 1
+
+    def find(self, labels):
+        labels = np.asarray(labels, dtype=np.int64)
+        roots = self._parent[labels]
+
+        path = [labels]
+        parents = self._parent[roots]
+        while np.any(parents != roots):
+            path.append(roots)
+            roots = parents
+            parents = self._parent[roots]
+
+        # path compression
+        for nodes in path:
+            self._parent[nodes] = roots
+        return roots
+
+    def union(self, labels, root):
+        self._parent[self.find(labels)] = root
@@ -36,8 +36,16 @@ def get_2d_data(n, n_peaks=-1):
     return X, Y, data
 
 
+def get_tied_data(variant, shape, seed=0):
+    # many pixels share a value, either integers or normal noise in steps of 0.1
+    rng = np.random.default_rng(seed)
+    if variant == "integer":
+        return rng.integers(0, 4, shape).astype(np.float64)
+    return np.round(rng.normal(size=shape), 1)
+
+
 def compare_dendrograms(ref_dendrogram, other_dendrogram):
-    from dendro.distributed_dendrogram import shares_row
+    from dendro.coordinate_set import CoordinateSet
 
     n_structures1 = len([me for me in ref_dendrogram.all_structures])
     n_structures2 = len([me for me in other_dendrogram.all_structures])
@@ -45,13 +53,19 @@ def compare_dendrograms(ref_dendrogram, other_dendrogram):
         f"Got {n_structures1} structures in reference dendrogram, but {n_structures2} in other one"
     )
 
+    # look up which structure of the other dendrogram each pixel belongs to
+    other_structures = [me for me in other_dendrogram.all_structures]
+    other_indices = [np.array(me._indices) for me in other_structures]
+    owner = np.repeat(
+        np.arange(len(other_structures)), [len(me) for me in other_indices]
+    )
+    other_pixels = CoordinateSet(np.concatenate(other_indices))
+
     for structure in ref_dendrogram.all_structures:
+        indices = np.array(structure._indices)
+        position = other_pixels.index(indices)
         corresponds_to = [
-            ref_struct
-            for ref_struct in other_dendrogram.all_structures
-            if np.any(
-                shares_row(np.array(structure._indices), np.array(ref_struct._indices))
-            )
+            other_structures[i] for i in np.unique(owner[position[position >= 0]])
         ]
         assert len(corresponds_to) == 1, (
             f"Structure {structure.idx} in reference dendrogram corresponds to {len(corresponds_to)} structures {[me.idx for me in corresponds_to]} in the merged one"
@@ -60,7 +74,7 @@ def compare_dendrograms(ref_dendrogram, other_dendrogram):
             "Structures have different lengths"
         )
         assert np.allclose(
-            np.sort(np.array(structure._indices).flatten()),
+            np.sort(indices.flatten()),
             np.sort(np.array(corresponds_to[0]._indices).flatten()),
         ), r"Indices don\'t match between merged and reference structure"
 
@@ -1,6 +1,9 @@
 import numpy as np
 import heat as ht
 
+from dendro.decomposition import get_counts
+from dendro.exchange import alltoall_arrays
+
 
 def _get_local_indices(flat_data, ntasks, halo_size):
     assert len(flat_data.shape) == 1
@@ -48,3 +51,125 @@ def distribute_vertically_serial(data, ntasks, halo_size):
     local_idx = _get_local_indices(flat_data, ntasks, halo_size)
     local_data = [_get_local_data(flat_data, data.shape, idx) for idx in local_idx]
     return local_data
+
+
+# The distributed version never holds the full cube on one rank. Every rank
+# contributes the (value, linear index) pairs of its local data to a parallel
+# sample sort, which orders the pairs by value with ties broken by the index.
+# The sorted pairs are then cut into bands of the same length as in the serial
+# version, and every rank receives the pixels of its band plus the halo as
+# compact lists of coordinates and values.
+
+
+def _get_local_pairs(data, min_value=None):
+    """
+    Finite values of the local part of a DNDarray that are larger than
+    `min_value` and their linear index in the global array. Data that is not
+    split is shared evenly among the ranks.
+    """
+    comm = data.comm
+    local = data.larray.cpu().numpy()
+
+    if data.split is None:
+        counts = get_counts(local.size, comm.size)
+        start = counts[: comm.rank].sum()
+        linear = np.arange(start, start + counts[comm.rank], dtype=np.int64)
+        values = local.ravel()[linear]
+    else:
+        _, displs = data.counts_displs()
+        ranges = [np.arange(n, dtype=np.int64) for n in local.shape]
+        ranges[data.split] = ranges[data.split] + displs[comm.rank]
+        linear = np.ravel_multi_index(np.ix_(*ranges), data.shape).ravel()
+        values = local.ravel()
+
+    valid = np.isfinite(values)
+    if min_value is not None:
+        valid &= values > min_value
+    return values[valid].astype(np.float64), linear[valid]
+
+
+def _sort_pairs(values, linear):
+    order = np.lexsort((linear, values))
+    return values[order], linear[order]
+
+
+def _searchsorted_pairs(values, linear, splitters):
+    # positions of the (value, linear index) splitters in the sorted pairs
+    positions = []
+    for value, index in splitters:
+        lo = np.searchsorted(values, value, side="left")
+        hi = np.searchsorted(values, value, side="right")
+        positions.append(lo + np.searchsorted(linear[lo:hi], index))
+    return positions
+
+
+def sample_sort(comm, values, linear):
+    """
+    Parallel sample sort of (value, linear index) pairs. Every rank sorts its
+    pairs and contributes regular samples, from which the splitters between
+    the ranks are chosen. Returns the pairs that fall between the splitters of
+    this rank, sorted. The ranks hold about the same number of pairs unless
+    the values are very unevenly distributed. All bands are empty if no rank
+    holds any pairs.
+    """
+    values, linear = _sort_pairs(values, linear)
+    size = comm.size
+    if size == 1:
+        return values, linear
+
+    samples = np.linspace(0, len(values), size, endpoint=False).astype(np.int64)
+    samples = [(values[i], linear[i]) for i in samples[samples < len(values)]]
+    samples = sorted(sample for me in comm.allgather(samples) for sample in me)
+    if len(samples) == 0:
+        return values, linear
+    splitters = [samples[i * len(samples) // size] for i in range(1, size)]
+
+    cuts = [0, *_searchsorted_pairs(values, linear, splitters), len(values)]
+    parts = [slice(cuts[i], cuts[i + 1]) for i in range(size)]
+    values = alltoall_arrays(comm, [values[s] for s in parts], np.float64)
+    linear = alltoall_arrays(comm, [linear[s] for s in parts], np.int64)
+    return _sort_pairs(np.concatenate(values), np.concatenate(linear))
+
+
+def distribute_vertically(data, halo_size):
+    """
+    Distributed version of `distribute_vertically_serial` with one band per
+    rank. Returns the coordinates of the pixels in the band of this rank plus
+    the halo as an array of shape (n, ndim) and their values, both sorted by
+    value. Non-finite values are not part of any band.
+    """
+    values, linear = get_band_pairs(data, halo_size)
+    indices = np.stack(np.unravel_index(linear, data.shape), axis=1)
+    return indices, values
+
+
+def get_band_pairs(data, halo_size=0, min_value=None):
+    """
+    Values and linear indices of the pixels in the band of this rank plus the
+    halo, sorted by value and then by index. Only finite values larger than
+    `min_value` are part of a band.
+    """
+    comm = data.comm
+    values, linear = sample_sort(comm, *_get_local_pairs(data, min_value))
+
+    # position of the local pairs in the global order
+    counts = np.array(comm.allgather(len(values)), dtype=np.int64)
+    total = counts.sum()
+    start = counts[: comm.rank].sum()
+    stop = start + len(values)
+
+    elements_per_task = int(np.ceil(total / comm.size))
+    send_values, send_linear = [], []
+    for i in range(comm.size):
+        band_start = max(i * elements_per_task - (halo_size if i > 0 else 0), 0)
+        band_stop = (i + 1) * elements_per_task
+        if i < comm.size - 1:
+            band_stop += halo_size
+        lo = min(max(band_start, start), stop) - start
+        hi = min(max(band_stop, start), stop) - start
+        send_values.append(values[lo : max(lo, hi)])
+        send_linear.append(linear[lo : max(lo, hi)])
+
+    values = np.concatenate(alltoall_arrays(comm, send_values, np.float64))
+    linear = np.concatenate(alltoall_arrays(comm, send_linear, np.int64))
+    return values, linear
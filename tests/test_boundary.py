@@ -0,0 +1,104 @@
+import numpy as np
+
+
+def test_get_rim():
+    from dendro.boundary import get_rim
+
+    square = np.stack(np.meshgrid(range(1, 4), range(1, 4), indexing="ij"), -1)
+    square = square.reshape(-1, 2)
+
+    rim = get_rim(square, (5, 5))
+    assert np.array_equal(square[~rim], [[2, 2]])
+
+    # neighbours outside the data do not count
+    rim = get_rim(square - 1, (3, 3))
+    assert not np.any(rim)
+
+
+def test_pack_structures():
+    from astrodendro import Dendrogram
+    from dendro.boundary import get_slab_faces, pack_structures
+
+    data = np.zeros((10, 10))
+    data[1:4, 1:4] = 1
+    data[2, 2] = 2
+    data[5:9, 4:7] = 3
+
+    dendrogram = Dendrogram.compute(data, min_value=0.5)
+    faces = get_slab_faces(0, 0, 8, 10)
+    assert faces == [(0, 7)]
+
+    boundary, placeholders, summaries, pixels = pack_structures(
+        list(dendrogram.all_structures), faces, data.shape
+    )
+
+    # only the second peak touches the face
+    assert len(boundary) == 1
+    assert np.all(data[tuple(boundary[0][1].T)] == 3)
+
+    # the first peak is a single interior structure, which is replaced by its rim
+    assert len(placeholders) == 1 and len(summaries) == 1
+    idx, parent, vmin, vmax, npix = summaries[0]
+    assert (parent, vmin, vmax, npix) == (-1, 1, 2, 9)
+    assert placeholders[0][0] == idx
+    assert len(placeholders[0][1]) == 8
+    assert len(pixels[idx][1]) == 9
+
+
+def test_pack_halo_structures():
+    from astrodendro import Dendrogram
+    from dendro.boundary import get_halo_region, pack_halo_structures
+
+    # one peak across the boundary of two slabs and one inside the second slab
+    data = np.zeros(20)
+    data[8:11] = [1, 2, 1]
+    data[16:18] = 1
+    cores = [(0, 10), (10, 20)]
+
+    packed = []
+    for rank in range(2):
+        start, stop = get_halo_region(*cores[rank], len(data), 3)
+        dendrogram = Dendrogram.compute(data[start:stop], min_value=0.5)
+        structures = list(dendrogram.all_structures)
+        for me in structures:
+            me._indices = np.array(me._indices) + start
+        packed.append(pack_halo_structures(structures, 0, cores, rank, data.shape, 3))
+
+    # the first peak is resolved by the first rank only
+    boundary, placeholders, summaries, pixels = packed[0]
+    assert len(boundary) == 0 and len(summaries) == 1
+    assert np.array_equal(np.sort(pixels[summaries[0][0]][0].ravel()), [8, 9, 10])
+
+    # the second rank drops the first peak and resolves the second one
+    boundary, placeholders, summaries, pixels = packed[1]
+    assert len(summaries) == 1 and len(boundary) == 0
+    assert np.array_equal(np.sort(pixels[summaries[0][0]][0].ravel()), [16, 17])
+
+
+def test_summarize_structures():
+    from astrodendro import Dendrogram
+    from dendro.boundary import summarize_structures
+
+    data = np.zeros((10, 10))
+    data[1:4, 1:4] = 1
+    data[2, 2] = 2
+    data[5:9, 4:7] = 3
+
+    dendrogram = Dendrogram.compute(data[:8], min_value=0.5)
+    structures = list(dendrogram.all_structures)
+    block = (slice(0, 8), slice(0, 10))
+    summaries, pixels = summarize_structures(structures, 1, data.shape, block)
+    summaries = {me.idx: me for me in summaries}
+
+    for structure in structures:
+        summary = summaries[structure.idx]
+        assert summary.rank == 1
+        assert (summary.vmin, summary.vmax) == (structure.vmin, structure.vmax)
+        assert summary.npix == len(summary.values) + len(pixels[structure.idx][1])
+
+        # the first peak touches nothing but empty pixels within the block, the
+        # second one only touches the face at the end of the block
+        if structure.vmax == 2:
+            assert len(summary.values) == 1
+        else:
+            assert np.array_equal(np.unique(summary.indices[:, 0]), [7])
@@ -0,0 +1,34 @@
+import pytest
+import numpy as np
+
+
+@pytest.mark.parametrize("ndim", [1, 2, 3])
+def test_coordinate_set(ndim):
+    from dendro.coordinate_set import CoordinateSet
+
+    rng = np.random.default_rng(ndim)
+    coordinates = rng.integers(-5, 20, size=(50, ndim))
+    coordinates = coordinates[np.unique(coordinates, axis=0, return_index=True)[1]]
+    rows = rng.integers(-10, 25, size=(200, ndim))
+    rows = np.concatenate([rows, coordinates[::-1]])
+
+    coordinate_set = CoordinateSet(coordinates)
+    assert len(coordinate_set) == len(coordinates)
+
+    # reference: compare all pairs of rows
+    expect = np.array([np.any(np.all(row == coordinates, axis=1)) for row in rows])
+    assert np.array_equal(coordinate_set.contains(rows), expect)
+    assert coordinate_set.intersects(rows)
+    assert not coordinate_set.intersects([coordinates.max(axis=0) + 1])
+
+    index = coordinate_set.index(rows)
+    assert np.all(index[~expect] == -1)
+    assert np.array_equal(coordinates[index[expect]], rows[expect])
+
+    empty = CoordinateSet(np.zeros((0, ndim), dtype=int))
+    assert len(empty) == 0
+    assert not empty.intersects(rows)
+
+
+if __name__ == "__main__":
+    test_coordinate_set(2)
@@ -0,0 +1,93 @@
+import pytest
+import numpy as np
+
+
+def test_block_decomposition():
+    from dendro.decomposition import BlockDecomposition
+
+    blocks = BlockDecomposition((10, 9), 6, dims=(2, 0))
+    assert blocks.dims == (2, 3)
+
+    # blocks are row-major in the grid and cover the data exactly once
+    covered = np.zeros((10, 9), dtype=int)
+    for rank in range(6):
+        covered[blocks.get_block(rank)] += 1
+    assert np.all(covered == 1)
+    assert blocks.get_block(4) == (slice(5, 10), slice(3, 6))
+
+    assert blocks.get_neighbours(4) == {(0, -1): 1, (1, -1): 3, (1, 1): 5}
+    assert blocks.get_faces(4) == [(0, 5), (1, 3), (1, 5)]
+
+    # blocks have less surface than slabs with the same number of ranks
+    slabs = BlockDecomposition.slab((10, 9), 6, axis=0)
+    assert slabs.dims == (6, 1)
+    assert blocks.count_face_pixels() < slabs.count_face_pixels()
+
+
+def test_balanced_offsets():
+    from dendro.decomposition import BlockDecomposition, get_balanced_offsets
+
+    weights = np.array([0, 0, 0, 0, 5, 5, 1, 1, 0, 0])
+    assert get_balanced_offsets(weights, 2).tolist() == [0, 5, 10]
+    assert get_balanced_offsets(weights, 3).tolist() == [0, 5, 6, 10]
+
+    # every part keeps at least one element
+    assert get_balanced_offsets([0, 0, 0, 9], 3).tolist() == [0, 2, 3, 4]
+    assert get_balanced_offsets(np.zeros(4), 2).tolist() == [0, 2, 4]
+
+    blocks = BlockDecomposition((10, 4), 4, (2, 2), weights=[weights, np.ones(4)])
+    assert blocks.get_block(3) == (slice(5, 10), slice(2, 4))
+
+
+def test_choose_grid():
+    from dendro.decomposition import choose_grid, get_grids
+
+    assert sorted(get_grids(4, 2)) == [(1, 4), (2, 2), (4, 1)]
+    assert len(get_grids(12, 3)) == 18
+
+    # few channels along the first axis should not be split
+    shape = (4, 64, 64)
+    profiles = [np.full(n, np.prod(shape) // n) for n in shape]
+    grid, layout = choose_grid(shape, 4, profiles)
+    assert grid == (1, 2, 2)
+    assert layout["grid"] == grid and len(layout["candidates"]) == 6
+    assert layout["predicted_cost"] == min(layout["candidates"].values())
+
+    grid, _ = choose_grid(shape, 4, profiles, slabs_only=True)
+    assert grid in [(1, 4, 1), (1, 1, 4)]
+
+    # emission in a few rows of the second axis makes slabs there unbalanced
+    shape = (4, 128, 64)
+    profiles = [np.full(4, 16 * 64), np.zeros(128, dtype=int), np.full(64, 4 * 16)]
+    profiles[1][:16] = 4 * 64
+    grid, layout = choose_grid(shape, 4, profiles, slabs_only=True)
+    assert grid == (1, 1, 4) and layout["predicted_imbalance"] == 1
+    grid, _ = choose_grid(shape, 4, profiles, balance=True, slabs_only=True)
+    assert grid == (1, 4, 1)
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+@pytest.mark.parametrize("grid", [(0, 0), (1, 0)])
+def test_get_local_block(mpi_ranks, grid):
+    import heat as ht
+    from dendro.decomposition import BlockDecomposition
+
+    data = np.arange(12 * 7, dtype=float).reshape(12, 7)
+    distributed = ht.array(data, split=0)
+
+    blocks = BlockDecomposition(data.shape, distributed.comm.size, grid)
+    block = blocks.get_block(distributed.comm.rank)
+    assert np.array_equal(blocks.get_local_block(distributed), data[block])
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+def test_weight_profiles(mpi_ranks):
+    import heat as ht
+    from dendro.decomposition import get_weight_profiles
+
+    data = np.arange(12 * 7, dtype=float).reshape(12, 7)
+    data[:3] = np.nan
+
+    profiles = get_weight_profiles(ht.array(data, split=0), min_value=14)
+    assert profiles[0].tolist() == [0] * 3 + [7] * 9
+    assert profiles[1].tolist() == [9] * 7
@@ -107,6 +107,92 @@ def test_chunk_local_structures():
     )
 
 
+def test_structure_append_pixels():
+    from dendro.distributed_dendrogram import Structure
+
+    structure = Structure(indices=[(0, 0), (0, 1)], values=[3.0, 2.0], idx=0)
+    pieces = [
+        (np.array([(1, 0), (1, 1)]), np.array([1.0, 0.5])),
+        (np.array([(2, 0)]), np.array([0.2])),
+    ]
+    for indices, values in pieces:
+        structure._append_pixels(indices, values)
+
+    # merged pixels are kept as separate pieces until they are needed
+    assert len(structure._index_pieces) == 3
+    assert structure.get_npix(subtree=False) == 5
+    assert len(structure._index_pieces) == 3
+
+    assert np.allclose(structure._indices, [(0, 0), (0, 1), (1, 0), (1, 1), (2, 0)])
+    assert np.allclose(structure._values, [3.0, 2.0, 1.0, 0.5, 0.2])
+    assert len(structure._index_pieces) == 1
+    assert len(structure._value_pieces) == 1
+
+
+def test_finalize_structures():
+    from dendro.distributed_dendrogram import Structure, finalize_structures
+    from astrodendro import Dendrogram
+
+    data = np.array([3.0, 1.0, 2.0, 0.5, 4.0])
+    dendrogram = Dendrogram()
+    dendrogram.data = data
+    dendrogram.index_map = np.array([0, 2, 1, 3, 4])
+
+    # two leaves merge into a branch, which merges with a third leaf
+    leaves = [
+        Structure([(0,)], [3.0], idx=0),
+        Structure([(2,)], [2.0], idx=1),
+        Structure([(4,)], [4.0], idx=4),
+    ]
+    branch = Structure([(1,)], [1.0], children=leaves[:2], idx=2)
+    trunk = Structure([(3,)], [0.5], children=[branch, leaves[2]], idx=3)
+    structures = finalize_structures(dendrogram, leaves + [branch, trunk])
+
+    assert len(structures) == 5
+    assert [me.idx for me in dendrogram.trunk] == [3]
+    assert len(list(dendrogram.all_structures)) == 5
+    assert {me.idx: me.level for me in structures} == {0: 2, 1: 2, 2: 1, 3: 0, 4: 1}
+
+    # lists for astrodendro are only built on access
+    leaf = dendrogram[0]
+    assert leaf._index_list is None and leaf._value_list is None
+    assert leaf.get_npix(subtree=False) == 1
+    assert np.allclose(dendrogram[3].values(subtree=True), [0.5, 1.0, 3.0, 2.0, 4.0])
+    assert leaf._index_list is None and leaf._value_list is None
+    assert leaf._indices == [(0,)]
+    assert leaf._values == [3.0]
+
+    assert dendrogram.structure_at((2,)) is dendrogram[1]
+    assert dendrogram[3].get_peak(subtree=True) == ((4,), 4.0)
+    assert dendrogram.to_newick() == "(((0:3.000,1:2.000)2:2.000,4:4.000)3:1.000);"
+
+
+def test_relabel_local_dendrograms():
+    from dendro.distributed_dendrogram import relabel_local_dendrograms
+    from astrodendro import Dendrogram
+
+    data = np.random.default_rng(0).random((12, 7))
+    slices = [slice(0, 5), slice(5, 12)]
+    dendrograms = [Dendrogram.compute(data[s]) for s in slices]
+    n_structures = [len(list(me.all_structures)) for me in dendrograms]
+
+    structures, index_map = relabel_local_dendrograms(dendrograms, slices, data.shape)
+
+    assert sorted(me.idx for me in structures) == list(range(sum(n_structures)))
+    for i, structure in enumerate(structures):
+        s = slices[int(i >= n_structures[0])]
+        assert np.all(index_map[s][*np.array(structure._indices).T] == structure.idx)
+    assert np.all(index_map >= 0)
+
+    # the structures alone get the same labels
+    from dendro.distributed_dendrogram import relabel_local_structures
+
+    dendrograms = [Dendrogram.compute(data[s]) for s in slices]
+    assert [me.idx for me in relabel_local_structures(dendrograms)] == [
+        me.idx for me in structures
+    ]
+
+
 @pytest.mark.parametrize("ntasks", [1, 2, 4])
 @pytest.mark.parametrize("res", [32, 64, 128])
 @pytest.mark.parametrize("n_peaks", [1, 2, 4])
@@ -0,0 +1,179 @@
+import pytest
+import numpy as np
+
+from astrodendro.dendrogram import Dendrogram
+
+from dendro.distributed_dendrogram_kruskal import DistributedDendrogramKruskal
+from dendro.utils import compare_dendrograms
+
+
+@pytest.mark.parametrize("ntasks", [1, 2, 3, 4, 7])
+@pytest.mark.parametrize("res", [32, 64])
+def test_1D_kruskal_pseudo_parallel(ntasks, res):
+    from dendro.utils import get_1d_data
+
+    _, data = get_1d_data(res)
+
+    dendrogram = DistributedDendrogramKruskal.compute_pseudo_parallel(
+        data.numpy(), ntasks
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.parametrize("ntasks", [1, 2, 3, 4, 7])
+@pytest.mark.parametrize("n_peaks", [1, 2, 3, 4])
+@pytest.mark.parametrize("noise", [0, 0.05])
+def test_2D_kruskal_pseudo_parallel(ntasks, n_peaks, noise):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, n_peaks)
+    data = data.numpy() + noise * np.random.default_rng(ntasks).random(data.shape)
+
+    dendrogram = DistributedDendrogramKruskal.compute_pseudo_parallel(data, ntasks)
+    reference_dendrogram = Dendrogram.compute(data)
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.parametrize("ntasks", [2, 5])
+@pytest.mark.parametrize("threads", [1, 3])
+def test_2D_kruskal_threads_pseudo_parallel(ntasks, threads):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 3)
+    data = data.numpy() + 0.05 * np.random.default_rng(0).random(data.shape)
+
+    dendrogram = DistributedDendrogramKruskal.compute_pseudo_parallel(
+        data, ntasks, threads=threads
+    )
+    reference_dendrogram = Dendrogram.compute(data)
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.parametrize("ntasks", [1, 2, 4])
+@pytest.mark.parametrize("res", [32, 64])
+@pytest.mark.parametrize("n_peaks", [1, 2, 3, 4])
+def test_2D_kruskal_v3_pseudo_parallel(ntasks, res, n_peaks):
+    from dendro.distributed_dendrogram_v3 import DistributedDendrogramV3
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(res, n_peaks)
+
+    dendrogram = DistributedDendrogramKruskal.compute_pseudo_parallel(
+        data.numpy(), ntasks
+    )
+    v3_dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(
+        data.numpy(), ntasks
+    )
+    compare_dendrograms(v3_dendrogram, dendrogram)
+
+
+@pytest.mark.parametrize("ntasks", [1, 3, 8])
+@pytest.mark.parametrize("min_value", ["min", 0.5])
+def test_3D_kruskal_pseudo_parallel(ntasks, min_value):
+    data = np.random.default_rng(ntasks).random((8, 9, 10))
+    data[2, 3, :] = np.nan
+
+    dendrogram = DistributedDendrogramKruskal.compute_pseudo_parallel(
+        data, ntasks, min_value=min_value
+    )
+    reference_dendrogram = Dendrogram.compute(data, min_value=min_value)
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+    # the tree is the same, not only the pixels of the structures
+    def summarize(dendrogram):
+        return sorted(
+            (me.vmin, me.vmax, me.get_npix(), me.level, me.is_leaf)
+            for me in dendrogram.all_structures
+        )
+
+    assert summarize(dendrogram) == summarize(reference_dendrogram)
+
+
+@pytest.mark.parametrize("ntasks", [1, 2, 3, 5])
+@pytest.mark.parametrize("variant", ["quantized", "integer"])
+@pytest.mark.parametrize("shape", [(12, 13), (32, 32), (6, 7, 8)])
+def test_kruskal_ties_pseudo_parallel(ntasks, variant, shape):
+    from dendro.local_dendrogram import compute_local_dendrogram
+    from dendro.utils import get_tied_data
+
+    data = get_tied_data(variant, shape)
+
+    # astrodendro leaves the order of tied pixels to np.argsort, while they
+    # are added by decreasing linear index here
+    dendrogram = DistributedDendrogramKruskal.compute_pseudo_parallel(data, ntasks)
+    reference_dendrogram = compute_local_dendrogram(data, kind="stable")
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.mpi(ranks=[1, 2, 3])
+@pytest.mark.parametrize("n_peaks", [2, 4])
+@pytest.mark.parametrize("noise", [0, 0.05])
+@pytest.mark.parametrize("split", [None, 0, 1])
+def test_2D_kruskal(mpi_ranks, n_peaks, noise, split):
+    import heat as ht
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, n_peaks)
+    data = data.numpy() + noise * np.random.default_rng(0).random(data.shape)
+
+    dendrogram = DistributedDendrogramKruskal.compute(ht.array(data, split=split))
+    reference_dendrogram = Dendrogram.compute(data)
+    compare_dendrograms(reference_dendrogram, dendrogram)
+    assert np.array_equal(
+        dendrogram.index_map >= 0, reference_dendrogram.index_map >= 0
+    )
+
+
+@pytest.mark.mpi(ranks=[1, 2, 3])
+@pytest.mark.parametrize("variant", ["quantized", "integer"])
+def test_2D_kruskal_ties(mpi_ranks, variant):
+    import heat as ht
+    from dendro.local_dendrogram import compute_local_dendrogram
+    from dendro.utils import get_tied_data
+
+    data = get_tied_data(variant, (32, 32))
+
+    dendrogram = DistributedDendrogramKruskal.compute(ht.array(data, split=0))
+    reference_dendrogram = compute_local_dendrogram(data, kind="stable")
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.mpi(ranks=[1, 2, 3])
+@pytest.mark.parametrize("split", [0, 1])
+def test_2D_kruskal_float32(mpi_ranks, split):
+    import heat as ht
+    from dendro.utils import get_2d_data
+
+    # slab values and saddle values need to have the same dtype on all ranks
+    _, _, data = get_2d_data(32, 3)
+    data = data.numpy().astype(np.float32)
+
+    dendrogram = DistributedDendrogramKruskal.compute(ht.array(data, split=split))
+    reference_dendrogram = Dendrogram.compute(data)
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+def test_2D_kruskal_distributed_output(mpi_ranks):
+    import heat as ht
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 3)
+    data = data.numpy() + 0.05 * np.random.default_rng(0).random(data.shape)
+
+    dendrogram = DistributedDendrogramKruskal.compute(
+        ht.array(data, split=0), output="distributed", instrument=True
+    )
+    assert isinstance(dendrogram.index_map, ht.DNDarray)
+    assert dendrogram.statistics["sent_pixels"] <= data.shape[1]
+
+    reference_dendrogram = Dendrogram.compute(data)
+    compare_dendrograms(reference_dendrogram, dendrogram.gather())
+
+
+def test_kruskal_pruning():
+    import heat as ht
+
+    with pytest.raises(NotImplementedError):
+        DistributedDendrogramKruskal.compute(ht.zeros((4, 4), split=0), min_delta=1)
@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 from tempfile import TemporaryDirectory
 
 from astrodendro.dendrogram import Dendrogram
@@ -61,6 +62,379 @@ def test_2D_v3_pseudo_parallel(ntasks, res, n_peaks):
     compare_dendrograms(reference_dendrogram, dendrogram)
 
 
+@pytest.mark.parametrize("ntasks", [1, 3])
+@pytest.mark.parametrize("noise", [0, 0.05])
+@pytest.mark.parametrize("ndim", [1, 2])
+def test_v3_numba_engine(ntasks, noise, ndim):
+    from dendro.utils import get_1d_data, get_2d_data
+
+    data = get_1d_data(64)[-1] if ndim == 1 else get_2d_data(32)[-1]
+    rng = np.random.default_rng(ntasks)
+    data = data.numpy() + noise * rng.random(data.shape)
+
+    dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(
+        data, ntasks, engine="numba"
+    )
+    reference_dendrogram = Dendrogram.compute(data)
+    if noise == 0:
+        compare_dendrograms(reference_dendrogram, dendrogram)
+
+    # the kernel needs to give exactly the same result as the python merge
+    python_dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(data, ntasks)
+    assert dendrogram._iterations == python_dendrogram._iterations
+    assert np.array_equal(dendrogram.index_map, python_dendrogram.index_map)
+    for structure, other in zip(
+        dendrogram.all_structures, python_dendrogram.all_structures, strict=True
+    ):
+        assert structure.idx == other.idx
+        assert structure.level == other.level
+        assert np.array_equal(structure._index_array, other._index_array)
+        assert np.array_equal(structure._value_array, other._value_array)
+
+
+def test_v3_numba_engine_no_structures():
+    from dendro.merge_kernel import merge_flat_structures
+
+    index_map, parents, offsets, indices, values, iterations = merge_flat_structures(
+        [], [], (4, 5)
+    )
+    assert index_map.shape == (5, 6)
+    assert np.all(index_map == -1)
+    assert len(parents) == 0
+    assert offsets.tolist() == [0]
+    assert indices.shape == (0, 2)
+    assert len(values) == 0
+    assert iterations == 0
+
+    dendrogram = DistributedDendrogramV3()
+    dendrogram.data = np.zeros((4, 5))
+    dendrogram.compute_from_structures_numba([])
+    assert len(list(dendrogram.all_structures)) == 0
+
+
+@pytest.mark.parametrize("log", [False, True])
+def test_v3_instrumentation(caplog, log):
+    import logging
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32)
+
+    # nothing is recorded by default
+    dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(data.numpy(), 2)
+    assert not dendrogram.instrumentation.enabled
+    assert not hasattr(dendrogram, "statistics")
+
+    with caplog.at_level(logging.INFO, logger="Dendrogram"):
+        dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(
+            data.numpy(), 2, instrument=True, log=log
+        )
+    assert (len(caplog.records) > 0) == log
+
+    stats = dendrogram.statistics
+    n_structures = len(list(dendrogram.all_structures))
+    assert stats["iterations"] == dendrogram._iterations
+    assert stats["leaves"] + stats["branches"] == n_structures
+    assert stats["leaves"] + stats["branches"] + stats["merges"] == stats["iterations"]
+    assert stats["splits"] == stats["insertions"]
+    assert stats["adjacency_queries"] == 2 * stats["iterations"]
+    assert 0 < stats["time_adjacency_query"] < stats["time_merge"]
+
+
+@pytest.mark.parametrize("ntasks", [1, 2, 4])
+@pytest.mark.parametrize("engine", ["python", "numba"])
+@pytest.mark.parametrize("ndim", [1, 2])
+def test_v3_boundary_communication_pseudo_parallel(ntasks, engine, ndim):
+    from dendro.utils import get_1d_data, get_2d_data
+
+    data = get_1d_data(64)[-1] if ndim == 1 else get_2d_data(32, 4)[-1]
+
+    dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(
+        data.numpy(), ntasks, engine=engine, communication="boundary", instrument=True
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+    stats = dendrogram.statistics
+    assert stats["sent_boundary_pixels"] + stats["sent_rim_pixels"] <= data.size
+    if ntasks == 1:
+        assert stats["sent_boundary_pixels"] == 0
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+@pytest.mark.parametrize("n_peaks", [2, 3, 4])
+def test_2D_v3_boundary_communication(mpi_ranks, n_peaks):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, n_peaks)
+
+    dendrogram = DistributedDendrogramV3.compute(data, communication="boundary")
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+
+    # pixels of interior structures are only known on the rank that owns them
+    def summarize(dendrogram):
+        return sorted(
+            (me.vmin, me.vmax, me.get_npix(), me.level, me.is_leaf)
+            for me in dendrogram.all_structures
+        )
+
+    assert summarize(dendrogram) == summarize(reference_dendrogram)
+
+
+@pytest.mark.parametrize("ntasks", [1, 2, 4])
+@pytest.mark.parametrize("ndim", [1, 2, 3])
+def test_v3_summary_communication_pseudo_parallel(ntasks, ndim):
+    from dendro.utils import get_1d_data, get_2d_data
+
+    if ndim == 3:
+        data = np.random.default_rng(ntasks).random((8, 9, 10))
+        data[data < 0.3] = np.nan
+    else:
+        data = get_1d_data(64)[-1] if ndim == 1 else get_2d_data(32, 4)[-1]
+        data = data.numpy()
+
+    dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(
+        data, ntasks, communication="summary", instrument=True
+    )
+    reference_dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(data, ntasks)
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+    # only the rims are sent and pixels are pulled for splits only
+    stats = dendrogram.statistics
+    assert stats["sent_rim_pixels"] + stats["kept_pixels"] == np.sum(np.isfinite(data))
+    assert stats.get("fetched_pixels", 0) <= stats["kept_pixels"]
+    if ntasks == 1:
+        assert "fetched_structures" not in stats
+
+
+@pytest.mark.mpi(ranks=[1, 2, 3])
+@pytest.mark.parametrize("n_peaks", [2, 4])
+@pytest.mark.parametrize("output", ["replicated", "distributed"])
+def test_2D_v3_summary_communication(mpi_ranks, n_peaks, output):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, n_peaks)
+
+    dendrogram = DistributedDendrogramV3.compute(
+        data, communication="summary", output=output
+    )
+    reference_dendrogram = DistributedDendrogramV3.compute(data)
+    if data.comm.size < 3:
+        compare_dendrograms(Dendrogram.compute(data.numpy()), reference_dendrogram)
+
+    # with distributed output, pixels that were never pulled are only known on
+    # the rank that owns them until they are gathered
+    dendrogram.gather()
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.parametrize("ntasks", [1, 2, 4])
+@pytest.mark.parametrize("halo", [1, 4])
+@pytest.mark.parametrize("ndim", [1, 2])
+def test_v3_halo_pseudo_parallel(ntasks, halo, ndim):
+    from dendro.utils import get_1d_data, get_2d_data
+
+    data = get_1d_data(64)[-1] if ndim == 1 else get_2d_data(32, 4)[-1]
+    data = data.numpy() + 0.05 * np.random.default_rng(0).random(data.shape)
+
+    dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(
+        data, ntasks, communication="boundary", halo=halo, instrument=True
+    )
+    reference_dendrogram = Dendrogram.compute(data)
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+    # structures that fit into the halo are not merged any more
+    without_halo = DistributedDendrogramV3.compute_pseudo_parallel(
+        data, ntasks, communication="boundary", instrument=True
+    )
+    assert dendrogram.statistics["iterations"] <= without_halo.statistics["iterations"]
+
+
+@pytest.mark.parametrize("ntasks", [1, 2, 3, 4])
+@pytest.mark.parametrize("engine", ["python", "numba"])
+@pytest.mark.parametrize("ndim", [1, 2])
+def test_v3_tree_reduction_pseudo_parallel(ntasks, engine, ndim):
+    from dendro.utils import get_1d_data, get_2d_data
+
+    data = get_1d_data(64)[-1] if ndim == 1 else get_2d_data(32, 4)[-1]
+
+    dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(
+        data.numpy(), ntasks, engine=engine, communication="tree"
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+@pytest.mark.parametrize("engine", ["python", "numba"])
+def test_2D_v3_tree_reduction(mpi_ranks, engine):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 3)
+
+    dendrogram = DistributedDendrogramV3.compute(
+        data, engine=engine, communication="tree", instrument=True
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+    rounds = dendrogram.statistics.get("reduction_rounds", 0)
+    assert rounds == (int(np.log2(data.comm.size)) if data.comm.rank == 0 else 0)
+
+    # ranks that only send did not merge anything
+    time_merge = dendrogram.time_merge_dendrograms
+    assert time_merge > 0 if rounds > 0 or data.comm.size == 1 else time_merge == 0
+
+
+@pytest.mark.parametrize("ntasks", [1, 2, 3, 4])
+@pytest.mark.parametrize("engine", ["python", "numba"])
+@pytest.mark.parametrize("ndim", [1, 2])
+def test_v3_stream_pseudo_parallel(ntasks, engine, ndim):
+    from dendro.utils import get_1d_data, get_2d_data
+
+    data = get_1d_data(64)[-1] if ndim == 1 else get_2d_data(32, 4)[-1]
+
+    dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(
+        data.numpy(), ntasks, engine=engine, communication="stream"
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.mpi(ranks=[1, 2, 3])
+@pytest.mark.parametrize("engine", ["python", "numba"])
+def test_2D_v3_stream(mpi_ranks, engine):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 3)
+
+    dendrogram = DistributedDendrogramV3.compute(
+        data, engine=engine, communication="stream", instrument=True
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+    # every rank reports its timers and the root receives from all others
+    stats = dendrogram.statistics
+    assert len(stats["rank_timers"]) == data.comm.size
+    root = stats["rank_timers"][0]
+    assert 0 <= root.get("overlap", 0) <= root.get("stream_merge", 0)
+    assert sorted(dendrogram.arrivals) == (
+        list(range(1, data.comm.size)) if data.comm.rank == 0 else []
+    )
+    assert "arrivals" not in stats
+
+
+@pytest.mark.parametrize("grid", [(2, 2), (1, 4), (2, 4)])
+@pytest.mark.parametrize("communication", ["all", "boundary", "tree", "stream"])
+def test_2D_v3_blocks_pseudo_parallel(grid, communication):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 4)
+
+    dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(
+        data.numpy(), int(np.prod(grid)), communication=communication, grid=grid
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+@pytest.mark.parametrize("communication", ["all", "boundary", "tree"])
+def test_2D_v3_blocks(mpi_ranks, communication):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 3)
+
+    # split along the second axis, although the data is split along the first
+    dendrogram = DistributedDendrogramV3.compute(
+        data, communication=communication, grid=(1, 0)
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+
+    # pixels of interior structures are only known on the rank that owns them
+    if communication == "boundary":
+
+        def summarize(dendrogram):
+            return sorted(
+                (me.vmin, me.vmax, me.get_npix(), me.level, me.is_leaf)
+                for me in dendrogram.all_structures
+            )
+
+        assert summarize(dendrogram) == summarize(reference_dendrogram)
+    else:
+        compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+@pytest.mark.parametrize(
+    "grid, communication", [(None, "all"), (None, "root"), ((0, 0), "all")]
+)
+def test_2D_v3_load_balance(mpi_ranks, grid, communication):
+    import heat as ht
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 3)
+
+    # all emission is in the first rows
+    data = data.numpy()
+    data[20:] = np.nan
+    data = ht.array(data, split=0)
+
+    dendrogram = DistributedDendrogramV3.compute(
+        data, min_value=0.1, communication=communication, grid=grid, balance=True
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy(), min_value=0.1)
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+    load = dendrogram.load_balance
+    assert sum(load["loads_before"]) == sum(load["loads_after"])
+    assert load["imbalance_after"] <= load["imbalance_before"]
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+@pytest.mark.parametrize("split", [None, 0])
+@pytest.mark.parametrize("communication", ["all", "root"])
+def test_2D_v3_auto_layout(mpi_ranks, split, communication):
+    import heat as ht
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 3)
+    data = ht.array(data.numpy()[:, :16], split=split)
+
+    dendrogram = DistributedDendrogramV3.compute(
+        data, communication=communication, grid="auto"
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+    # the shorter axis gives the smaller faces between slabs
+    size = data.comm.size
+    assert dendrogram.layout["grid"] == (size, 1)
+    assert dendrogram.layout["face_pixels"] == 2 * 16 * (size - 1)
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+@pytest.mark.parametrize("halo", [1, 3])
+def test_2D_v3_halo(mpi_ranks, halo):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 4)
+
+    dendrogram = DistributedDendrogramV3.compute(
+        data, communication="boundary", halo=halo
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+
+    # pixels of interior structures are only known on the rank that owns them
+    def summarize(dendrogram):
+        return sorted(
+            (me.vmin, me.vmax, me.get_npix(), me.level, me.is_leaf)
+            for me in dendrogram.all_structures
+        )
+
+    assert summarize(dendrogram) == summarize(reference_dendrogram)
+
+
 @pytest.mark.mpi(ranks=[1, 2])
 @pytest.mark.parametrize("res", [32])
 @pytest.mark.parametrize("n_peaks", [2, 3])
@@ -74,6 +448,54 @@ def test_2D_v3(mpi_ranks, res, n_peaks):
     compare_dendrograms(reference_dendrogram, dendrogram)
 
 
+@pytest.mark.mpi(ranks=[1, 2])
+@pytest.mark.parametrize("engine", ["python", "numba"])
+def test_2D_v3_root_merge(mpi_ranks, engine):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 4)
+
+    dendrogram = DistributedDendrogramV3.compute(
+        data, engine=engine, communication="root"
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+@pytest.mark.parametrize("communication", ["all", "boundary", "tree", "root", "stream"])
+def test_2D_v3_distributed_output(mpi_ranks, communication):
+    import heat as ht
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 3)
+
+    dendrogram = DistributedDendrogramV3.compute(
+        data, communication=communication, output="distributed"
+    )
+    assert isinstance(dendrogram.data, ht.DNDarray)
+    assert dendrogram.index_map.split == data.split
+    assert dendrogram.index_map.lshape == data.lshape
+
+    # only the pixels in the local slab are kept
+    local_slab = dendrogram.get_local_slab()
+    for structure in dendrogram.all_structures:
+        position = structure._index_array[:, data.split]
+        assert np.all(position >= local_slab[data.split].start)
+        assert np.all(position < local_slab[data.split].stop)
+
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    assert sorted(me.get_npix() for me in dendrogram.all_structures) == sorted(
+        me.get_npix() for me in reference_dendrogram.all_structures
+    )
+
+    dendrogram.gather()
+    compare_dendrograms(reference_dendrogram, dendrogram)
+    assert np.array_equal(
+        dendrogram.index_map >= 0, reference_dendrogram.index_map >= 0
+    )
+
+
 @pytest.mark.mpi(ranks=[1, 2])
 def test_2D_save_and_load(mpi_ranks):
     from dendro.utils import get_2d_data
@@ -65,6 +65,27 @@ def test_2D_v4(mpi_ranks, res, n_peaks):
     compare_dendrograms(reference_dendrogram, dendrogram)
 
 
+@pytest.mark.mpi(ranks=[1, 2])
+@pytest.mark.parametrize("dtype", ["float32", "float64"])
+def test_2D_v4_dtype(mpi_ranks, dtype):
+    import heat as ht
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 3)
+    data = data.astype(getattr(ht, dtype))
+
+    # local and received structures keep the dtype of the data
+    dendrogram = DistributedDendrogramV4()
+    dendrogram.data, dendrogram.comm = data, data.comm
+    local_dendrogram = dendrogram.compute_local_dendrogram()
+    structures = dendrogram.communicate_structures(local_dendrogram)
+    assert {me._values.dtype for me in structures} == {data.larray.dtype}
+
+    dendrogram = DistributedDendrogramV4.compute(data)
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
 if __name__ == "__main__":
     import logging
 
@@ -0,0 +1,126 @@
+import pytest
+import numpy as np
+
+from astrodendro.dendrogram import Dendrogram
+
+from dendro.distributed_dendrogram_vertical import DistributedDendrogramVertical
+from dendro.utils import compare_dendrograms
+
+
+@pytest.mark.parametrize("ntasks", [1, 2, 3, 4, 7])
+@pytest.mark.parametrize("res", [32, 64])
+def test_1D_vertical_pseudo_parallel(ntasks, res):
+    from dendro.utils import get_1d_data
+
+    _, data = get_1d_data(res)
+
+    dendrogram = DistributedDendrogramVertical.compute_pseudo_parallel(
+        data.numpy(), ntasks
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.parametrize("ntasks", [1, 2, 3, 4, 7])
+@pytest.mark.parametrize("n_peaks", [1, 2, 3, 4])
+@pytest.mark.parametrize("noise", [0, 0.05])
+def test_2D_vertical_pseudo_parallel(ntasks, n_peaks, noise):
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, n_peaks)
+    data = data.numpy() + noise * np.random.default_rng(ntasks).random(data.shape)
+
+    dendrogram = DistributedDendrogramVertical.compute_pseudo_parallel(data, ntasks)
+    reference_dendrogram = Dendrogram.compute(data)
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.parametrize("ntasks", [1, 3, 8])
+@pytest.mark.parametrize("min_value", ["min", 0.5])
+def test_3D_vertical_pseudo_parallel(ntasks, min_value):
+    data = np.random.default_rng(ntasks).random((8, 9, 10))
+    data[2, 3, :] = np.nan
+
+    dendrogram = DistributedDendrogramVertical.compute_pseudo_parallel(
+        data, ntasks, min_value=min_value
+    )
+    reference_dendrogram = Dendrogram.compute(data, min_value=min_value)
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.parametrize("ntasks", [1, 2, 3, 7])
+@pytest.mark.parametrize("variant", ["quantized", "integer"])
+@pytest.mark.parametrize("shape", [(12, 13), (32, 32), (6, 7, 8)])
+def test_vertical_ties_pseudo_parallel(ntasks, variant, shape):
+    from dendro.local_dendrogram import compute_local_dendrogram
+    from dendro.utils import get_tied_data
+
+    data = get_tied_data(variant, shape)
+
+    # astrodendro leaves the order of tied pixels to np.argsort, while they
+    # are added by decreasing linear index here
+    dendrogram = DistributedDendrogramVertical.compute_pseudo_parallel(data, ntasks)
+    reference_dendrogram = compute_local_dendrogram(data, kind="stable")
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.mpi(ranks=[1, 2, 3])
+@pytest.mark.parametrize("n_peaks", [2, 4])
+@pytest.mark.parametrize("noise", [0, 0.05])
+@pytest.mark.parametrize("split", [None, 0, 1])
+def test_2D_vertical(mpi_ranks, n_peaks, noise, split):
+    import heat as ht
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, n_peaks)
+    data = data.numpy() + noise * np.random.default_rng(0).random(data.shape)
+
+    dendrogram = DistributedDendrogramVertical.compute(ht.array(data, split=split))
+    reference_dendrogram = Dendrogram.compute(data)
+    compare_dendrograms(reference_dendrogram, dendrogram)
+    assert np.array_equal(
+        dendrogram.index_map >= 0, reference_dendrogram.index_map >= 0
+    )
+
+
+@pytest.mark.mpi(ranks=[1, 2, 3])
+@pytest.mark.parametrize("variant", ["quantized", "integer"])
+def test_2D_vertical_ties(mpi_ranks, variant):
+    import heat as ht
+    from dendro.local_dendrogram import compute_local_dendrogram
+    from dendro.utils import get_tied_data
+
+    data = get_tied_data(variant, (32, 32))
+
+    dendrogram = DistributedDendrogramVertical.compute(ht.array(data, split=0))
+    reference_dendrogram = compute_local_dendrogram(data, kind="stable")
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+def test_2D_vertical_distributed_output(mpi_ranks):
+    import heat as ht
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 3)
+    data = data.numpy() + 0.05 * np.random.default_rng(0).random(data.shape)
+
+    dendrogram = DistributedDendrogramVertical.compute(
+        ht.array(data, split=0), output="distributed", instrument=True
+    )
+    assert isinstance(dendrogram.index_map, ht.DNDarray)
+    assert dendrogram.statistics["band_pixels"] <= data.size
+
+    reference_dendrogram = Dendrogram.compute(data)
+    compare_dendrograms(reference_dendrogram, dendrogram.gather())
+
+
+def test_vertical_pruning():
+    import heat as ht
+
+    with pytest.raises(NotImplementedError):
+        DistributedDendrogramVertical.compute(ht.zeros((4, 4), split=0), min_npix=2)
+
+
+if __name__ == "__main__":
+    test_2D_vertical_pseudo_parallel(3, 4, 0.05)
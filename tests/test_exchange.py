@@ -0,0 +1,95 @@
+import pytest
+import numpy as np
+
+
+def test_flatten_structures():
+    from dendro.exchange import flatten_structures, split_flat_structures
+
+    rng = np.random.default_rng(0)
+    shape = (7, 5, 3)
+    counts = [3, 0, 5, 1]
+    indices = [
+        np.stack([rng.integers(0, n, size=count) for n in shape], axis=1)
+        for count in counts
+    ]
+    values = [rng.random(count) for count in counts]
+
+    flat = flatten_structures(indices, shape, values=values, ids=[4, 2, 7, 1])
+    ids, _indices, _values = split_flat_structures(*flat[:3], shape, values=flat[3])
+
+    assert ids.tolist() == [4, 2, 7, 1]
+    for me, other in zip(indices + values, _indices + _values, strict=True):
+        assert np.array_equal(me, other)
+
+    # the structures are views into the flat arrays
+    assert all(me.base is flat[3] for me in _values)
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+def test_allgather_structures(mpi_ranks):
+    import heat as ht
+    from dendro.exchange import allgather_structures
+
+    comm = ht.MPI_WORLD
+    shape = (16, 8)
+
+    def get_structures(rank):
+        rng = np.random.default_rng(rank)
+        counts = rng.integers(0, 10, size=rank + 2)
+        indices = [
+            np.stack([rng.integers(0, n, size=count) for n in shape], axis=1)
+            for count in counts
+        ]
+        values = [rng.random(count) for count in counts]
+        return indices, values
+
+    indices, values = get_structures(comm.rank)
+    ids = np.arange(len(values)) + 100 * comm.rank
+    gathered = allgather_structures(comm, indices, shape, values=values, ids=ids)
+
+    assert len(gathered) == comm.size
+    for rank, (_ids, _indices, _values) in enumerate(gathered):
+        indices, values = get_structures(rank)
+        assert _ids.tolist() == list(np.arange(len(values)) + 100 * rank)
+        for me, other in zip(indices + values, _indices + _values, strict=True):
+            assert np.array_equal(me, other)
+
+    # only indices
+    gathered = allgather_structures(comm, indices, shape)
+    assert gathered[0][2] is None
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+def test_gather_and_scatter(mpi_ranks):
+    import heat as ht
+    from dendro.exchange import gather_structures, scatter_arrays
+
+    comm = ht.MPI_WORLD
+    shape = (16, 8)
+    indices = [np.array([[comm.rank, i] for i in range(comm.rank + 1)])]
+
+    gathered = gather_structures(comm, indices, shape, root=0)
+    if comm.rank == 0:
+        assert [len(me[1][0]) for me in gathered] == list(range(1, comm.size + 1))
+    else:
+        assert gathered is None
+
+    arrays = [np.arange(rank + 1) for rank in range(comm.size)]
+    received = scatter_arrays(comm, arrays, comm.rank + 1, np.int32)
+    assert np.array_equal(received, np.arange(comm.rank + 1))
+
+
+@pytest.mark.mpi(ranks=[1, 2, 3])
+def test_bcast_arrays(mpi_ranks):
+    import heat as ht
+    from dendro.exchange import bcast_arrays
+
+    comm = ht.MPI_WORLD
+    rng = np.random.default_rng(0)
+    arrays = [rng.random(5), rng.integers(0, 9, size=(4, 3)), np.zeros(0, dtype=int)]
+
+    root = comm.size - 1
+    received = bcast_arrays(comm, arrays if comm.rank == root else None, root)
+    for me, other in zip(arrays, received, strict=True):
+        assert me.dtype == other.dtype
+        assert np.array_equal(me, other)
@@ -0,0 +1,123 @@
+import pytest
+import numpy as np
+
+from astrodendro.dendrogram import Dendrogram
+
+from dendro.utils import compare_dendrograms
+
+
+@pytest.mark.parametrize("shape", [(50,), (20, 30), (8, 9, 10)])
+@pytest.mark.parametrize(
+    "params",
+    [
+        {},
+        dict(min_delta=0.3),
+        dict(min_npix=4),
+        dict(min_delta=0.2, min_npix=3, min_value=0.1),
+    ],
+)
+@pytest.mark.parametrize("variant", ["noise", "nan", "ties"])
+def test_compute_flat(shape, params, variant):
+    from dendro.local_dendrogram import compute_flat
+    from dendro.process_pool import flatten_dendrogram
+
+    data = np.random.default_rng(len(shape)).normal(size=shape)
+    if variant == "nan":
+        data[data > 1.5] = np.nan
+    elif variant == "ties":
+        data = np.round(data, 1)
+
+    reference = flatten_dendrogram(Dendrogram.compute(data, **params))
+    flat = compute_flat(data, **params)
+
+    # structures are numbered like in astrodendro, but pixels are in C order
+    assert np.array_equal(flat[0], reference[0])
+    assert np.array_equal(flat[1], reference[1])
+    for start, stop in zip(flat[1][:-1], flat[1][1:]):
+        order = np.lexsort(reference[2][start:stop].T[::-1])
+        assert np.array_equal(flat[2][start:stop], reference[2][start:stop][order])
+        assert np.array_equal(flat[3][start:stop], reference[3][start:stop][order])
+
+
+def test_local_dendrogram():
+    from dendro.local_dendrogram import compute_local_dendrogram
+
+    data = np.random.default_rng(0).random((8, 9, 10))
+    reference_dendrogram = Dendrogram.compute(data, min_delta=0.1)
+    dendrogram = compute_local_dendrogram(data, min_delta=0.1)
+
+    compare_dendrograms(reference_dendrogram, dendrogram)
+    assert np.array_equal(dendrogram.index_map, reference_dendrogram.index_map)
+
+
+@pytest.mark.parametrize("ntasks", [1, 3])
+@pytest.mark.parametrize("communication", ["all", "boundary", "tree"])
+@pytest.mark.parametrize("workers", [None, 2])
+def test_v3_local_engine_pseudo_parallel(ntasks, communication, workers):
+    from dendro.distributed_dendrogram_v3 import DistributedDendrogramV3
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 3)
+
+    dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(
+        data.numpy(),
+        ntasks,
+        communication=communication,
+        workers=workers,
+        local_engine="numba",
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.mpi(ranks=[1, 2])
+@pytest.mark.parametrize("communication", ["all", "tree"])
+def test_2D_v3_local_engine(mpi_ranks, communication):
+    from dendro.distributed_dendrogram_v3 import DistributedDendrogramV3
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 3)
+
+    dendrogram = DistributedDendrogramV3.compute(
+        data, communication=communication, local_engine="numba"
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.mpi(ranks=[1, 2, 3])
+@pytest.mark.parametrize("threads", [2, 3, 4])
+@pytest.mark.parametrize("engine", ["python", "numba"])
+@pytest.mark.parametrize("noise", [0, 0.05])
+def test_2D_v3_threaded_local_phase(mpi_ranks, threads, engine, noise):
+    import heat as ht
+    from dendro.distributed_dendrogram_v3 import DistributedDendrogramV3
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 3)
+    data = data.numpy() + noise * np.random.default_rng(0).random(data.shape)
+    data = ht.array(data, split=0)
+
+    # the local dendrograms from threads are the same as from a single thread
+    dendrogram = DistributedDendrogramV3.compute(
+        data, engine=engine, local_engine="numba", threads=threads
+    )
+    single_thread = DistributedDendrogramV3.compute(
+        data, engine=engine, local_engine="numba"
+    )
+    compare_dendrograms(single_thread, dendrogram)
+    if noise == 0 or data.comm.size == 1:
+        compare_dendrograms(Dendrogram.compute(data.numpy()), dendrogram)
+
+
+def test_v3_threaded_local_phase_options():
+    import heat as ht
+    from dendro.distributed_dendrogram_v3 import DistributedDendrogramV3
+
+    data = ht.zeros((4, 4), split=0)
+    with pytest.raises(NotImplementedError):
+        DistributedDendrogramV3.compute(data, threads=2)
+    with pytest.raises(NotImplementedError):
+        DistributedDendrogramV3.compute(
+            data, local_engine="numba", threads=2, min_npix=2
+        )
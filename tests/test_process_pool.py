@@ -0,0 +1,63 @@
+import pytest
+import numpy as np
+
+from astrodendro.dendrogram import Dendrogram
+
+from dendro.utils import compare_dendrograms
+
+
+def test_flatten_dendrogram():
+    from dendro.process_pool import flatten_dendrogram, unflatten_dendrogram
+
+    data = np.random.default_rng(0).random((8, 9, 10))
+    reference_dendrogram = Dendrogram.compute(data)
+
+    flat = flatten_dendrogram(reference_dendrogram)
+    dendrogram = unflatten_dendrogram(data.shape, *flat)
+
+    compare_dendrograms(reference_dendrogram, dendrogram)
+    assert np.array_equal(dendrogram.index_map, reference_dendrogram.index_map)
+    for me in reference_dendrogram.all_structures:
+        other = dendrogram._structures_dict[me.idx]
+        assert (other.parent is None) == (me.parent is None)
+        assert other.parent is None or other.parent.idx == me.parent.idx
+
+
+@pytest.mark.parametrize("version", ["v2", "v3", "v4"])
+def test_process_pool_pseudo_parallel(version):
+    from dendro.utils import get_2d_data
+
+    if version == "v2":
+        from dendro.distributed_dendrogram_v2 import (
+            DistributedDendrogramV2 as DistributedDendrogram,
+        )
+    elif version == "v3":
+        from dendro.distributed_dendrogram_v3 import (
+            DistributedDendrogramV3 as DistributedDendrogram,
+        )
+    else:
+        from dendro.distributed_dendrogram_v4 import (
+            DistributedDendrogramV4 as DistributedDendrogram,
+        )
+
+    _, _, data = get_2d_data(32, 3)
+
+    dendrogram = DistributedDendrogram.compute_pseudo_parallel(
+        data.numpy(), 4, workers=2
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
+
+
+@pytest.mark.parametrize("communication", ["boundary", "tree"])
+def test_process_pool_v3_communication(communication):
+    from dendro.distributed_dendrogram_v3 import DistributedDendrogramV3
+    from dendro.utils import get_2d_data
+
+    _, _, data = get_2d_data(32, 4)
+
+    dendrogram = DistributedDendrogramV3.compute_pseudo_parallel(
+        data.numpy(), 4, communication=communication, workers=2
+    )
+    reference_dendrogram = Dendrogram.compute(data.numpy())
+    compare_dendrograms(reference_dendrogram, dendrogram)
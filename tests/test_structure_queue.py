@@ -0,0 +1,45 @@
+import pytest
+import numpy as np
+
+
+class DummyStructure:
+    def __init__(self, vmax, idx):
+        self._vmax = vmax
+        self.idx = idx
+
+
+@pytest.mark.parametrize("n", [1, 10, 100])
+def test_structure_queue_order(n):
+    from dendro.structure_queue import StructureQueue
+
+    rng = np.random.default_rng(n)
+
+    # use few distinct values to make sure we get plenty of ties
+    structures = [DummyStructure(rng.integers(0, 5), i) for i in range(n)]
+    queue = StructureQueue(structures)
+    assert len(queue) == n
+
+    # reference: a list sorted by decreasing vmax with ties in insertion order
+    reference = sorted(structures, key=lambda me: -me._vmax)
+
+    # interleave popping and pushing like the merge loop does
+    popped = []
+    while len(queue) > 0:
+        assert queue.peek() is reference[0]
+        to_merge = queue.pop()
+        assert to_merge is reference.pop(0)
+        popped.append(to_merge)
+
+        if to_merge.idx >= 0 and to_merge._vmax > 0:
+            bottom_part = DummyStructure(to_merge._vmax - 1, -to_merge.idx - 1)
+            queue.push(bottom_part)
+            insert_at = len([me for me in reference if me._vmax >= bottom_part._vmax])
+            reference.insert(insert_at, bottom_part)
+
+    assert len(reference) == 0
+    vmax = [me._vmax for me in popped]
+    assert vmax == sorted(vmax, reverse=True)
+
+
+if __name__ == "__main__":
+    test_structure_queue_order(100)
@@ -0,0 +1,38 @@
+import numpy as np
+
+
+def test_disjoint_set():
+    from dendro.union_find import DisjointSet
+
+    ancestors = DisjointSet(capacity=2)
+    labels = [ancestors.add() for _ in range(5)]
+    assert labels == list(range(5))
+    assert np.allclose(ancestors.find(labels), labels)
+
+    # build a deep chain 0 -> 5 -> 6 -> 7 and a second tree 1, 2 -> 8
+    ancestors.add()
+    ancestors.union([0, 3], 5)
+    ancestors.add()
+    ancestors.union([5], 6)
+    ancestors.add()
+    ancestors.union([6, 4], 7)
+    ancestors.add()
+    ancestors.union([1, 2], 8)
+    assert len(ancestors) == 9
+
+    assert np.allclose(ancestors.find([0, 1, 2, 3, 4]), [7, 8, 8, 7, 7])
+    assert ancestors.find(0) == 7
+    assert np.allclose(ancestors.find([5, 6, 7, 8]), [7, 7, 7, 8])
+
+    # check that the path was compressed
+    assert ancestors._parent[0] == 7
+
+    # uniting non-root labels unites their roots
+    ancestors.add()
+    ancestors.union([0, 1], 9)
+    assert np.allclose(ancestors.find(np.arange(10)), 9)
+    assert ancestors.find(np.array([], dtype=int)).size == 0
+
+
+if __name__ == "__main__":
+    test_disjoint_set()
@@ -40,5 +40,56 @@ def test_vertical_distribution_serial(n, ndim, ntasks, halo_size):
         assert sum(nvals) >= data.size
 
 
+@pytest.mark.mpi(ranks=[1, 2, 3])
+@pytest.mark.parametrize("ndim", [1, 2, 3])
+@pytest.mark.parametrize("split", [None, 0])
+@pytest.mark.parametrize("halo_size", [0, 2])
+def test_vertical_distribution(mpi_ranks, ndim, split, halo_size):
+    from dendro.vertical_split import (
+        distribute_vertically,
+        distribute_vertically_serial,
+    )
+
+    comm = ht.MPI_WORLD
+    ht.random.seed(ndim)
+    data = ht.random.random((17,) * ndim, split=split)
+
+    indices, values = distribute_vertically(data, halo_size)
+
+    # same band as in the serial version, but without dense arrays
+    assert indices.shape == (len(values), ndim)
+    assert np.all(np.diff(values) >= 0)
+    expected = distribute_vertically_serial(data, comm.size, halo_size)[comm.rank]
+    assert np.array_equal(expected[tuple(indices.T)], values)
+    assert len(values) == np.isfinite(expected).sum()
+
+
+def test_sample_sort_ties():
+    from dendro.vertical_split import sample_sort
+
+    values = np.array([1.0, 0.0, 1.0, 0.0, 2.0])
+    linear = np.array([4, 3, 0, 1, 2])
+    values, linear = sample_sort(ht.MPI_WORLD, values, linear)
+    assert values.tolist() == [0.0, 0.0, 1.0, 1.0, 2.0]
+    assert linear.tolist() == [1, 3, 0, 4, 2]
+
+
+@pytest.mark.mpi(ranks=[1, 2, 3])
+@pytest.mark.parametrize("split", [None, 0])
+def test_vertical_distribution_empty(mpi_ranks, split):
+    from dendro.vertical_split import distribute_vertically, sample_sort
+
+    values, linear = sample_sort(
+        ht.MPI_WORLD, np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int64)
+    )
+    assert len(values) == len(linear) == 0
+
+    # no finite values means no rank has a band
+    data = ht.full((9, 5), ht.nan, split=split)
+    indices, values = distribute_vertically(data, 1)
+    assert indices.shape == (0, 2)
+    assert len(values) == 0
+
+
 if __name__ == "__main__":
     test_vertical_distribution_serial(16, 2, 4, 4)